@@ -0,0 +1,93 @@
+"""
+Benchmark of search history writes and reads with every SQLite profile of the engine.
+Run from the project root: python -m benchmarks.database_benchmark
+"""
+import asyncio
+import os
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from database.base import Base, SQLITE_PROFILES, make_engine
+from database.models import History
+
+USERS = 50
+SINGLE_INSERTS = 300
+BATCH_INSERTS = 5000
+BATCH_SIZE = 100
+READS = 1000
+CONCURRENCY = 10
+
+
+def make_row(num: int) -> dict:
+    """
+    Build history record
+    :param num: Number of the record
+    :return: History record
+    """
+    return {
+        'user_tg_id': num % USERS, 'date_search': datetime(2024, 1, 1) + timedelta(seconds=num),
+        'enter_date': date(2024, 2, 1), 'exit_date': date(2024, 2, 5), 'city': 'Paris', 'adults': 2,
+        'children': None, 'infants': None, 'pets': None, 'currency': 'USD', 'min_price': None, 'max_price': None,
+        'min_rating': None, 'min_beds': None, 'command': '/lowprice',
+    }
+
+
+async def run_profile(engine: AsyncEngine) -> tuple[float, float, float]:
+    """
+    Measure throughput of one engine
+    :param engine: Engine to measure
+    :return: Single inserts, batched inserts and reads per second
+    """
+    session_maker = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    started = time.perf_counter()
+    for num in range(SINGLE_INSERTS):
+        async with session_maker() as session:
+            await session.execute(insert(History), [make_row(num)])
+            await session.commit()
+    single = SINGLE_INSERTS / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for start in range(0, BATCH_INSERTS, BATCH_SIZE):
+        async with session_maker() as session:
+            await session.execute(insert(History), [make_row(num) for num in range(start, start + BATCH_SIZE)])
+            await session.commit()
+    batched = BATCH_INSERTS / (time.perf_counter() - started)
+
+    async def read(num: int) -> None:
+        async with session_maker() as session:
+            await session.execute(
+                select(History)
+                .filter(History.user_tg_id == num % USERS)
+                .order_by(History.date_search.desc(), History.id.desc())
+                .limit(10))
+
+    started = time.perf_counter()
+    for start in range(0, READS, CONCURRENCY):
+        await asyncio.gather(*(read(num) for num in range(start, start + CONCURRENCY)))
+    reads = READS / (time.perf_counter() - started)
+    return single, batched, reads
+
+
+async def main() -> None:
+    for profile in SQLITE_PROFILES:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'benchmark.db')
+            engine = make_engine(f'sqlite+aiosqlite:///{path}', profile=profile, echo=False)
+            try:
+                single, batched, reads = await run_profile(engine)
+            finally:
+                await engine.dispose()
+        print(f'{profile:>10}: single inserts {single:8.0f}/s, batched inserts {batched:8.0f}/s, '
+              f'reads {reads:8.0f}/s')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
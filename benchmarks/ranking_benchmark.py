@@ -0,0 +1,65 @@
+"""
+Micro-benchmark of the lazy ranking against a full sort of the search results.
+Run from the project root: python -m benchmarks.ranking_benchmark
+"""
+import random
+import timeit
+
+from handlers.utils.ranking import Ranking, RANKING_KEYS
+from site_api.models import Listing
+
+SIZES = (50, 200, 1000)
+PAGES = (1, 3)
+PAGE_SIZE = 3
+REPEAT = 200
+
+
+def make_listings(count: int) -> list[Listing]:
+    """
+    Build random listings
+    :param count: Number of listings
+    :return: List of listings
+    """
+    return [
+        Listing(id=str(i), name=f'Listing {i}', beds=random.randint(1, 5), address='', price=random.randint(20, 900),
+                currency='USD', rating=round(random.uniform(3, 5), 2), deeplink='', images=())
+        for i in range(count)
+    ]
+
+
+def full_sort(listings: list[Listing], count: int) -> list[Listing]:
+    """
+    Previous implementation, sort everything and take the first items
+    :param listings: Listings to rank
+    :param count: Number of items to take
+    :return: Ranked items
+    """
+    return sorted(listings, key=RANKING_KEYS['/lowprice'])[:count]
+
+
+def lazy_ranking(listings: list[Listing], count: int) -> list[Listing]:
+    """
+    Lazy ranking, select only the items shown to the user
+    :param listings: Listings to rank
+    :param count: Number of items to take
+    :return: Ranked items
+    """
+    ranking = Ranking(RANKING_KEYS['/lowprice'])
+    ranking.extend(listings)
+    return ranking.take(count)
+
+
+def main() -> None:
+    for size in SIZES:
+        listings = make_listings(size)
+        for pages in PAGES:
+            count = pages * PAGE_SIZE
+            assert full_sort(listings, count) == lazy_ranking(listings, count)
+            sort_time = timeit.timeit(lambda: full_sort(listings, count), number=REPEAT) / REPEAT
+            ranking_time = timeit.timeit(lambda: lazy_ranking(listings, count), number=REPEAT) / REPEAT
+            print(f'{size:>5} results, {pages} page(s): sort {sort_time * 1e6:8.1f} us, '
+                  f'ranking {ranking_time * 1e6:8.1f} us, x{sort_time / ranking_time:.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -18,3 +18,114 @@ DEFAULT_COMMANDS = (
     ("custom", "Свой фильтр"),
     ("cancel", "Отмена команды")
 )
+
+API_BASE_URL = os.getenv("API_BASE_URL", "https://airbnb13.p.rapidapi.com")
+API_CONNECTION_LIMIT = int(os.getenv("API_CONNECTION_LIMIT", 100))
+API_CONNECTION_LIMIT_PER_HOST = int(os.getenv("API_CONNECTION_LIMIT_PER_HOST", 20))
+API_DNS_CACHE_TTL = int(os.getenv("API_DNS_CACHE_TTL", 300))
+API_KEEPALIVE_TIMEOUT = float(os.getenv("API_KEEPALIVE_TIMEOUT", 30))
+API_TOTAL_TIMEOUT = float(os.getenv("API_TOTAL_TIMEOUT", 30))
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", 5))
+
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", 600))
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", 256))
+
+SEARCH_PAGES = int(os.getenv("SEARCH_PAGES", 8))
+
+API_RATE_LIMIT = float(os.getenv("API_RATE_LIMIT", 5))
+API_RATE_BURST = int(os.getenv("API_RATE_BURST", 5))
+API_QUEUE_SIZE = int(os.getenv("API_QUEUE_SIZE", 100))
+API_MONTHLY_QUOTA = int(os.getenv("API_MONTHLY_QUOTA", 0))
+
+API_ATTEMPT_TIMEOUT = float(os.getenv("API_ATTEMPT_TIMEOUT", 10))
+API_DEADLINE = float(os.getenv("API_DEADLINE", 25))
+API_RETRIES = int(os.getenv("API_RETRIES", 2))
+API_RETRY_BACKOFF = float(os.getenv("API_RETRY_BACKOFF", 0.5))
+API_BREAKER_THRESHOLD = int(os.getenv("API_BREAKER_THRESHOLD", 5))
+API_BREAKER_RESET = float(os.getenv("API_BREAKER_RESET", 30))
+
+CUSTOM_PRICE_WEIGHT = float(os.getenv("CUSTOM_PRICE_WEIGHT", 0.5))
+CUSTOM_RATING_WEIGHT = float(os.getenv("CUSTOM_RATING_WEIGHT", 0.5))
+
+RESULT_STORE_TTL = float(os.getenv("RESULT_STORE_TTL", 1800))
+RESULT_STORE_SIZE = int(os.getenv("RESULT_STORE_SIZE", 500))
+
+FSM_MAX_SESSIONS = int(os.getenv("FSM_MAX_SESSIONS", 10000))
+FSM_IDLE_TTL = float(os.getenv("FSM_IDLE_TTL", 900))
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", 5))
+FSM_FLUSH_BATCH = int(os.getenv("FSM_FLUSH_BATCH", 500))
+
+PHOTO_CACHE_SIZE = int(os.getenv("PHOTO_CACHE_SIZE", 20000))
+PHOTO_CACHE_FLUSH_INTERVAL = float(os.getenv("PHOTO_CACHE_FLUSH_INTERVAL", 10))
+
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", 30))
+SEND_CHAT_MEDIA_INTERVAL = float(os.getenv("SEND_CHAT_MEDIA_INTERVAL", 1))
+SEND_CHAT_MESSAGE_INTERVAL = float(os.getenv("SEND_CHAT_MESSAGE_INTERVAL", 0.1))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", 3))
+
+PREFETCH_MAX_CHATS = int(os.getenv("PREFETCH_MAX_CHATS", 1000))
+
+CARD_CACHE_SIZE = int(os.getenv("CARD_CACHE_SIZE", 5000))
+
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", 0.5))
+HISTORY_FLUSH_BATCH = int(os.getenv("HISTORY_FLUSH_BATCH", 100))
+HISTORY_QUEUE_SIZE = int(os.getenv("HISTORY_QUEUE_SIZE", 1000))
+HISTORY_QUEUE_TIMEOUT = float(os.getenv("HISTORY_QUEUE_TIMEOUT", 2))
+
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", 10))
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./search_history.db")
+DATABASE_PROFILE = os.getenv("DATABASE_PROFILE", "production")
+DATABASE_ECHO = os.getenv("DATABASE_ECHO", "false").lower() in ("1", "true", "yes")
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", 5))
+DATABASE_MAX_OVERFLOW = int(os.getenv("DATABASE_MAX_OVERFLOW", 10))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 0))
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000))
+
+SNAPSHOT_MAX_RESULTS = int(os.getenv("SNAPSHOT_MAX_RESULTS", 30))
+SNAPSHOT_MAX_BYTES = int(os.getenv("SNAPSHOT_MAX_BYTES", 16384))
+SNAPSHOT_TTL = float(os.getenv("SNAPSHOT_TTL", 900))
+SNAPSHOT_MAX_AGE = float(os.getenv("SNAPSHOT_MAX_AGE", 86400))
+
+ANALYTICS_WINDOW_DAYS = int(os.getenv("ANALYTICS_WINDOW_DAYS", 14))
+WARM_HOURS = os.getenv("WARM_HOURS", "2-6")
+WARM_INTERVAL = float(os.getenv("WARM_INTERVAL", 900))
+WARM_DAILY_BUDGET = int(os.getenv("WARM_DAILY_BUDGET", 100))
+WARM_TOP = int(os.getenv("WARM_TOP", 20))
+WARM_TTL = float(os.getenv("WARM_TTL", 86400))
+
+RETENTION_KEEP_LAST = int(os.getenv("RETENTION_KEEP_LAST", 50))
+RETENTION_KEEP_DAYS = int(os.getenv("RETENTION_KEEP_DAYS", 90))
+RETENTION_BATCH = int(os.getenv("RETENTION_BATCH", 500))
+RETENTION_BATCH_PAUSE = float(os.getenv("RETENTION_BATCH_PAUSE", 0.05))
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", 86400))
+RETENTION_VACUUM_INTERVAL = float(os.getenv("RETENTION_VACUUM_INTERVAL", 604800))
+RETENTION_ARCHIVE_PATH = os.getenv("RETENTION_ARCHIVE_PATH", "./history_archive.jsonl.gz")
+
+HISTORY_CACHE_USERS = int(os.getenv("HISTORY_CACHE_USERS", 5000))
+
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", 100))
+WEBHOOK_MAX_PENDING = int(os.getenv("WEBHOOK_MAX_PENDING", 1000))
+WEBHOOK_HEALTH_PATH = os.getenv("WEBHOOK_HEALTH_PATH", "/health")
+
+POOL_WORKERS = int(os.getenv("POOL_WORKERS", 0))
+POOL_QUEUE_SIZE = int(os.getenv("POOL_QUEUE_SIZE", 1000))
+POOL_START_TIMEOUT = float(os.getenv("POOL_START_TIMEOUT", 30))
+POOL_STOP_TIMEOUT = float(os.getenv("POOL_STOP_TIMEOUT", 30))
+POOL_FORWARD_TIMEOUT = float(os.getenv("POOL_FORWARD_TIMEOUT", 60))
+WORKER_SOCKET = os.getenv("WORKER_SOCKET", "")
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() in ("1", "true", "yes")
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9100))
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+METRICS_BUCKETS = os.getenv("METRICS_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30")
+
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", 25))
+WARM_STARTUP_TIMEOUT = float(os.getenv("WARM_STARTUP_TIMEOUT", 10))
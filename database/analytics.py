@@ -0,0 +1,72 @@
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, select
+
+from database.base import async_session
+from database.models import History
+from site_api.cache import make_search_key
+
+
+@dataclass
+class PopularQuery:
+    """
+    Search combination of city, dates and guests with the number of searches
+    """
+    params: dict
+    searches: int
+    last_search: datetime
+
+    @property
+    def lead_days(self) -> int:
+        """
+        Days between the last search and the enter date
+        :return: Number of days
+        """
+        return (date.fromisoformat(self.params['enter_date']) - self.last_search.date()).days
+
+    @property
+    def nights(self) -> int:
+        """
+        Number of nights of the search
+        :return: Number of nights
+        """
+        return (date.fromisoformat(self.params['exit_date']) - date.fromisoformat(self.params['enter_date'])).days
+
+
+async def popular_queries(days: int, limit: int) -> list[PopularQuery]:
+    """
+    Most frequent searches of the last days with enter date not in the past. Rows are grouped by the database,
+    groups differing only in city case or default values are merged by the search cache key
+    :param days: Number of days of history to aggregate
+    :param limit: Number of searches in the summary
+    :return: List of popular searches, most frequent first
+    """
+    columns = (History.city, History.enter_date, History.exit_date, History.adults, History.children,
+               History.infants, History.pets, History.currency)
+    query = (
+        select(*columns, func.count().label('searches'), func.max(History.date_search).label('last_search'))
+        .filter(History.date_search >= datetime.now() - timedelta(days=days), History.enter_date >= date.today())
+        .group_by(*columns)
+    )
+    async with async_session() as session:
+        rows = (await session.execute(query)).all()
+
+    summary: dict[tuple, PopularQuery] = {}
+    for row in rows:
+        params = {
+            'city': row.city.strip(),
+            'enter_date': row.enter_date.strftime('%Y-%m-%d'),
+            'exit_date': row.exit_date.strftime('%Y-%m-%d'),
+            'adults': row.adults,
+        }
+        if row.children is not None:
+            params.update(children=row.children, infants=row.infants, pets=row.pets, currency=row.currency)
+        key = make_search_key(params)
+        popular = summary.get(key)
+        if popular is None:
+            summary[key] = PopularQuery(params=params, searches=row.searches, last_search=row.last_search)
+        else:
+            popular.searches += row.searches
+            popular.last_search = max(popular.last_search, row.last_search)
+    return sorted(summary.values(), key=lambda item: (-item.searches, -item.last_search.timestamp()))[:limit]
@@ -1,21 +1,116 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from functools import partial
+
+from sqlalchemy import event, inspect, make_url, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from config_data.config import (DATABASE_URL, DATABASE_PROFILE, DATABASE_ECHO, DATABASE_POOL_SIZE,
+                                DATABASE_MAX_OVERFLOW, SQLITE_MMAP_SIZE, SQLITE_BUSY_TIMEOUT)
+
+SQLITE_PROFILES = {
+    'default': {},
+    'production': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': SQLITE_MMAP_SIZE,
+        'busy_timeout': SQLITE_BUSY_TIMEOUT,
+        'temp_store': 'MEMORY',
+    },
+}
+
+
+def set_sqlite_pragmas(pragmas: dict, dbapi_connection, connection_record) -> None:
+    """
+    Set pragmas of the profile on a new SQLite connection
+    :param pragmas: Pragma values by name
+    :param dbapi_connection: DBAPI connection
+    :param connection_record: Pool connection record
+    :return: None
+    """
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+
+def make_engine(url: str = DATABASE_URL, profile: str = DATABASE_PROFILE, echo: bool = DATABASE_ECHO,
+                pool_size: int = DATABASE_POOL_SIZE, max_overflow: int = DATABASE_MAX_OVERFLOW) -> AsyncEngine:
+    """
+    Create database engine, SQLite connections are tuned with pragmas of the profile
+    :param url: SQLAlchemy async database url
+    :param profile: Name of the SQLite profile
+    :param echo: Whether to log every statement
+    :param pool_size: Number of connections kept open
+    :param max_overflow: Number of extra connections opened under load
+    :return: Engine
+    """
+    database_url = make_url(url)
+    options = {'echo': echo}
+    if database_url.get_backend_name() != 'sqlite':
+        return create_async_engine(database_url, pool_size=pool_size, max_overflow=max_overflow,
+                                   pool_pre_ping=True, **options)
+
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f'Unknown database profile {profile}, expected one of {", ".join(SQLITE_PROFILES)}')
+    if database_url.database not in (None, '', ':memory:'):
+        options.update(poolclass=AsyncAdaptedQueuePool, pool_size=pool_size, max_overflow=max_overflow)
+    sqlite_engine = create_async_engine(database_url, **options)
+    if SQLITE_PROFILES[profile]:
+        event.listen(sqlite_engine.sync_engine, 'connect', partial(set_sqlite_pragmas, SQLITE_PROFILES[profile]))
+    return sqlite_engine
 
-DATABASE_URL = "sqlite+aiosqlite:///./search_history.db"
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+engine = make_engine()
 
 async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
 Base = declarative_base()
 
 
+HISTORY_FILTER_COLUMNS = {
+    'min_price': 'INTEGER',
+    'min_rating': 'FLOAT',
+    'min_beds': 'INTEGER',
+}
+
+
+def migrate_history_filters(conn: Connection) -> None:
+    """
+    Add the nullable /custom filter columns to the history table of a database created before them
+    :param conn: Database connection
+    :return: None
+    """
+    existing = {column['name'] for column in inspect(conn).get_columns('history')}
+    for name, column_type in HISTORY_FILTER_COLUMNS.items():
+        if name not in existing:
+            conn.execute(text(f'ALTER TABLE history ADD COLUMN {name} {column_type}'))
+
+
+def add_missing_indexes(conn: Connection) -> None:
+    """
+    Create indexes declared in models but missing in tables of an existing database
+    :param conn: Database connection
+    :return: None
+    """
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(conn)
+
+
 async def init_db() -> None:
     """
-    Initialize and create the database
+    Initialize and create the database, run once by the process starting the bot before pool workers
+    are started
     :return: None
 
     """
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(migrate_history_filters)
+        await conn.run_sync(add_missing_indexes)
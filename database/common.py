@@ -1,44 +1,83 @@
-from sqlalchemy import select
+from datetime import datetime
+from typing import Optional
 
+from sqlalchemy import select, and_, or_
+
+from config_data.config import HISTORY_PAGE_SIZE
 from database.base import async_session
+from database.history_cache import get_history_version, history_cache
+from database.history_writer import history_writer
 from database.models import History
+from server.metrics import metrics
+
+HistoryKey = tuple[datetime, int]
 
 
+@metrics.timed('db')
 async def add_new_history(user_params: dict) -> None:
     """
-    Adds the user's request to the database
+    Adds the user's request to the write-behind queue, the record is written to the database in background
     :param user_params: User's request dict '
     :return: None
     """
-    async with async_session() as session:
-        new_history = History(**user_params)
-        session.add(new_history)
-        await session.commit()
+    await history_writer.add(user_params)
 
 
-async def get_history(user_tg_id: int) -> list[History]:
+@metrics.timed('db')
+async def get_history(user_tg_id: int, before: Optional[HistoryKey] = None, after: Optional[HistoryKey] = None,
+                      limit: int = HISTORY_PAGE_SIZE) -> tuple[list[History], bool]:
     """
-    Get user history
+    Get page of user history, newest first. Pages are selected by the (date_search, id) key
+    of the last or the first shown search, so every page is read from the index.
+    Pages are cached until the version stamp of the user's history changes
     :param user_tg_id: User's telegram id '
-    :return: List of history objects in database
+    :param before: Key of the last shown search to get older searches
+    :param after: Key of the first shown search to get newer searches
+    :param limit: Number of searches on the page
+    :return: List of history objects in database and whether there are more searches in the same direction
     """
+    if history_writer.has_pending(user_tg_id):
+        await history_writer.flush()
+    query = select(History).filter(History.user_tg_id == user_tg_id)
+    if after is not None:
+        query = query.filter(or_(History.date_search > after[0],
+                                 and_(History.date_search == after[0], History.id > after[1])))
+        query = query.order_by(History.date_search, History.id)
+    else:
+        if before is not None:
+            query = query.filter(or_(History.date_search < before[0],
+                                     and_(History.date_search == before[0], History.id < before[1])))
+        query = query.order_by(History.date_search.desc(), History.id.desc())
+
+    page_key = (before, after, limit)
     async with async_session() as session:
-        history = await session.execute(
-            select(History)
-            .filter(History.user_tg_id == user_tg_id)
-            .order_by(History.date_search)
-            .limit(10))
-        result = history.scalars().all()
-        return result
+        version = await get_history_version(session, user_tg_id)
+        cached = history_cache.get(user_tg_id, version, page_key)
+        if cached is not None:
+            return cached
+        history = await session.execute(query.limit(limit + 1))
+        result = list(history.scalars().all())
+    has_more = len(result) > limit
+    result = result[:limit]
+    if after is not None:
+        result.reverse()
+    history_cache.put(user_tg_id, version, page_key, (result, has_more))
+    return result, has_more
 
 
-async def get_history_by_id(history_id: int) -> History:
+@metrics.timed('db')
+async def get_history_by_id(history_id: int, user_tg_id: int) -> Optional[History]:
     """
     Get history by id
     :param history_id: History id
-    :return: History object
+    :param user_tg_id: Telegram id of the user requesting the search
+    :return: History object or None if the user has no such search
     """
     async with async_session() as session:
-        history = await session.execute(select(History).filter(History.id == history_id))
-        result = history.scalars().all()
-        return result[0]
+        version = await get_history_version(session, user_tg_id)
+        cached = history_cache.find(user_tg_id, version, history_id)
+        if cached is not None:
+            return cached
+        history = await session.execute(
+            select(History).filter(History.id == history_id, History.user_tg_id == user_tg_id))
+        return history.scalar_one_or_none()
@@ -0,0 +1,160 @@
+from collections import OrderedDict
+from typing import Hashable, Iterable, Optional
+
+from sqlalchemy import select, update, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config_data.config import HISTORY_CACHE_USERS
+from database.base import engine
+from database.models import History, HistoryVersion
+
+
+async def get_history_version(session: AsyncSession, user_tg_id: int) -> int:
+    """
+    Get version stamp of the user's history
+    :param session: Database session
+    :param user_tg_id: User's telegram id
+    :return: Version, 0 if the user's history was never written
+    """
+    version = await session.scalar(select(HistoryVersion.version).filter(HistoryVersion.user_tg_id == user_tg_id))
+    return version or 0
+
+
+async def bump_history_versions(session: AsyncSession, user_ids: Iterable[int]) -> None:
+    """
+    Change version stamps of the users in the transaction writing their history,
+    so every process sharing the database sees that cached history is outdated
+    :param session: Database session
+    :param user_ids: Telegram ids of the users
+    :return: None
+    """
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return
+    dialects = {'sqlite': sqlite, 'postgresql': postgresql}
+    if engine.dialect.name in dialects:
+        statement = dialects[engine.dialect.name].insert(HistoryVersion).values(
+            [{'user_tg_id': user_tg_id, 'version': 1} for user_tg_id in user_ids])
+        await session.execute(statement.on_conflict_do_update(
+            index_elements=[HistoryVersion.user_tg_id], set_={'version': HistoryVersion.version + 1}))
+        return
+    existing = set(await session.scalars(
+        select(HistoryVersion.user_tg_id).filter(HistoryVersion.user_tg_id.in_(user_ids))))
+    if existing:
+        await session.execute(update(HistoryVersion).where(HistoryVersion.user_tg_id.in_(existing))
+                              .values(version=HistoryVersion.version + 1))
+    missing = [{'user_tg_id': user_tg_id, 'version': 1} for user_tg_id in user_ids if user_tg_id not in existing]
+    if missing:
+        await session.execute(insert(HistoryVersion), missing)
+
+
+class HistoryCache:
+    """
+    Cache of history pages of recently active users with LRU eviction.
+    Every entry keeps the version stamp it was read with and is used only while the stamp is current
+    """
+
+    def __init__(self, max_users: int) -> None:
+        self.max_users = max_users
+        self._data: OrderedDict[int, tuple[int, dict[Hashable, tuple[list[History], bool]]]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.outdated = 0
+        self.invalidations = 0
+
+    def _pages(self, user_tg_id: int, version: int) -> Optional[dict]:
+        """
+        Get cached pages of the user read with the version
+        :param user_tg_id: User's telegram id
+        :param version: Current version of the user's history
+        :return: Pages by page key or None
+        """
+        item = self._data.get(user_tg_id)
+        if item is None:
+            return None
+        if item[0] != version:
+            self.outdated += 1
+            del self._data[user_tg_id]
+            return None
+        self._data.move_to_end(user_tg_id)
+        return item[1]
+
+    def get(self, user_tg_id: int, version: int, page_key: Hashable) -> Optional[tuple[list[History], bool]]:
+        """
+        Get cached page of the user's history
+        :param user_tg_id: User's telegram id
+        :param version: Current version of the user's history
+        :param page_key: Key of the page
+        :return: Page and whether there are more searches or None
+        """
+        pages = self._pages(user_tg_id, version)
+        page = pages.get(page_key) if pages is not None else None
+        if page is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return page
+
+    def find(self, user_tg_id: int, version: int, history_id: int) -> Optional[History]:
+        """
+        Find search in cached pages of the user's history
+        :param user_tg_id: User's telegram id
+        :param version: Current version of the user's history
+        :param history_id: History id
+        :return: History object or None
+        """
+        for page, _ in (self._pages(user_tg_id, version) or {}).values():
+            for history in page:
+                if history.id == history_id:
+                    self.hits += 1
+                    return history
+        self.misses += 1
+        return None
+
+    def put(self, user_tg_id: int, version: int, page_key: Hashable, page: tuple[list[History], bool]) -> None:
+        """
+        Put page of the user's history into the cache, evicting least recently active users
+        :param user_tg_id: User's telegram id
+        :param version: Version the page was read with
+        :param page_key: Key of the page
+        :param page: Page and whether there are more searches
+        :return: None
+        """
+        item = self._data.get(user_tg_id)
+        if item is None or item[0] != version:
+            item = (version, {})
+            self._data[user_tg_id] = item
+        item[1][page_key] = page
+        self._data.move_to_end(user_tg_id)
+        while len(self._data) > self.max_users:
+            self._data.popitem(last=False)
+
+    def invalidate(self, user_tg_id: int) -> None:
+        """
+        Forget cached history of the user
+        :param user_tg_id: User's telegram id
+        :return: None
+        """
+        if self._data.pop(user_tg_id, None) is not None:
+            self.invalidations += 1
+
+    @property
+    def stats(self) -> dict:
+        """
+        History cache statistics
+        :return: Dictionary with counters
+        """
+        requests = self.hits + self.misses
+        return {
+            'users': len(self._data),
+            'max_users': self.max_users,
+            'hits': self.hits,
+            'misses': self.misses,
+            'outdated': self.outdated,
+            'invalidations': self.invalidations,
+            'hit_rate': self.hits / requests if requests else 0.0,
+        }
+
+
+history_cache = HistoryCache(max_users=HISTORY_CACHE_USERS)
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+from typing import Optional
+
+from sqlalchemy import insert
+
+from config_data.config import HISTORY_FLUSH_INTERVAL, HISTORY_FLUSH_BATCH, HISTORY_QUEUE_SIZE, HISTORY_QUEUE_TIMEOUT
+from database.base import async_session
+from database.history_cache import bump_history_versions, history_cache
+from database.models import History
+from server.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryWriter:
+    """
+    Write-behind queue of search history records, records are written in one transaction per batch
+    when the batch is full or the flush interval has passed. When the queue stays full, e.g. while
+    the database is down, new records are dropped so searches are not held up
+    """
+
+    def __init__(self, flush_interval: float, batch_size: int, max_queue: int, queue_timeout: float) -> None:
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._columns = [column.name for column in History.__table__.columns if not column.primary_key]
+        self._rows: list[dict] = []
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.queued = 0
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        self.blocked = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    async def start(self) -> None:
+        """
+        Start background writes, called on dispatcher startup
+        :return: None
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._maintain())
+
+    async def _maintain(self) -> None:
+        """
+        Write queued records when a batch is full or the flush interval has passed
+        :return: None
+        """
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                self.failed += 1
+                logger.exception('History flush failed')
+
+    async def add(self, user_params: dict) -> None:
+        """
+        Queue the user's request, waits only while the queue is full and drops the request
+        if the queue is still full after the queue timeout
+        :param user_params: User's request dict
+        :return: None
+        """
+        if len(self._rows) >= self.max_queue:
+            self.blocked += 1
+            try:
+                await asyncio.wait_for(self._wait_for_space(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.dropped += 1
+                logger.warning('History queue is full, search of user %s is not saved', user_params.get('user_tg_id'))
+                return
+        self._rows.append({column: user_params.get(column) for column in self._columns})
+        history_cache.invalidate(user_params.get('user_tg_id'))
+        self.queued += 1
+        self.max_depth = max(self.max_depth, len(self._rows))
+        if self._task is None:
+            await self.flush()
+        elif len(self._rows) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _wait_for_space(self) -> None:
+        """
+        Wait until the queue has room for a record
+        :return: None
+        """
+        while len(self._rows) >= self.max_queue:
+            self._space.clear()
+            self._wakeup.set()
+            await self._space.wait()
+
+    def has_pending(self, user_tg_id: int) -> bool:
+        """
+        Whether records of the user are waiting to be written
+        :param user_tg_id: User's telegram id
+        :return: boolean value
+        """
+        return any(row['user_tg_id'] == user_tg_id for row in self._rows)
+
+    @metrics.timed('db', 'history_flush')
+    async def flush(self) -> None:
+        """
+        Write queued records to the database, records stay queued if the write fails
+        :return: None
+        """
+        async with self._lock:
+            while self._rows:
+                batch = self._rows[:self.batch_size]
+                async with async_session() as session:
+                    await session.execute(insert(History), batch)
+                    await bump_history_versions(session, (row['user_tg_id'] for row in batch))
+                    await session.commit()
+                del self._rows[:len(batch)]
+                self.written += len(batch)
+                self.batches += 1
+                self._space.set()
+
+    async def close(self) -> None:
+        """
+        Stop background writes and write every queued record, called on dispatcher shutdown
+        :return: None
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    @property
+    def stats(self) -> dict:
+        """
+        History writer statistics
+        :return: Dictionary with counters
+        """
+        return {
+            'queue_depth': len(self._rows),
+            'max_depth': self.max_depth,
+            'max_queue': self.max_queue,
+            'queued': self.queued,
+            'written': self.written,
+            'batches': self.batches,
+            'failed': self.failed,
+            'blocked': self.blocked,
+            'dropped': self.dropped,
+        }
+
+
+history_writer = HistoryWriter(flush_interval=HISTORY_FLUSH_INTERVAL, batch_size=HISTORY_FLUSH_BATCH,
+                               max_queue=HISTORY_QUEUE_SIZE, queue_timeout=HISTORY_QUEUE_TIMEOUT)
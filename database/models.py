@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Date, DateTime
+from sqlalchemy import Column, Integer, String, Date, DateTime, Float, Text, Index, LargeBinary
 
 from .base import Base
 
@@ -20,5 +20,56 @@ class History(Base):
     infants = Column(Integer, nullable=True, default=None)
     pets = Column(Integer, nullable=True, default=None)
     currency = Column(String, nullable=True, default=None)
+    min_price = Column(Integer, nullable=True, default=None)
     max_price = Column(Integer, nullable=True, default=None)
+    min_rating = Column(Float, nullable=True, default=None)
+    min_beds = Column(Integer, nullable=True, default=None)
     command = Column(String)
+
+    __table_args__ = (
+        Index('ix_history_user_date', user_tg_id, date_search.desc(), id.desc()),
+    )
+
+
+class FsmSession(Base):
+    """
+    Table for FSM sessions evicted from memory
+    """
+    __tablename__ = 'fsm_sessions'
+
+    key = Column(String, primary_key=True)
+    state = Column(String, nullable=True, default=None)
+    data = Column(Text, nullable=False, default='{}')
+    updated_at = Column(DateTime)
+
+
+class PhotoFileId(Base):
+    """
+    Table mapping listing photo urls to telegram file ids
+    """
+    __tablename__ = 'photo_file_ids'
+
+    url = Column(String, primary_key=True)
+    file_id = Column(String, nullable=False)
+    last_used = Column(DateTime, index=True)
+
+
+class ResultSnapshot(Base):
+    """
+    Table for compressed ranked results of searches, replayed from the history
+    """
+    __tablename__ = 'result_snapshots'
+
+    key = Column(String, primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, index=True)
+
+
+class HistoryVersion(Base):
+    """
+    Table for version stamps of user search history, changed with every write of the user's history
+    """
+    __tablename__ = 'history_versions'
+
+    user_tg_id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
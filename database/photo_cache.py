@@ -0,0 +1,153 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import delete, insert, select
+
+from config_data.config import PHOTO_CACHE_SIZE, PHOTO_CACHE_FLUSH_INTERVAL
+from database.base import async_session
+from database.models import PhotoFileId
+
+logger = logging.getLogger(__name__)
+
+
+class PhotoCache:
+    """
+    Cache of telegram file ids for listing photo urls, kept in memory with LRU eviction
+    and written to the database in batches
+    """
+
+    def __init__(self, max_size: int, flush_interval: float) -> None:
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self._memory: OrderedDict[str, str] = OrderedDict()
+        self._pending: dict[str, tuple[str, datetime]] = {}
+        self._deleted: set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+
+    async def start(self) -> None:
+        """
+        Load the most recently used file ids and start background writes, called on dispatcher startup
+        :return: None
+        """
+        async with async_session() as session:
+            rows = await session.execute(
+                select(PhotoFileId.url, PhotoFileId.file_id)
+                .order_by(PhotoFileId.last_used.desc())
+                .limit(self.max_size))
+        for url, file_id in reversed(rows.all()):
+            self._memory[url] = file_id
+        if self._task is None:
+            self._task = asyncio.create_task(self._maintain())
+
+    async def _maintain(self) -> None:
+        """
+        Periodically write new file ids to the database
+        :return: None
+        """
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception('Photo cache flush failed')
+
+    def get(self, url: str) -> Optional[str]:
+        """
+        Get file id for the photo url, the use time is written to the database with the next flush
+        :param url: Photo url
+        :return: File id or None
+        """
+        file_id = self._memory.get(url)
+        if file_id is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._memory.move_to_end(url)
+        self._pending[url] = (file_id, datetime.now())
+        return file_id
+
+    def remember(self, url: str, file_id: str) -> None:
+        """
+        Save file id of the uploaded photo
+        :param url: Photo url
+        :param file_id: Telegram file id
+        :return: None
+        """
+        self._memory[url] = file_id
+        self._memory.move_to_end(url)
+        self._pending[url] = (file_id, datetime.now())
+        self._deleted.discard(url)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def invalidate(self, url: str) -> None:
+        """
+        Forget file id rejected by telegram
+        :param url: Photo url
+        :return: None
+        """
+        if self._memory.pop(url, None) is not None:
+            self.invalidated += 1
+        self._pending.pop(url, None)
+        self._deleted.add(url)
+
+    async def flush(self) -> None:
+        """
+        Write new file ids to the database and remove least recently used rows above the size limit
+        :return: None
+        """
+        if not self._pending and not self._deleted:
+            return
+        pending, self._pending = self._pending, {}
+        deleted, self._deleted = self._deleted, set()
+        rows = [{'url': url, 'file_id': file_id, 'last_used': last_used}
+                for url, (file_id, last_used) in pending.items()]
+        try:
+            async with async_session() as session:
+                await session.execute(delete(PhotoFileId).where(PhotoFileId.url.in_(pending.keys() | deleted)))
+                if rows:
+                    await session.execute(insert(PhotoFileId), rows)
+                    keep = select(PhotoFileId.url).order_by(PhotoFileId.last_used.desc()).limit(self.max_size)
+                    await session.execute(delete(PhotoFileId).where(PhotoFileId.url.not_in(keep.scalar_subquery())))
+                await session.commit()
+        except Exception:
+            self._pending = {**pending, **self._pending}
+            self._deleted |= deleted - self._pending.keys()
+            raise
+
+    async def close(self) -> None:
+        """
+        Stop background writes and flush pending file ids, called on dispatcher shutdown
+        :return: None
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    @property
+    def stats(self) -> dict:
+        """
+        Photo cache statistics
+        :return: Dictionary with counters
+        """
+        requests = self.hits + self.misses
+        return {
+            'size': len(self._memory),
+            'max_size': self.max_size,
+            'pending_writes': len(self._pending),
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidated': self.invalidated,
+            'hit_rate': self.hits / requests if requests else 0.0,
+        }
+
+
+photo_cache = PhotoCache(max_size=PHOTO_CACHE_SIZE, flush_interval=PHOTO_CACHE_FLUSH_INTERVAL)
@@ -0,0 +1,223 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, func, select, text
+
+from config_data.config import (RETENTION_KEEP_LAST, RETENTION_KEEP_DAYS, RETENTION_BATCH, RETENTION_BATCH_PAUSE,
+                                RETENTION_INTERVAL, RETENTION_VACUUM_INTERVAL, RETENTION_ARCHIVE_PATH)
+from database.base import async_session, engine
+from database.history_cache import bump_history_versions
+from database.models import History
+
+logger = logging.getLogger(__name__)
+
+
+def append_archive(path: str, rows: list[dict]) -> None:
+    """
+    Append rows to the compressed archive, every batch is a separate gzip member of the file
+    :param path: Path of the archive
+    :param rows: History rows
+    :return: None
+    """
+    with gzip.open(path, 'at', encoding='utf-8') as archive:
+        for row in rows:
+            archive.write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
+
+
+def read_archive(path: str) -> list[dict]:
+    """
+    Read rows of the archive. A row is archived again when its delete failed, one row is returned per id
+    :param path: Path of the archive
+    :return: History rows
+    """
+    rows: dict[int, dict] = {}
+    with gzip.open(path, 'rt', encoding='utf-8') as archive:
+        for line in archive:
+            row = json.loads(line)
+            rows[row['id']] = row
+    return list(rows.values())
+
+
+class RetentionJob:
+    """
+    Job keeping the last searches of every user and the searches of the last days,
+    older searches are moved to a compressed archive file in small batches. Every batch is written
+    to the archive before it is deleted, so no search is lost when the job stops between the two
+    """
+
+    def __init__(self, keep_last: int, keep_days: int, batch_size: int, batch_pause: float, interval: float,
+                 vacuum_interval: float, archive_path: str) -> None:
+        self.keep_last = keep_last
+        self.keep_days = keep_days
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.interval = interval
+        self.vacuum_interval = vacuum_interval
+        self.archive_path = archive_path
+        self._task: Optional[asyncio.Task] = None
+        self._last_vacuum = time.monotonic()
+        self._pruned_since_vacuum = 0
+        self._archived_ids: set[int] = set()
+        self.runs = 0
+        self.pruned = 0
+        self.bytes_reclaimed = 0
+        self.last_report: Optional[dict] = None
+
+    async def start(self) -> None:
+        """
+        Start periodic runs, called on dispatcher startup
+        :return: None
+        """
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._maintain())
+
+    async def _maintain(self) -> None:
+        """
+        Periodically prune the history
+        :return: None
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run()
+            except Exception:
+                logger.exception('History retention failed')
+
+    async def _expired_ids(self) -> list[int]:
+        """
+        Select ids of the searches to prune: older than the kept days and not among the last searches
+        of the user. The window is computed once per run, searches added later only make old ones older
+        :return: History ids in ascending order
+        """
+        position = func.row_number().over(
+            partition_by=History.user_tg_id,
+            order_by=(History.date_search.desc(), History.id.desc()),
+        ).label('position')
+        ranked = select(History.id, History.date_search, position).subquery()
+        expired = (
+            select(ranked.c.id)
+            .filter(ranked.c.position > self.keep_last,
+                    ranked.c.date_search < datetime.now() - timedelta(days=self.keep_days))
+            .order_by(ranked.c.id)
+        )
+        async with async_session() as session:
+            return list((await session.execute(expired)).scalars())
+
+    async def _prune_batch(self, ids: list[int]) -> list[dict]:
+        """
+        Archive one batch of searches, then delete it in a short transaction. Rows archived
+        by an earlier batch whose delete failed are not written again
+        :param ids: History ids
+        :return: Deleted rows
+        """
+        async with async_session() as session:
+            rows = await session.execute(select(History.__table__).filter(History.id.in_(ids)))
+            rows = [dict(row._mapping) for row in rows]
+        new_rows = [row for row in rows if row['id'] not in self._archived_ids]
+        if new_rows:
+            await asyncio.to_thread(append_archive, self.archive_path, new_rows)
+            self._archived_ids.update(row['id'] for row in new_rows)
+        async with async_session() as session:
+            await session.execute(delete(History).where(History.id.in_(ids)))
+            await bump_history_versions(session, (row['user_tg_id'] for row in rows))
+            await session.commit()
+        self._archived_ids.difference_update(ids)
+        return rows
+
+    async def _database_size(self) -> Optional[int]:
+        """
+        Size of the SQLite database in bytes
+        :return: Size or None for other databases
+        """
+        if engine.dialect.name != 'sqlite':
+            return None
+        async with engine.connect() as conn:
+            page_count = (await conn.execute(text('PRAGMA page_count'))).scalar()
+            page_size = (await conn.execute(text('PRAGMA page_size'))).scalar()
+        return page_count * page_size
+
+    async def optimize(self, vacuum: bool) -> None:
+        """
+        Update planner statistics and rebuild the SQLite file to return free pages to the file system
+        :param vacuum: Whether to run VACUUM
+        :return: None
+        """
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level='AUTOCOMMIT')
+            if vacuum and engine.dialect.name == 'sqlite':
+                await conn.execute(text('VACUUM'))
+            await conn.execute(text(f'ANALYZE {History.__tablename__}'))
+
+    async def run(self) -> dict:
+        """
+        Move expired searches to the archive in batches, every batch is deleted in its own short transaction
+        :return: Report with the number of pruned rows and reclaimed bytes
+        """
+        self.runs += 1
+        started = time.monotonic()
+        size_before = await self._database_size()
+        expired = await self._expired_ids()
+        pruned = 0
+        for start in range(0, len(expired), self.batch_size):
+            rows = await self._prune_batch(expired[start:start + self.batch_size])
+            pruned += len(rows)
+            await asyncio.sleep(self.batch_pause)
+
+        self._pruned_since_vacuum += pruned
+        vacuum = (self._pruned_since_vacuum > 0
+                  and time.monotonic() - self._last_vacuum >= self.vacuum_interval)
+        if pruned or vacuum:
+            await self.optimize(vacuum)
+        if vacuum:
+            self._last_vacuum = time.monotonic()
+            self._pruned_since_vacuum = 0
+        size_after = await self._database_size()
+
+        reclaimed = size_before - size_after if size_before is not None and size_after is not None else 0
+        self.pruned += pruned
+        self.bytes_reclaimed += max(reclaimed, 0)
+        self.last_report = {
+            'rows_pruned': pruned,
+            'bytes_reclaimed': reclaimed,
+            'vacuum': vacuum,
+            'archive_bytes': os.path.getsize(self.archive_path) if os.path.exists(self.archive_path) else 0,
+            'duration': time.monotonic() - started,
+        }
+        logger.info('History retention: pruned %s rows, reclaimed %s bytes', pruned, reclaimed)
+        return self.last_report
+
+    async def close(self) -> None:
+        """
+        Stop periodic runs and wait for the run in progress to stop, called on dispatcher shutdown.
+        A batch stopped between its archive and its delete is archived again by the next run
+        :return: None
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    @property
+    def stats(self) -> dict:
+        """
+        Retention statistics
+        :return: Dictionary with counters
+        """
+        return {
+            'runs': self.runs,
+            'rows_pruned': self.pruned,
+            'bytes_reclaimed': self.bytes_reclaimed,
+            'last_report': self.last_report,
+        }
+
+
+retention_job = RetentionJob(keep_last=RETENTION_KEEP_LAST, keep_days=RETENTION_KEEP_DAYS,
+                             batch_size=RETENTION_BATCH, batch_pause=RETENTION_BATCH_PAUSE,
+                             interval=RETENTION_INTERVAL, vacuum_interval=RETENTION_VACUUM_INTERVAL,
+                             archive_path=RETENTION_ARCHIVE_PATH)
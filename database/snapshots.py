@@ -0,0 +1,188 @@
+import asyncio
+import json
+import logging
+import time
+import zlib
+from dataclasses import astuple, dataclass
+from datetime import datetime, timedelta
+from typing import Optional, Sequence
+
+from sqlalchemy import delete, insert
+
+from config_data.config import SNAPSHOT_MAX_RESULTS, SNAPSHOT_MAX_BYTES, SNAPSHOT_TTL, SNAPSHOT_MAX_AGE
+from database.base import async_session
+from database.models import ResultSnapshot
+from site_api.models import Listing
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Snapshot:
+    """
+    Ranked results of a search saved for replay from the history
+    """
+    listings: list[Listing]
+    created_at: datetime
+    stale: bool
+
+
+def encode_listings(listings: Sequence[Listing]) -> bytes:
+    """
+    Compress listings, every listing is stored as a list of its fields
+    :param listings: Listings in the ranked order
+    :return: Compressed snapshot
+    """
+    rows = [astuple(listing) for listing in listings]
+    return zlib.compress(json.dumps(rows, ensure_ascii=False, separators=(',', ':')).encode())
+
+
+def decode_listings(data: bytes) -> list[Listing]:
+    """
+    Restore listings from the compressed snapshot
+    :param data: Compressed snapshot
+    :return: Listings in the ranked order
+    """
+    rows = json.loads(zlib.decompress(data))
+    return [Listing(*row[:-1], images=tuple(row[-1])) for row in rows]
+
+
+class SnapshotStore:
+    """
+    Compressed snapshots of ranked search results kept in the database.
+    Snapshots are stale after the TTL and deleted after the maximum age
+    """
+
+    def __init__(self, max_results: int, max_bytes: int, ttl: float, max_age: float) -> None:
+        self.max_results = max_results
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_age = max_age
+        self._tasks: set[asyncio.Task] = set()
+        self._last_prune = 0.0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.saved = 0
+        self.truncated = 0
+        self.bytes_saved = 0
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Whether snapshots are kept
+        :return: boolean value
+        """
+        return self.max_results > 0
+
+    def encode(self, listings: Sequence[Listing]) -> bytes:
+        """
+        Compress at most max_results listings, the last listings are dropped until the snapshot fits max_bytes
+        :param listings: Listings in the ranked order
+        :return: Compressed snapshot
+        """
+        count = min(len(listings), self.max_results)
+        data = encode_listings(listings[:count])
+        while len(data) > self.max_bytes and count > 1:
+            count = count * self.max_bytes // len(data) or 1
+            data = encode_listings(listings[:count])
+        if count < len(listings):
+            self.truncated += 1
+        return data
+
+    async def get(self, key: str) -> Optional[Snapshot]:
+        """
+        Get snapshot of the search
+        :param key: Result set key of the search
+        :return: Snapshot or None if there is no snapshot younger than the maximum age
+        """
+        if not self.enabled:
+            return None
+        async with async_session() as session:
+            row = await session.get(ResultSnapshot, key)
+        if row is None or row.created_at < datetime.now() - timedelta(seconds=self.max_age):
+            self.misses += 1
+            return None
+        stale = row.created_at < datetime.now() - timedelta(seconds=self.ttl)
+        if stale:
+            self.stale_hits += 1
+        else:
+            self.hits += 1
+        return Snapshot(listings=decode_listings(row.data), created_at=row.created_at, stale=stale)
+
+    async def save(self, key: str, listings: Sequence[Listing]) -> None:
+        """
+        Save snapshot of the search, replacing the previous one, snapshots older than the maximum age
+        are deleted at most once per TTL
+        :param key: Result set key of the search
+        :param listings: Listings in the ranked order
+        :return: None
+        """
+        if not self.enabled or not listings:
+            return
+        data = self.encode(listings)
+        async with async_session() as session:
+            await session.execute(delete(ResultSnapshot).where(ResultSnapshot.key == key))
+            await session.execute(insert(ResultSnapshot), [{'key': key, 'data': data, 'created_at': datetime.now()}])
+            if time.monotonic() - self._last_prune > self.ttl:
+                self._last_prune = time.monotonic()
+                expires = datetime.now() - timedelta(seconds=self.max_age)
+                await session.execute(delete(ResultSnapshot).where(ResultSnapshot.created_at < expires))
+            await session.commit()
+        self.saved += 1
+        self.bytes_saved += len(data)
+
+    def schedule_save(self, key: str, listings: Sequence[Listing]) -> None:
+        """
+        Save snapshot in background
+        :param key: Result set key of the search
+        :param listings: Listings in the ranked order
+        :return: None
+        """
+        if self.enabled:
+            self.schedule(self.save(key, list(listings)))
+
+    def schedule(self, coro) -> None:
+        """
+        Run snapshot work in background, errors are logged
+        :param coro: Coroutine to run
+        :return: None
+        """
+        async def run() -> None:
+            try:
+                await coro
+            except Exception:
+                logger.exception('Snapshot task failed')
+
+        task = asyncio.create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def close(self) -> None:
+        """
+        Wait for snapshot work started before the shutdown, called on dispatcher shutdown
+        :return: None
+        """
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    @property
+    def stats(self) -> dict:
+        """
+        Snapshot statistics
+        :return: Dictionary with counters
+        """
+        requests = self.hits + self.stale_hits + self.misses
+        return {
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'saved': self.saved,
+            'truncated': self.truncated,
+            'avg_bytes': self.bytes_saved / self.saved if self.saved else 0.0,
+            'hit_rate': (self.hits + self.stale_hits) / requests if requests else 0.0,
+        }
+
+
+snapshot_store = SnapshotStore(max_results=SNAPSHOT_MAX_RESULTS, max_bytes=SNAPSHOT_MAX_BYTES, ttl=SNAPSHOT_TTL,
+                               max_age=SNAPSHOT_MAX_AGE)
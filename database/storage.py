@@ -0,0 +1,217 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from sqlalchemy import delete, insert
+
+from database.base import async_session
+from database.models import FsmSession
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SessionRecord:
+    """
+    FSM session kept in memory
+    """
+    state: Optional[str] = None
+    data: dict = field(default_factory=dict)
+    last_access: float = field(default_factory=time.monotonic)
+    persisted: bool = False
+
+    @property
+    def empty(self) -> bool:
+        """
+        Whether the session has neither state nor data
+        :return: boolean value
+        """
+        return self.state is None and not self.data
+
+
+def storage_key_to_str(key: StorageKey) -> str:
+    """
+    Convert storage key to the database key
+    :param key: Storage key
+    :return: String key
+    """
+    return f'{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ""}:{key.destiny}'
+
+
+class SpillStorage(BaseStorage):
+    """
+    FSM storage keeping active sessions in memory, idle sessions are evicted and written to the database
+    in batches, and loaded back on the next update of the user
+    """
+
+    def __init__(self, max_sessions: int, idle_ttl: float, flush_interval: float, flush_batch: int) -> None:
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self._hot: OrderedDict[StorageKey, SessionRecord] = OrderedDict()
+        self._pending: dict[str, Optional[SessionRecord]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.loaded = 0
+        self.evicted = 0
+        self.written = 0
+
+    async def start(self) -> None:
+        """
+        Start background eviction, called on dispatcher startup
+        :return: None
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._maintain())
+
+    async def _maintain(self) -> None:
+        """
+        Periodically evict idle sessions and write evicted sessions to the database
+        :return: None
+        """
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self._evict_idle()
+                await self.flush()
+            except Exception:
+                logger.exception('FSM storage maintenance failed')
+
+    def _evict(self, key: StorageKey) -> None:
+        """
+        Move session from memory to the write queue
+        :param key: Storage key
+        :return: None
+        """
+        record = self._hot.pop(key)
+        self.evicted += 1
+        if not record.empty:
+            self._pending[storage_key_to_str(key)] = record
+        elif record.persisted:
+            self._pending[storage_key_to_str(key)] = None
+
+    def _evict_idle(self) -> None:
+        """
+        Evict sessions idle longer than the TTL, records are ordered by last access
+        :return: None
+        """
+        expires = time.monotonic() - self.idle_ttl
+        while self._hot:
+            key, record = next(iter(self._hot.items()))
+            if record.last_access > expires:
+                break
+            self._evict(key)
+
+    async def flush(self) -> None:
+        """
+        Write evicted sessions to the database, one transaction per batch
+        :return: None
+        """
+        while self._pending:
+            batch = dict(list(self._pending.items())[:self.flush_batch])
+            rows = [
+                {'key': key, 'state': record.state, 'data': json.dumps(record.data), 'updated_at': datetime.now()}
+                for key, record in batch.items() if record is not None
+            ]
+            async with async_session() as session:
+                await session.execute(delete(FsmSession).where(FsmSession.key.in_(batch)))
+                if rows:
+                    await session.execute(insert(FsmSession), rows)
+                await session.commit()
+            self.written += len(batch)
+            for key, record in batch.items():
+                if self._pending.get(key) is record:
+                    del self._pending[key]
+
+    async def _record(self, key: StorageKey) -> SessionRecord:
+        """
+        Get session from memory, the write queue or the database
+        :param key: Storage key
+        :return: Session record
+        """
+        record = self._hot.get(key)
+        if record is not None:
+            self.hits += 1
+            self._hot.move_to_end(key)
+            record.last_access = time.monotonic()
+            return record
+
+        self.misses += 1
+        str_key = storage_key_to_str(key)
+        if str_key in self._pending:
+            pending = self._pending.pop(str_key)
+            record = SessionRecord(state=pending.state, data=pending.data, persisted=True) \
+                if pending is not None else SessionRecord(persisted=True)
+        else:
+            async with async_session() as session:
+                row = await session.get(FsmSession, str_key)
+            if row is not None:
+                self.loaded += 1
+                record = SessionRecord(state=row.state, data=json.loads(row.data), persisted=True)
+            else:
+                record = SessionRecord()
+
+        record = self._hot.setdefault(key, record)
+        self._hot.move_to_end(key)
+        record.last_access = time.monotonic()
+        while len(self._hot) > self.max_sessions:
+            self._evict(next(iter(self._hot)))
+        return record
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._record(key)
+        record.state = state.state if isinstance(state, State) else state
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = await self._record(key)
+        return record.state
+
+    async def set_data(self, key: StorageKey, data: dict[str, Any]) -> None:
+        record = await self._record(key)
+        record.data = data.copy()
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        record = await self._record(key)
+        return record.data.copy()
+
+    async def close(self) -> None:
+        """
+        Stop background eviction and write every session to the database, called on dispatcher shutdown
+        :return: None
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        while self._hot:
+            self._evict(next(iter(self._hot)))
+        await self.flush()
+
+    @property
+    def stats(self) -> dict:
+        """
+        Storage statistics
+        :return: Dictionary with counters
+        """
+        requests = self.hits + self.misses
+        return {
+            'sessions': len(self._hot),
+            'max_sessions': self.max_sessions,
+            'pending_writes': len(self._pending),
+            'memory_bytes': sum(len(json.dumps(record.data)) for record in self._hot.values()),
+            'hits': self.hits,
+            'misses': self.misses,
+            'loaded': self.loaded,
+            'evicted': self.evicted,
+            'written': self.written,
+            'hit_rate': self.hits / requests if requests else 0.0,
+        }
@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import Optional
 
 from aiogram import Router, F
 from aiogram.filters import Command
@@ -9,9 +10,11 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from config_data.config import DEFAULT_COMMANDS
 from database.common import get_history, get_history_by_id
-from site_api.site_api_handler import user_request
+from site_api.stream import SearchStream
 from states.user_states import UserStates
-from .utils.utils import build_history_text, AsyncResults, send_messages
+from .utils.scoring import CustomCriteria
+from .utils.results import result_store
+from .utils.utils import build_history_text, send_messages, queue_notifier
 
 router = Router()
 
@@ -33,6 +36,43 @@ async def cancel(message: Message, state: FSMContext) -> None:
     await message.answer("\n".join(text))
 
 
+async def show_history_page(message: Message, state: FSMContext, user_tg_id: int, before: Optional[tuple] = None,
+                            after: Optional[tuple] = None) -> None:
+    """
+    Send page of user search history with buttons to repeat a search and to show older or newer searches
+    :param message: Message object
+    :param state: User state
+    :param user_tg_id: User's telegram id
+    :param before: Key of the last shown search to show older searches
+    :param after: Key of the first shown search to show newer searches
+    :return: None
+    """
+    user_history, has_more = await get_history(user_tg_id, before=before, after=after)
+    if len(user_history) == 0:
+        await message.answer('Вы еще не делали запросы')
+        return
+    has_older = has_more if after is None else True
+    has_newer = has_more if after is not None else before is not None
+
+    text, _history = await build_history_text(user_history)
+    keyboard = InlineKeyboardBuilder()
+    for i in _history:
+        keyboard.add(InlineKeyboardButton(text=i, callback_data=str(_history[i].id)))
+    navigation = []
+    if has_newer:
+        navigation.append(InlineKeyboardButton(text='Новее', callback_data='history_newer'))
+    if has_older:
+        navigation.append(InlineKeyboardButton(text='Старее', callback_data='history_older'))
+    if navigation:
+        keyboard.row(*navigation)
+    await message.answer(text)
+    await message.answer('Выберите номер запроса чтобы повторить', reply_markup=keyboard.as_markup())
+    await state.set_state(UserStates.history)
+    first, last = user_history[0], user_history[-1]
+    await state.update_data(history_first=[first.date_search.isoformat(), first.id],
+                            history_last=[last.date_search.isoformat(), last.id])
+
+
 @router.message(Command(commands=["history"]))
 async def history(message: Message, state: FSMContext) -> None:
     """
@@ -41,17 +81,25 @@ async def history(message: Message, state: FSMContext) -> None:
     :param state: User state
     :return: None
     """
-    user_history = await get_history(message.from_user.id)
-    if len(user_history) == 0:
-        await message.answer('Вы еще не делали запросы')
+    await show_history_page(message, state, message.from_user.id)
+
+
+@router.callback_query(UserStates.history, F.data.in_({'history_older', 'history_newer'}))
+async def history_page(callback: CallbackQuery, state: FSMContext) -> None:
+    """
+    Handler for showing older or newer searches of the user
+    :param callback: User callback query
+    :param state: User's state
+    :return: None
+    """
+    data = await state.get_data()
+    if callback.data == 'history_older':
+        date_search, history_id = data['history_last']
+        before, after = (datetime.fromisoformat(date_search), history_id), None
     else:
-        text, _history = await build_history_text(user_history)
-        keyboard = InlineKeyboardBuilder()
-        for i in _history:
-            keyboard.add(InlineKeyboardButton(text=i, callback_data=str(_history[i].id)))
-        await message.answer(text)
-        await message.answer('Выберите номер запроса чтобы повторить', reply_markup=keyboard.as_markup())
-        await state.set_state(UserStates.history)
+        date_search, history_id = data['history_first']
+        before, after = None, (datetime.fromisoformat(date_search), history_id)
+    await show_history_page(callback.message, state, callback.from_user.id, before=before, after=after)
 
 
 @router.callback_query(UserStates.history, F.data)
@@ -63,7 +111,10 @@ async def history_results(callback: CallbackQuery, state: FSMContext) -> None:
     :return: None
     """
     history_id = callback.data
-    request = await get_history_by_id(int(history_id))
+    request = await get_history_by_id(int(history_id), callback.from_user.id)
+    if request is None:
+        await callback.message.answer('Запрос не найден, выберите другой или введите "/cancel"')
+        return
     params = {
         'city': request.city,
         'enter_date': datetime.strftime(request.enter_date, '%Y-%m-%d'),
@@ -76,7 +127,18 @@ async def history_results(callback: CallbackQuery, state: FSMContext) -> None:
         params['pets'] = request.pets
         params['currency'] = request.currency
 
-    response = await user_request(params)
+    criteria = None
+    if request.command == '/custom':
+        criteria = CustomCriteria.from_values(request.max_price, request.min_price, request.min_rating,
+                                              request.min_beds)
+    cursor = await result_store.replay(params, request.command, criteria)
+    if cursor is not None:
+        await send_messages(cursor, callback.message, state)
+        return
+
+    stream = SearchStream(params)
+    notifier = queue_notifier(callback.message)
+    response = await stream.start(notifier)
 
     if response['error'] is True:
         text = response['message']
@@ -84,11 +146,8 @@ async def history_results(callback: CallbackQuery, state: FSMContext) -> None:
         await state.clear()
 
     else:
-        if request.command != '/custom':
-            results = AsyncResults(response['results'], request.command)
-        else:
-            results = AsyncResults(response['results'], request.command, request.max_price)
-        await send_messages(results, callback.message, response, state)
+        cursor = result_store.open(stream, request.command, criteria)
+        await send_messages(cursor, callback.message, state, notifier)
 
 
 @router.message(UserStates.history)
@@ -7,8 +7,10 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from database.common import add_new_history
 from handlers.filters import RequestFilter
-from handlers.utils.utils import AsyncResults, send_messages
-from site_api.site_api_handler import user_request
+from handlers.utils.scoring import CustomCriteria
+from handlers.utils.results import result_store
+from handlers.utils.utils import send_messages, queue_notifier
+from site_api.stream import SearchStream
 from states.user_states import UserStates
 
 CURRENCY = ['USD', 'EUR', 'RUB', ]
@@ -96,7 +98,7 @@ async def pets_err(message: Message) -> None:
 
 
 @router.callback_query(UserStates.currency, F.data.in_(CURRENCY))
-async def min_price(callback: CallbackQuery, state: FSMContext) -> None:
+async def currency(callback: CallbackQuery, state: FSMContext) -> None:
     """
     Handler for getting the user's currency
     :param callback: User's callback
@@ -104,8 +106,8 @@ async def min_price(callback: CallbackQuery, state: FSMContext) -> None:
     :return: None
     """
     await state.update_data(currency=callback.data)
-    await callback.message.answer('Введите максимальную цену')
-    await state.set_state(UserStates.max_price)
+    await callback.message.answer('Введите минимальную цену')
+    await state.set_state(UserStates.min_price)
 
 
 @router.message(UserStates.currency, F.text)
@@ -118,7 +120,30 @@ async def currency_err(message: Message) -> None:
     await message.answer('Выберите валюту')
 
 
-@router.message(UserStates.max_price, F.text.regexp(r'(?<![-.])\b[0-9]+'))
+@router.message(UserStates.min_price, F.text.regexp(r'^[0-9]+$'))
+async def min_price(message: Message, state: FSMContext) -> None:
+    """
+    Handler for getting the user's min price value
+    :param message: User's message
+    :param state: User's state
+    :return: None
+    """
+    await state.update_data(min_price=message.text)
+    await message.answer('Введите максимальную цену')
+    await state.set_state(UserStates.max_price)
+
+
+@router.message(UserStates.min_price)
+async def min_price_err(message: Message) -> None:
+    """
+    Handler for handling incorrect values of the min price
+    :param message: User's message
+    :return: None
+    """
+    await message.answer('Минимальная цена должна быть целым, неотрицательным числом')
+
+
+@router.message(UserStates.max_price, F.text.regexp(r'^[0-9]+$'))
 async def max_price(message: Message, state: FSMContext) -> None:
     """
     Handler for getting the user's max price value
@@ -126,15 +151,17 @@ async def max_price(message: Message, state: FSMContext) -> None:
     :param state: User's state
     :return: None
     """
-    kb = [KeyboardButton(text="Начать поиск")]
-    keyboard = ReplyKeyboardMarkup(keyboard=[kb], resize_keyboard=True, one_time_keyboard=True)
+    data = await state.get_data()
+    if int(message.text) < int(data['min_price']):
+        await message.answer('Максимальная цена не может быть меньше минимальной')
+        return
     await state.update_data(max_price=message.text)
-    await message.answer("Для начала поиска нажмите:\nНачать поиск", reply_markup=keyboard)
-    await state.set_state(UserStates.custom_request)
+    await message.answer('Введите минимальный рейтинг (от 0 до 5)')
+    await state.set_state(UserStates.min_rating)
 
 
 @router.message(UserStates.max_price)
-async def max_price(message: Message) -> None:
+async def max_price_err(message: Message) -> None:
     """
     Handler for handling incorrect values of the max price
     :param message: User's message
@@ -143,6 +170,54 @@ async def max_price(message: Message) -> None:
     await message.answer('Максимальная цена должна быть целым, положительным числом')
 
 
+@router.message(UserStates.min_rating, F.text.regexp(r'^([0-4]([.,][0-9]+)?|5([.,]0+)?)$'))
+async def min_rating(message: Message, state: FSMContext) -> None:
+    """
+    Handler for getting the user's min rating value
+    :param message: User's message
+    :param state: User's state
+    :return: None
+    """
+    await state.update_data(min_rating=message.text.replace(',', '.'))
+    await message.answer('Введите минимальное количество кроватей')
+    await state.set_state(UserStates.min_beds)
+
+
+@router.message(UserStates.min_rating)
+async def min_rating_err(message: Message) -> None:
+    """
+    Handler for handling incorrect values of the min rating
+    :param message: User's message
+    :return: None
+    """
+    await message.answer('Рейтинг должен быть числом от 0 до 5')
+
+
+@router.message(UserStates.min_beds, F.text.regexp(r'^[0-9]+$'))
+async def min_beds(message: Message, state: FSMContext) -> None:
+    """
+    Handler for getting the user's min number of beds
+    :param message: User's message
+    :param state: User's state
+    :return: None
+    """
+    kb = [KeyboardButton(text="Начать поиск")]
+    keyboard = ReplyKeyboardMarkup(keyboard=[kb], resize_keyboard=True, one_time_keyboard=True)
+    await state.update_data(min_beds=message.text)
+    await message.answer("Для начала поиска нажмите:\nНачать поиск", reply_markup=keyboard)
+    await state.set_state(UserStates.custom_request)
+
+
+@router.message(UserStates.min_beds)
+async def min_beds_err(message: Message) -> None:
+    """
+    Handler for handling incorrect values of the min number of beds
+    :param message: User's message
+    :return: None
+    """
+    await message.answer('Количество кроватей может быть только целым, неотрицательным числом')
+
+
 @router.message(UserStates.custom_request, RequestFilter('Начать поиск'))
 async def request(message: Message, state: FSMContext) -> None:
     """
@@ -161,7 +236,10 @@ async def request(message: Message, state: FSMContext) -> None:
         'date_search': datetime.now(),
         'children': data['children'],
         'infants': data['infants'],
+        'min_price': data['min_price'],
         'max_price': data['max_price'],
+        'min_rating': data['min_rating'],
+        'min_beds': data['min_beds'],
         'pets': data['pets'],
         'currency': data['currency'],
         'command': data['command'],
@@ -169,7 +247,7 @@ async def request(message: Message, state: FSMContext) -> None:
 
     await add_new_history(params)
 
-    response = await user_request(
+    stream = SearchStream(
         {
             'city': data['city'],
             'enter_date': data['enter_date'],
@@ -181,6 +259,8 @@ async def request(message: Message, state: FSMContext) -> None:
             'currency': data['currency'],
         }
     )
+    notifier = queue_notifier(message)
+    response = await stream.start(notifier)
 
     if response['error'] is True:
         text = response['message']
@@ -188,8 +268,10 @@ async def request(message: Message, state: FSMContext) -> None:
         await state.clear()
 
     else:
-        results = AsyncResults(response['results'], data['command'], data['max_price'])
-        await send_messages(results, message, response, state)
+        criteria = CustomCriteria.from_values(data['max_price'], data['min_price'], data['min_rating'],
+                                              data['min_beds'])
+        cursor = result_store.open(stream, data['command'], criteria)
+        await send_messages(cursor, message, state, notifier)
 
 
 @router.message(UserStates.custom_request)
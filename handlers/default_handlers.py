@@ -9,10 +9,11 @@ from aiogram_calendar import SimpleCalendar, SimpleCalendarCallback, get_user_lo
 
 from config_data.config import DEFAULT_COMMANDS
 from database.common import add_new_history
-from site_api.site_api_handler import user_request
+from site_api.stream import SearchStream
 from states.user_states import UserStates
 from .filters import RequestFilter
-from .utils.utils import AsyncResults, send_messages
+from .utils.results import ResultCursor, result_store
+from .utils.utils import send_messages, queue_notifier
 
 router = Router()
 
@@ -165,7 +166,7 @@ async def get_request(message: Message, state: FSMContext) -> None:
         'command': user_params['command']
     }
     await add_new_history(params)
-    response = await user_request(
+    stream = SearchStream(
         {
             'city': user_params['city'],
             'enter_date': user_params['enter_date'],
@@ -173,6 +174,8 @@ async def get_request(message: Message, state: FSMContext) -> None:
             'adults': user_params['adults']
         }
     )
+    notifier = queue_notifier(message)
+    response = await stream.start(notifier)
     commands = [f"/{command} - {desc}" for command, desc in DEFAULT_COMMANDS]
     if response['error'] is True:
         text = response['message']
@@ -185,8 +188,8 @@ async def get_request(message: Message, state: FSMContext) -> None:
             await message.answer('\n'.join(commands))
             await state.clear()
         else:
-            results = AsyncResults(response['results'], user_params['command'])
-            await send_messages(results, message, response, state)
+            cursor = result_store.open(stream, user_params['command'])
+            await send_messages(cursor, message, state, notifier)
 
 
 @router.message(UserStates.request)
@@ -208,7 +211,5 @@ async def more_results(callback: CallbackQuery, state: FSMContext) -> None:
     :return: None
     """
     data = await state.get_data()
-    results = data['results']
-    response = data['response']
-    message = data['message']
-    await send_messages(results, message, response, state)
+    cursor = ResultCursor.from_dict(data['cursor'])
+    await send_messages(cursor, callback.message, state)
@@ -0,0 +1,116 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from aiogram.utils.media_group import MediaGroupBuilder
+
+from config_data.config import CARD_CACHE_SIZE
+from site_api.models import Listing
+
+DEFAULT_LOCALE = 'ru'
+
+CARD_TEMPLATES = {
+    'ru': ('Название: {listing.name}\n'
+           'Кровати: {listing.beds}\n'
+           'Адрес: {listing.address}\n'
+           'Цена: {listing.price} '
+           '{listing.currency}\n'
+           'Рейтинг: {listing.rating}\n'
+           'Ссылка на сайт: {listing.deeplink}'),
+}
+
+
+@dataclass
+class Card:
+    """
+    Rendered caption of a listing and the media group built from it
+    """
+    text: str
+    sources: tuple[str, ...] = ()
+    media: Optional[list] = None
+
+
+class CardRenderer:
+    """
+    Renderer of listing cards with a cache shared by all users.
+    Cards are keyed on listing id, a hash of the listing fields and locale, so the same listing
+    with the price of other dates gets its own card. The built media group is cached with the
+    caption and is reused while its photos are sent from the same urls or file ids
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._data: OrderedDict[tuple[str, int, str], Card] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.media_builds = 0
+        self.evictions = 0
+
+    def _card(self, listing: Listing, locale: str) -> Card:
+        """
+        Get the cached card of the listing or render a new one
+        :param listing: Listing to describe
+        :param locale: Language of the caption
+        :return: Card
+        """
+        key = (listing.id, hash(listing), locale)
+        card = self._data.get(key)
+        if card is not None:
+            self.hits += 1
+            self._data.move_to_end(key)
+            return card
+
+        self.misses += 1
+        card = Card(CARD_TEMPLATES.get(locale, CARD_TEMPLATES[DEFAULT_LOCALE]).format(listing=listing))
+        self._data[key] = card
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+        return card
+
+    def render(self, listing: Listing, locale: str = DEFAULT_LOCALE) -> str:
+        """
+        Get caption of the listing
+        :param listing: Listing to describe
+        :param locale: Language of the caption
+        :return: Caption text
+        """
+        return self._card(listing, locale).text
+
+    def media_group(self, listing: Listing, sources: tuple[str, ...], locale: str = DEFAULT_LOCALE) -> list:
+        """
+        Get media group of the listing, the group is built again only when its photo sources changed
+        :param listing: Listing to show
+        :param sources: File id or url of every photo of the listing
+        :param locale: Language of the caption
+        :return: List of media to send
+        """
+        card = self._card(listing, locale)
+        if card.media is None or card.sources != sources:
+            builder = MediaGroupBuilder(caption=card.text)
+            for source in sources:
+                builder.add_photo(source)
+            card.sources = sources
+            card.media = builder.build()
+            self.media_builds += 1
+        return list(card.media)
+
+    @property
+    def stats(self) -> dict:
+        """
+        Card cache statistics
+        :return: Dictionary with counters
+        """
+        requests = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'media_builds': self.media_builds,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / requests if requests else 0.0,
+        }
+
+
+card_renderer = CardRenderer(max_size=CARD_CACHE_SIZE)
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Coroutine, Hashable, Optional
+
+from config_data.config import PREFETCH_MAX_CHATS
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    """
+    Background preparation of the next result page of each chat.
+    One prefetch per chat is kept, a new prefetch or a new command of the user cancels the previous one
+    """
+
+    def __init__(self, max_chats: int) -> None:
+        self.max_chats = max_chats
+        self._tasks: OrderedDict[int, tuple[Hashable, asyncio.Task]] = OrderedDict()
+        self.scheduled = 0
+        self.hits = 0
+        self.misses = 0
+        self.cancelled = 0
+        self.failed = 0
+
+    def schedule(self, chat_id: int, token: Hashable, factory: Callable[[], Coroutine[Any, Any, Any]]) -> None:
+        """
+        Start preparing the next page of the chat
+        :param chat_id: Chat id
+        :param token: Identifier of the prepared page
+        :param factory: Coroutine function preparing the page
+        :return: None
+        """
+        self.cancel(chat_id)
+        self._tasks[chat_id] = (token, asyncio.create_task(factory()))
+        self.scheduled += 1
+        while len(self._tasks) > self.max_chats:
+            self.cancel(next(iter(self._tasks)))
+
+    async def take(self, chat_id: int, token: Hashable) -> Optional[Any]:
+        """
+        Get the prepared page of the chat, waits for the prefetch if it is still running
+        :param chat_id: Chat id
+        :param token: Identifier of the requested page
+        :return: Prepared page or None if there is no prefetch for the page
+        """
+        item = self._tasks.pop(chat_id, None)
+        if item is None or item[0] != token:
+            if item is not None:
+                item[1].cancel()
+                self.cancelled += 1
+            self.misses += 1
+            return None
+        try:
+            result = await item[1]
+        except asyncio.CancelledError:
+            if item[1].cancelled():
+                self.misses += 1
+                return None
+            raise
+        except Exception:
+            logger.exception('Prefetch failed')
+            self.failed += 1
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def cancel(self, chat_id: int) -> None:
+        """
+        Cancel prefetch of the chat
+        :param chat_id: Chat id
+        :return: None
+        """
+        item = self._tasks.pop(chat_id, None)
+        if item is not None and not item[1].done():
+            item[1].cancel()
+            self.cancelled += 1
+
+    async def close(self) -> None:
+        """
+        Cancel every prefetch and wait for it to stop, called on dispatcher shutdown before the search client
+        is closed
+        :return: None
+        """
+        tasks = [task for _, task in self._tasks.values()]
+        for chat_id in list(self._tasks):
+            self.cancel(chat_id)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    @property
+    def stats(self) -> dict:
+        """
+        Prefetch statistics
+        :return: Dictionary with counters
+        """
+        requests = self.hits + self.misses
+        return {
+            'running': sum(not task.done() for _, task in self._tasks.values()),
+            'scheduled': self.scheduled,
+            'hits': self.hits,
+            'misses': self.misses,
+            'cancelled': self.cancelled,
+            'failed': self.failed,
+            'hit_rate': self.hits / requests if requests else 0.0,
+        }
+
+
+prefetcher = Prefetcher(max_chats=PREFETCH_MAX_CHATS)
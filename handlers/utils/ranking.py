@@ -0,0 +1,115 @@
+import heapq
+from operator import itemgetter
+from typing import Any, Callable, Iterable, Optional
+
+RANKING_KEYS = {
+    '/lowprice': lambda x: (x.price, -x.rating),
+    '/highprice': lambda x: (-x.price, -x.rating),
+    '/bestdeals': lambda x: (-x.rating, x.price),
+}
+
+
+class Ranking:
+    """
+    Lazy ranking of results, items are selected from a heap one by one instead of sorting the whole list.
+    A heap only pays off on large result sets, so below sort_below items the ranking is a plain sorted list
+    and it switches to a heap once it grows past that size.
+    The key returns a tuple for multi-key orders, ties keep the order in which items were added
+    """
+
+    sort_below = 500
+
+    def __init__(self, key: Optional[Callable[[Any], tuple]] = None) -> None:
+        self.key = key
+        self._entries: list = []
+        self._start = 0
+        self._sorted = True
+        self._decorated = False
+        self._seq = 0
+
+    def extend(self, items: Iterable[Any], keys: Optional[Iterable[tuple]] = None) -> None:
+        """
+        Add items to the ranking
+        :param items: Items to add
+        :param keys: Keys of the items computed in advance, e.g. scores computed over columns, used instead
+                     of the key function. A ranking takes either keys or no keys on every call
+        :return: None
+        """
+        items = list(items)
+        if self._sorted and len(self) + len(items) < self.sort_below:
+            self._extend_sorted(items, keys)
+            return
+        if self._sorted:
+            self._make_heap()
+        sequence = range(self._seq, self._seq + len(items))
+        self._seq += len(items)
+        if keys is None and self.key is not None:
+            keys = map(self.key, items)
+        if keys is None:
+            entries = list(zip(sequence, items))
+        else:
+            entries = list(zip(keys, sequence, items))
+        if len(entries) > len(self._entries):
+            self._entries.extend(entries)
+            heapq.heapify(self._entries)
+        else:
+            for entry in entries:
+                heapq.heappush(self._entries, entry)
+
+    def _extend_sorted(self, items: list, keys: Optional[Iterable[tuple]]) -> None:
+        """
+        Add items to the sorted list, the sort is stable so items with equal keys stay in the order they were added
+        :param items: Items to add
+        :param keys: Keys of the items computed in advance
+        :return: None
+        """
+        sort_key = self.key
+        if keys is not None:
+            self._decorated = True
+            items = list(zip(keys, items))
+            sort_key = itemgetter(0)
+        self._entries = self._entries[self._start:] + items
+        self._start = 0
+        if sort_key is not None:
+            self._entries.sort(key=sort_key)
+
+    def _make_heap(self) -> None:
+        """
+        Turn the remaining sorted items into heap entries, numbered in ranking order to keep the ties in place
+        :return: None
+        """
+        remaining = self._entries[self._start:]
+        sequence = range(self._seq, self._seq + len(remaining))
+        self._seq += len(remaining)
+        if self._decorated:
+            self._entries = [(key, seq, item) for seq, (key, item) in zip(sequence, remaining)]
+        elif self.key is not None:
+            self._entries = list(zip(map(self.key, remaining), sequence, remaining))
+        else:
+            self._entries = list(zip(sequence, remaining))
+        self._start = 0
+        self._sorted = False
+
+    def pop(self) -> Any:
+        """
+        Take the best remaining item
+        :return: Item
+        """
+        if not self._sorted:
+            return heapq.heappop(self._entries)[-1]
+        if not len(self):
+            raise IndexError('pop from an empty ranking')
+        entry = self._entries[self._start]
+        self._start += 1
+        return entry[-1] if self._decorated else entry
+
+    def take(self, count: int) -> list:
+        """
+        Take up to count best remaining items
+        :param count: Number of items
+        :return: List of items in ranking order
+        """
+        return [self.pop() for _ in range(min(count, len(self)))]
+
+    def __len__(self) -> int:
+        return len(self._entries) - self._start
@@ -0,0 +1,360 @@
+import asyncio
+import hashlib
+import itertools
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Awaitable, Callable, Optional
+
+from config_data.config import RESULT_STORE_TTL, RESULT_STORE_SIZE
+from database.snapshots import Snapshot, snapshot_store
+from server.metrics import metrics
+from site_api.cache import make_search_key
+from site_api.models import Listing
+from site_api.rate_limiter import BACKGROUND
+from site_api.stream import SearchStream
+from .ranking import Ranking, RANKING_KEYS
+from .scoring import CustomCriteria, count_nights, scored_listings
+
+
+class ResultSet:
+    """
+    Ranked results of one search, shared by every user who made the same search.
+    Pages of the search are loaded and results are taken from the ranking only when some user pages that far,
+    so the ranking covers the pages loaded so far
+    """
+
+    def __init__(self, stream: SearchStream, command: str, criteria: Optional[CustomCriteria] = None) -> None:
+        self.stream = stream
+        self.command = command
+        self.criteria = criteria
+        self.nights = count_nights(stream.params['enter_date'], stream.params['exit_date'])
+        self.ranking = Ranking(RANKING_KEYS.get(command))
+        self.ordered: list[Listing] = []
+        self.loaded = 0
+        self.from_snapshot = False
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def restore(cls, params: dict, command: str, criteria: Optional[CustomCriteria],
+                snapshot: Snapshot) -> 'ResultSet':
+        """
+        Build result set from a saved snapshot, listings are already ranked
+        :param params: Dictionary of user parameters sent to airbnb
+        :param command: Command of the search
+        :param criteria: Filters of the /custom command
+        :param snapshot: Snapshot of the search
+        :return: Result set
+        """
+        stream = SearchStream(params)
+        stream.results = list(snapshot.listings)
+        stream.exhausted = True
+        stream.stale = snapshot.stale
+        result_set = cls(stream, command, criteria)
+        result_set.ordered = list(snapshot.listings)
+        result_set.loaded = len(snapshot.listings)
+        result_set.from_snapshot = True
+        return result_set
+
+    def _collect(self) -> None:
+        """
+        Take results loaded by the stream since the last call
+        :return: None
+        """
+        new_results = self.stream.results[self.loaded:]
+        self.loaded = len(self.stream.results)
+        with metrics.span('compute', 'rank_results'):
+            if self.command == '/custom' and self.criteria is not None:
+                matching, scores = scored_listings(new_results, self.criteria, self.nights)
+                self.ranking.extend(matching, keys=((-score,) for score in scores))
+            else:
+                self.ranking.extend(new_results)
+
+    @property
+    def stale(self) -> bool:
+        """
+        Whether results were served from an expired cache entry
+        :return: boolean value
+        """
+        return self.stream.stale
+
+    @property
+    def exhausted(self) -> bool:
+        """
+        Whether every page of the search is loaded
+        :return: boolean value
+        """
+        return self.stream.exhausted
+
+    @property
+    def total(self) -> int:
+        """
+        Number of loaded results
+        :return: Number of results
+        """
+        return len(self.ordered) + len(self.ranking)
+
+    @property
+    def shareable(self) -> bool:
+        """
+        Whether the result set may be given to other searches: results served from an expired cache entry
+        or from a snapshot are shown only to the user who got them
+        :return: boolean value
+        """
+        return not self.stale and not self.from_snapshot
+
+    async def load(self, count: int, on_queued: Optional[Callable[[int], Awaitable]] = None) -> None:
+        """
+        Load pages from the stream one by one until count results are ranked or the search is exhausted
+        :param count: Number of results needed
+        :param on_queued: Coroutine function of the user called with the queue position if a request has to wait
+        :return: None
+        """
+        async with self._lock:
+            if self.loaded < len(self.stream.results):
+                self._collect()
+            while self.total < count and not self.stream.exhausted:
+                await self.stream.fetch_next(on_queued)
+                self._collect()
+
+    def take(self, offset: int, count: int) -> list[Listing]:
+        """
+        Get loaded results by position in the ranking, no pages are requested
+        :param offset: Position of the first result
+        :param count: Number of results
+        :return: List of listings
+        """
+        if self.loaded < len(self.stream.results):
+            self._collect()
+        while len(self.ordered) < offset + count and self.ranking:
+            self.ordered.append(self.ranking.pop())
+        return self.ordered[offset:offset + count]
+
+    async def get(self, offset: int, count: int,
+                  on_queued: Optional[Callable[[int], Awaitable]] = None) -> list[Listing]:
+        """
+        Get results by position in the ranking, loading the next pages of the search if needed
+        :param offset: Position of the first result
+        :param count: Number of results
+        :param on_queued: Coroutine function of the user called with the queue position if a request has to wait
+        :return: List of listings
+        """
+        await self.load(offset + count, on_queued)
+        return self.take(offset, count)
+
+
+@dataclass
+class ResultCursor:
+    """
+    Position of the user in a result set, small enough to keep in any FSM storage
+    """
+    key: str
+    offset: int
+    params: dict
+    command: str
+    criteria: Optional[dict] = None
+
+    def to_dict(self) -> dict:
+        """
+        Serialize cursor for FSM storage
+        :return: Dictionary
+        """
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'ResultCursor':
+        """
+        Restore cursor from FSM storage
+        :param data: Dictionary
+        :return: Cursor
+        """
+        return cls(**data)
+
+
+def make_result_key(params: dict, command: str, criteria: Optional[CustomCriteria]) -> str:
+    """
+    Build key of the result set for the search
+    :param params: Dictionary of user parameters sent to airbnb
+    :param command: Command of the search
+    :param criteria: Filters of the /custom command
+    :return: Key
+    """
+    source = repr((make_search_key(params), command, criteria))
+    return hashlib.sha1(source.encode()).hexdigest()[:20]
+
+
+class ResultStore:
+    """
+    Shared store of result sets with LRU eviction, sets expire TTL seconds after they were created
+    """
+
+    def __init__(self, ttl: float, max_size: int) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data: OrderedDict[str, tuple[float, ResultSet]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+        self.evictions = 0
+        self._private_keys = itertools.count(1)
+
+    def get(self, key: str) -> Optional[ResultSet]:
+        """
+        Get result set by key
+        :param key: Result set key
+        :return: Result set or None
+        """
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            self._data.pop(key, None)
+            return None
+        self._data.move_to_end(key)
+        return item[1]
+
+    def put(self, key: str, result_set: ResultSet) -> None:
+        """
+        Put result set into the store, evicting least recently used sets. The set expires TTL seconds later
+        :param key: Result set key
+        :param result_set: Result set
+        :return: None
+        """
+        self._data[key] = (time.monotonic() + self.ttl, result_set)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def open(self, stream: SearchStream, command: str, criteria: Optional[CustomCriteria] = None) -> ResultCursor:
+        """
+        Open cursor at the start of the search results, fresh result sets are shared with identical searches.
+        Stale results are kept under a key of their own so no other search gets them
+        :param stream: Search stream with the first page loaded
+        :param command: Command of the search
+        :param criteria: Filters of the /custom command
+        :return: Cursor
+        """
+        key = make_result_key(stream.params, command, criteria)
+        result_set = self.get(key)
+        if result_set is not None and result_set.shareable:
+            self.hits += 1
+            return self._cursor(key, stream.params, command, criteria)
+        self.misses += 1
+        result_set = ResultSet(stream, command, criteria)
+        if not result_set.shareable:
+            key = self._private_key(key)
+        self.put(key, result_set)
+        return self._cursor(key, stream.params, command, criteria)
+
+    def _private_key(self, key: str) -> str:
+        """
+        Build key of a result set shown only to one user
+        :param key: Key of the search
+        :return: Unique key
+        """
+        return f'{key}:{next(self._private_keys)}'
+
+    @staticmethod
+    def _cursor(key: str, params: dict, command: str, criteria: Optional[CustomCriteria]) -> ResultCursor:
+        """
+        Build cursor at the start of the result set
+        :param key: Result set key
+        :param params: Dictionary of user parameters sent to airbnb
+        :param command: Command of the search
+        :param criteria: Filters of the /custom command
+        :return: Cursor
+        """
+        return ResultCursor(
+            key=key,
+            offset=0,
+            params=params,
+            command=command,
+            criteria=asdict(criteria) if criteria is not None else None,
+        )
+
+    async def replay(self, params: dict, command: str, criteria: Optional[CustomCriteria] = None
+                     ) -> Optional[ResultCursor]:
+        """
+        Open cursor for a search from the history without an airbnb request, the results are taken
+        from a fresh result set of the store or from the saved snapshot. Result sets restored from snapshots
+        are kept under keys of their own so fresh searches never get them. Stale snapshots are refreshed
+        in background
+        :param params: Dictionary of user parameters sent to airbnb
+        :param command: Command of the search
+        :param criteria: Filters of the /custom command
+        :return: Cursor or None if the search has to be made again
+        """
+        key = make_result_key(params, command, criteria)
+        result_set = self.get(key)
+        if result_set is not None and result_set.shareable:
+            self.hits += 1
+            return self._cursor(key, params, command, criteria)
+        snapshot = await snapshot_store.get(key)
+        if snapshot is None:
+            return None
+        cursor = self._cursor(self._private_key(key), params, command, criteria)
+        self.put(cursor.key, ResultSet.restore(params, command, criteria, snapshot))
+        if snapshot.stale:
+            snapshot_store.schedule(self.refresh(cursor))
+        return cursor
+
+    async def refresh(self, cursor: ResultCursor) -> None:
+        """
+        Make the search again with background priority, store the fresh result set and replace the snapshot
+        :param cursor: Cursor of the result set
+        :return: None
+        """
+        criteria = CustomCriteria(**cursor.criteria) if cursor.criteria is not None else None
+        key = make_result_key(cursor.params, cursor.command, criteria)
+        stream = SearchStream(cursor.params, priority=BACKGROUND)
+        response = await stream.start()
+        if response['error'] is True:
+            return
+        result_set = ResultSet(stream, cursor.command, criteria)
+        listings = result_set.take(0, snapshot_store.max_results)
+        if result_set.stale:
+            return
+        self.put(key, result_set)
+        await snapshot_store.save(key, listings)
+
+    def remember(self, cursor: ResultCursor) -> None:
+        """
+        Save snapshot of the loaded results in background, for replay from the history
+        :param cursor: Cursor of the result set
+        :return: None
+        """
+        result_set = self.get(cursor.key)
+        if result_set is None or not result_set.shareable or not snapshot_store.enabled:
+            return
+        snapshot_store.schedule_save(cursor.key, result_set.take(0, snapshot_store.max_results))
+
+    def resolve(self, cursor: ResultCursor) -> ResultSet:
+        """
+        Get result set of the cursor, evicted sets are rebuilt from the search parameters
+        :param cursor: Cursor
+        :return: Result set
+        """
+        result_set = self.get(cursor.key)
+        if result_set is None:
+            self.rebuilds += 1
+            criteria = CustomCriteria(**cursor.criteria) if cursor.criteria is not None else None
+            result_set = ResultSet(SearchStream(cursor.params), cursor.command, criteria)
+            self.put(cursor.key, result_set)
+        return result_set
+
+    @property
+    def stats(self) -> dict:
+        """
+        Result store statistics
+        :return: Dictionary with counters
+        """
+        return {
+            'size': len(self._data),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'rebuilds': self.rebuilds,
+            'evictions': self.evictions,
+        }
+
+
+result_store = ResultStore(ttl=RESULT_STORE_TTL, max_size=RESULT_STORE_SIZE)
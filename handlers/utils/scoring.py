@@ -0,0 +1,108 @@
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional, Sequence
+
+import numpy as np
+
+from config_data.config import CUSTOM_PRICE_WEIGHT, CUSTOM_RATING_WEIGHT
+from site_api.models import Listing
+
+MAX_RATING = 5
+
+
+@dataclass(slots=True, frozen=True)
+class CustomCriteria:
+    """
+    User's filters for the /custom command
+    """
+    max_price: float
+    min_price: float = 0
+    min_rating: float = 0
+    min_beds: int = 0
+
+    @classmethod
+    def from_values(cls, max_price, min_price=None, min_rating=None, min_beds=None) -> 'CustomCriteria':
+        """
+        Build criteria from values stored in user state or history, missing values are not filtered
+        :param max_price: Maximum price
+        :param min_price: Minimum price
+        :param min_rating: Minimum rating
+        :param min_beds: Minimum number of beds
+        :return: Criteria
+        """
+        return cls(
+            max_price=float(max_price),
+            min_price=float(min_price or 0),
+            min_rating=float(min_rating or 0),
+            min_beds=int(min_beds or 0),
+        )
+
+
+def count_nights(enter_date: str, exit_date: str) -> int:
+    """
+    Count nights between the dates of the search
+    :param enter_date: Enter date in format %Y-%m-%d
+    :param exit_date: Exit date in format %Y-%m-%d
+    :return: Number of nights, at least 1
+    """
+    nights = (date.fromisoformat(exit_date) - date.fromisoformat(enter_date)).days
+    return max(nights, 1)
+
+
+def score_custom(listings: Sequence[Listing], criteria: CustomCriteria, nights: int,
+                 price_weight: float = CUSTOM_PRICE_WEIGHT,
+                 rating_weight: float = CUSTOM_RATING_WEIGHT) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Filter listings by the criteria and compute the "best deal" score, computed over columns of the listings.
+    The score rewards high rating and penalizes price per night relative to the maximum price per night
+    of the user, so scores of listings from different pages of the search can be compared
+    :param listings: Listings of the search
+    :param criteria: User's filters
+    :param nights: Number of nights of the search
+    :param price_weight: Weight of the price per night in the score
+    :param rating_weight: Weight of the rating in the score
+    :return: Indexes of matching listings and their scores
+    """
+    count = len(listings)
+    prices = np.fromiter((listing.price for listing in listings), dtype=np.float64, count=count)
+    ratings = np.fromiter((listing.rating for listing in listings), dtype=np.float64, count=count)
+    beds = np.fromiter((listing.beds for listing in listings), dtype=np.int64, count=count)
+
+    mask = ((prices >= criteria.min_price) & (prices <= criteria.max_price)
+            & (ratings >= criteria.min_rating) & (beds >= criteria.min_beds))
+    matching = np.flatnonzero(mask)
+    if not matching.size:
+        return matching, np.zeros(0)
+
+    per_night = prices[matching] / nights
+    highest = criteria.max_price / nights
+    price_score = per_night / highest if highest > 0 else np.zeros_like(per_night)
+    return matching, rating_weight * ratings[matching] / MAX_RATING - price_weight * price_score
+
+
+def rank_custom(listings: Sequence[Listing], criteria: CustomCriteria, nights: int,
+                price_weight: float = CUSTOM_PRICE_WEIGHT, rating_weight: float = CUSTOM_RATING_WEIGHT) -> np.ndarray:
+    """
+    Filter listings by the criteria and rank them by the "best deal" score
+    :param listings: Listings of the search
+    :param criteria: User's filters
+    :param nights: Number of nights of the search
+    :param price_weight: Weight of the price per night in the score
+    :param rating_weight: Weight of the rating in the score
+    :return: Indexes of matching listings, best deal first
+    """
+    matching, score = score_custom(listings, criteria, nights, price_weight, rating_weight)
+    return matching[np.argsort(-score, kind='stable')]
+
+
+def scored_listings(listings: Sequence[Listing], criteria: CustomCriteria,
+                    nights: int) -> tuple[list[Listing], list[float]]:
+    """
+    Matching listings with their "best deal" scores, in the order of the listings
+    :param listings: Listings of one page of the search
+    :param criteria: User's filters
+    :param nights: Number of nights of the search
+    :return: Listings and their scores
+    """
+    matching, score = score_custom(listings, criteria, nights)
+    return [listings[index] for index in matching], score.tolist()
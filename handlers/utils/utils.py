@@ -1,110 +1,158 @@
+from functools import partial
+from typing import Awaitable, Callable, Optional
+
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 from aiogram.types import InlineKeyboardButton
 from aiogram.types import Message
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from aiogram.utils.media_group import MediaGroupBuilder
 
 from database.models import History
+from database.photo_cache import photo_cache
+from site_api.models import Listing
 from states.user_states import UserStates
+from .cards import card_renderer
+from .prefetch import prefetcher
+from .results import ResultCursor, ResultSet, result_store
+
+PAGE_SIZE = 3
 
 
-class AsyncResults:
-    def __init__(self, list_result, command, max_price: int = None):
-        if command == '/lowprice':
-            self.list_result = sorted(list_result, key=lambda x: x['price']['total'])
-        elif command == '/highprice':
-            self.list_result = sorted(list_result, key=lambda x: x['price']['total'], reverse=True)
-        elif command == '/bestdeals':
-            self.list_result = sorted(list_result, key=lambda x: x.get('rating', 0), reverse=True)
-        elif command == '/custom':
-            self.list_result = [result for result in list_result if float(result['price']['total']) <= float(max_price)]
-        self.counter = 0
+def queue_notifier(message: Message) -> Callable[[int], Awaitable]:
+    """
+    Build callback telling the user that the request waits in the queue. The callback is built once
+    per search and sends the message only once, even if several pages of the search wait
+    :param message: Message object
+    :return: Coroutine function taking the queue position
+    """
+    notified = False
 
-    def __aiter__(self):
-        return self
+    async def notify(position: int) -> None:
+        nonlocal notified
+        if notified:
+            return
+        notified = True
+        await message.answer(f'Запрос в очереди, позиция {position}')
 
-    async def __anext__(self) -> dict:
-        if self.counter == len(self.list_result):
-            raise StopAsyncIteration
-        self.counter += 1
-        return self.list_result[self.counter]
+    return notify
 
 
-async def get_text(params_dict: dict) -> str:
+def get_text(listing: Listing) -> str:
     """
-    Creating a text string for message
-    :param params_dict: Dictionary with user parameters
+    Creating a text string for message, the text is taken from the shared card cache
+    :param listing: Listing to describe
     :return: Message text
     """
-    text = (f'Название: {params_dict["name"]}\n'
-            f'Кровати: {params_dict["beds"]}\n'
-            f'Адрес: {params_dict["address"]}\n'
-            f'Цена: {params_dict["price"]["total"]} '
-            f'{params_dict["price"]["currency"]}\n'
-            f'Рейтинг: {params_dict["rating"]}\n'
-            f'Ссылка на сайт: {params_dict["deeplink"]}')
+    return card_renderer.render(listing)
 
-    return text
 
+def build_description_message(listing: Listing) -> str:
+    return get_text(listing)
 
-async def build_description_message(params_dict: dict) -> str:
-    hotel_params = {
-        'name': params_dict['name'],
-        'beds': params_dict['beds'],
-        'address': params_dict['address'],
-        'price': params_dict['price'],
-        'rating': params_dict.get('rating', 0),
-        'deeplink': params_dict['deeplink']
-    }
-    text = await get_text(hotel_params)
 
-    return text
+def build_media_message(listing: Listing, use_file_ids: bool = True) -> list:
+    """
+    Build a media group message for the listing, photos already uploaded to telegram are sent by file id.
+    The group is taken from the shared card cache while the photo sources are the same
+    :param listing: Listing to show
+    :param use_file_ids: Whether to use cached file ids instead of urls
+    :return: List of media to send
+    """
+    if use_file_ids:
+        sources = tuple(photo_cache.get(link) or link for link in listing.images)
+    else:
+        sources = listing.images
+    return card_renderer.media_group(listing, sources)
 
 
-async def build_media_message(params_dict: dict) -> MediaGroupBuilder:
+async def send_listing(message: Message, listing: Listing, media: Optional[list] = None) -> None:
+    """
+    Send listing as a media group and remember file ids of the uploaded photos
+    :param message: Message object
+    :param listing: Listing to show
+    :param media: Media group built in advance
+    :return: None
+    """
+    if media is None:
+        media = build_media_message(listing)
+    try:
+        sent = await message.answer_media_group(media=media)
+    except TelegramBadRequest:
+        if all(item.media in listing.images for item in media):
+            raise
+        for link in listing.images:
+            photo_cache.invalidate(link)
+        media = build_media_message(listing, use_file_ids=False)
+        sent = await message.answer_media_group(media=media)
+
+    for link, item, sent_message in zip(listing.images, media, sent):
+        if item.media == link and sent_message.photo:
+            photo_cache.remember(link, sent_message.photo[-1].file_id)
+
+
+async def prepare_page(result_set: ResultSet, offset: int,
+                       on_queued: Optional[Callable[[int], Awaitable]] = None) -> list[tuple[Listing, list]]:
     """
-    Build a media group message with user's parameters
-    :param params_dict: Dictionary with user parameters
-    :return: Media group
+    Load the page of results, requesting the next page of the search if needed, and build media groups
+    of its listings
+    :param result_set: Result set
+    :param offset: Position of the first result of the page
+    :param on_queued: Coroutine function called with the queue position if a request has to wait
+    :return: List of listings with their media groups
     """
-    message_builder = MediaGroupBuilder()
-    for link in params_dict['images'][:3]:
-        message_builder.add_photo(link)
-    message_description = await build_description_message(params_dict)
-    message_builder.caption = message_description
-    return message_builder
+    page = await result_set.get(offset, PAGE_SIZE, on_queued)
+    prepared = []
+    for listing in page:
+        prepared.append((listing, build_media_message(listing)))
+    return prepared
 
 
-async def send_messages(iterator: AsyncResults, message: Message, response: dict, state: FSMContext) -> None:
+async def send_messages(cursor: ResultCursor, message: Message, state: FSMContext,
+                        on_queued: Optional[Callable[[int], Awaitable]] = None) -> None:
     """
     Function for send 3 messages to user, after sending 3 messages the bot expects the next action
-    :param iterator: Iterator for response data
+    while the next page is prepared in background
+    :param cursor: User's position in the search results
     :param message: Message object
-    :param response: Response from server
     :param state: User state
+    :param on_queued: Queue callback of the search, a new one is built for later pages
     :return: None
     """
-    while True:
-        one_result = await anext(iterator)
-        media_message = await build_media_message(one_result)
-
-        await message.answer_media_group(media=media_message.build())
-        if iterator.counter % 3 == 0:
-            count_results = len(response['results']) - iterator.counter + 1
-            button = InlineKeyboardBuilder()
-            button.row(InlineKeyboardButton(
-                text=f"Показать еще", callback_data='more_results')
-            )
-            await message.answer(f'Доступно еще {count_results} результатов,'
-                                 f'\n Для нового запроса введите: "/cancel"',
-                                 reply_markup=button.as_markup())
-            await state.update_data(results=iterator, response=response, message=message)
-            await state.set_state(UserStates.more_results)
-            break
-
-        if iterator.counter + 1 == len(response['results']):
-            await message.answer('Конец списка, введите новую команду')
-            await state.clear()
+    result_set = result_store.resolve(cursor)
+    if cursor.offset == 0 and result_set.stale:
+        if result_set.from_snapshot:
+            await message.answer('Показаны сохраненные результаты, они могут быть неактуальны')
+        else:
+            await message.answer('Сервис временно недоступен, показаны сохраненные результаты, '
+                                 'они могут быть неактуальны')
+    page = await prefetcher.take(message.chat.id, (cursor.key, cursor.offset))
+    if page is None:
+        page = await prepare_page(result_set, cursor.offset, on_queued or queue_notifier(message))
+    for one_result, media in page:
+        await send_listing(message, one_result, media)
+    if cursor.offset == 0:
+        result_store.remember(cursor)
+    cursor.offset += len(page)
+
+    remaining = result_set.total - cursor.offset
+    if remaining <= 0 and result_set.exhausted:
+        await message.answer('Конец списка, введите новую команду')
+        await state.clear()
+        return
+    if result_set.exhausted:
+        text = f'Доступно еще {remaining} результатов,'
+    else:
+        text = 'Доступны еще результаты,'
+    button = InlineKeyboardBuilder()
+    button.row(InlineKeyboardButton(
+        text=f"Показать еще", callback_data='more_results')
+    )
+    await message.answer(f'{text}'
+                         f'\n Для нового запроса введите: "/cancel"',
+                         reply_markup=button.as_markup())
+    await state.update_data(cursor=cursor.to_dict())
+    await state.set_state(UserStates.more_results)
+    prefetcher.schedule(message.chat.id, (cursor.key, cursor.offset), partial(prepare_page, result_set, cursor.offset))
 
 
 async def build_history_text(history_list: list[History]) -> tuple[str, dict]:
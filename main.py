@@ -1,24 +1,119 @@
 import asyncio
 
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 
-from config_data.config import BOT_TOKEN
-from database.base import init_db
+from config_data.config import (BOT_TOKEN, FSM_MAX_SESSIONS, FSM_IDLE_TTL, FSM_FLUSH_INTERVAL, FSM_FLUSH_BATCH,
+                                SEND_MAX_RETRIES, BOT_MODE, POOL_WORKERS, WORKER_SOCKET, METRICS_ENABLED)
+from database.history_cache import history_cache
+from database.history_writer import history_writer
+from database.photo_cache import photo_cache
+from database.retention import retention_job
+from database.snapshots import snapshot_store
+from database.storage import SpillStorage
 from handlers import default_handlers, custom_handlers, common
+from handlers.utils.cards import card_renderer
+from handlers.utils.prefetch import prefetcher
+from middlewares.drain import InFlightMiddleware
+from middlewares.metrics import MetricsMiddleware, HandlerLabelMiddleware, RequestMetricsMiddleware
+from middlewares.prefetch import CancelPrefetchMiddleware
+from middlewares.send_scheduler import SendSchedulerMiddleware, send_scheduler
+from server.lifecycle import lifecycle
+from server.metrics import metrics, metrics_server
+from server.pool import run_pool
+from server.webhook import run_webhook
+from site_api.client import api_client
+from site_api.site_api_handler import api_breaker, api_limiter, cancel_refreshes, search_cache
+from site_api.warmer import cache_warmer
 
 
-async def main() -> None:
+def create_bot() -> Bot:
     """
-    Main entry point for the app
-    :return: None
+    Create bot sending messages through the send scheduler
+    :return: Bot
     """
     bot = Bot(BOT_TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
+    if METRICS_ENABLED:
+        bot.session.middleware(RequestMetricsMiddleware(metrics))
+    bot.session.middleware(SendSchedulerMiddleware(send_scheduler, SEND_MAX_RETRIES))
+    return bot
+
+
+def create_dispatcher() -> Dispatcher:
+    """
+    Create dispatcher with the storage, startup and shutdown hooks and handlers
+    :return: Dispatcher
+    """
+    storage = SpillStorage(max_sessions=FSM_MAX_SESSIONS, idle_ttl=FSM_IDLE_TTL,
+                           flush_interval=FSM_FLUSH_INTERVAL, flush_batch=FSM_FLUSH_BATCH)
+    dp = Dispatcher(storage=storage)
+    # aiogram registers a hook closing the storage first, it is closed after the drain instead
+    dp.shutdown.handlers.clear()
+    dp.startup.register(api_client.start)
+    dp.startup.register(storage.start)
+    dp.startup.register(photo_cache.start)
+    dp.startup.register(history_writer.start)
+    dp.startup.register(cache_warmer.start)
+    dp.startup.register(retention_job.start)
+    dp.startup.register(lifecycle.warm_up)
+    dp.shutdown.register(lifecycle.drain)
+    # Everything that may still call the API stops before the client is closed
+    dp.shutdown.register(prefetcher.close)
+    dp.shutdown.register(cancel_refreshes)
+    dp.shutdown.register(cache_warmer.close)
+    dp.shutdown.register(snapshot_store.close)
+    dp.shutdown.register(retention_job.close)
+    dp.shutdown.register(api_client.close)
+    dp.shutdown.register(storage.close)
+    dp.shutdown.register(photo_cache.close)
+    dp.shutdown.register(history_writer.close)
+    dp.shutdown.register(send_scheduler.close)
+    dp.shutdown.register(lifecycle.close)
+    dp.update.outer_middleware(InFlightMiddleware(lifecycle))
+    dp.message.outer_middleware(CancelPrefetchMiddleware(prefetcher))
+    if METRICS_ENABLED:
+        dp.startup.register(metrics_server.start)
+        dp.shutdown.register(metrics_server.close)
+        dp.update.outer_middleware(MetricsMiddleware(metrics))
+        dp.message.middleware(HandlerLabelMiddleware())
+        dp.callback_query.middleware(HandlerLabelMiddleware())
+        metrics.register_stats('api_client', lambda: api_client.stats)
+        metrics.register_stats('api_limiter', lambda: api_limiter.stats)
+        metrics.register_stats('api_breaker', lambda: api_breaker.stats)
+        metrics.register_stats('search_cache', lambda: search_cache.stats)
+        metrics.register_stats('send_scheduler', lambda: send_scheduler.stats)
+        metrics.register_stats('card_renderer', lambda: card_renderer.stats)
+        metrics.register_stats('fsm_storage', lambda: storage.stats)
+        metrics.register_stats('history_cache', lambda: history_cache.stats)
+        metrics.register_stats('photo_cache', lambda: photo_cache.stats)
+        metrics.register_stats('prefetcher', lambda: prefetcher.stats)
+        metrics.register_stats('cache_warmer', lambda: cache_warmer.stats)
     dp.include_routers(default_handlers.router, custom_handlers.router, common.router)
-    await dp.start_polling(bot)
+    return dp
+
+
+async def main() -> None:
+    """
+    Main entry point for the app, the whole application runs in one event loop
+    :return: None
+    """
+    if BOT_MODE != 'worker':
+        await lifecycle.startup()
+    dp = create_dispatcher()
+    if POOL_WORKERS > 0 and BOT_MODE != 'worker':
+        try:
+            await run_pool(Bot(BOT_TOKEN), dp.resolve_used_update_types())
+        finally:
+            await lifecycle.close()
+        return
+
+    bot = create_bot()
+    if BOT_MODE == 'worker':
+        await run_webhook(dp, bot, unix_path=WORKER_SOCKET)
+    elif BOT_MODE == 'webhook':
+        await run_webhook(dp, bot)
+    else:
+        await dp.start_polling(bot)
 
 
 if __name__ == '__main__':
-    asyncio.run(init_db())
     asyncio.run(main())
@@ -0,0 +1,30 @@
+import asyncio
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import TelegramObject
+
+from server.lifecycle import Lifecycle
+
+
+class InFlightMiddleware(BaseMiddleware):
+    """
+    Update outer middleware tracking updates in progress, shutdown waits for them to finish and cancels them
+    after the deadline. Updates started after the deadline are rejected
+    """
+
+    def __init__(self, lifecycle: Lifecycle) -> None:
+        self.lifecycle = lifecycle
+
+    async def __call__(self, handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: dict[str, Any]) -> Any:
+        if self.lifecycle.closing:
+            self.lifecycle.rejected += 1
+            return UNHANDLED
+        task = asyncio.current_task()
+        self.lifecycle.enter(task)
+        try:
+            return await handler(event, data)
+        finally:
+            self.lifecycle.exit(task)
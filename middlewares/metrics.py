@@ -0,0 +1,85 @@
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod, Response
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject, Update
+
+from config_data.config import DEFAULT_COMMANDS
+from server.metrics import MetricsRegistry, HandlerContext, current_handler
+
+COMMAND_LABELS = frozenset({'/start', *(f'/{command}' for command, _ in DEFAULT_COMMANDS)})
+
+
+def update_command(update: Update) -> str:
+    """
+    Command label of the update: the bot command, the callback data or the event type.
+    Unknown commands and callback data with ids are not used as labels to keep the number of series small
+    :param update: Telegram update
+    :return: Command label
+    """
+    if update.message is not None:
+        text = update.message.text or ''
+        if text.startswith('/'):
+            command = text.split()[0].split('@')[0]
+            return command if command in COMMAND_LABELS else 'other'
+        return 'text' if text else update.message.content_type
+    if update.callback_query is not None:
+        data = update.callback_query.data or ''
+        return data if data.isidentifier() else 'callback'
+    return update.event_type
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Update outer middleware timing every update with the handler, command and state labels
+    """
+
+    def __init__(self, registry: MetricsRegistry) -> None:
+        self.registry = registry
+
+    async def __call__(self, handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]], event: Update,
+                       data: dict[str, Any]) -> Any:
+        context = HandlerContext(command=update_command(event), state=data.get('raw_state') or '')
+        token = current_handler.set(context)
+        started = time.perf_counter()
+        error = None
+        try:
+            return await handler(event, data)
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            current_handler.reset(token)
+            if context.handler == 'unhandled':
+                context.command = ''
+            self.registry.observe_handler(context, time.perf_counter() - started, error)
+
+
+class HandlerLabelMiddleware(BaseMiddleware):
+    """
+    Inner middleware naming the handler chosen for the update
+    """
+
+    async def __call__(self, handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: dict[str, Any]) -> Any:
+        context = current_handler.get()
+        if context is not None:
+            context.handler = data['handler'].callback.__name__
+        return await handler(event, data)
+
+
+class RequestMetricsMiddleware(BaseRequestMiddleware):
+    """
+    Bot session middleware timing telegram requests, the time includes waiting for the send scheduler
+    """
+
+    def __init__(self, registry: MetricsRegistry) -> None:
+        self.registry = registry
+
+    async def __call__(self, make_request: NextRequestMiddlewareType[TelegramType], bot: Bot,
+                       method: TelegramMethod[TelegramType]) -> Response[TelegramType]:
+        with self.registry.span('send', type(method).__name__):
+            return await make_request(bot, method)
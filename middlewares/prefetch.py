@@ -0,0 +1,21 @@
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+
+from handlers.utils.prefetch import Prefetcher
+
+
+class CancelPrefetchMiddleware(BaseMiddleware):
+    """
+    Message middleware cancelling the prefetch of the chat when the user sends a command
+    """
+
+    def __init__(self, prefetcher: Prefetcher) -> None:
+        self.prefetcher = prefetcher
+
+    async def __call__(self, handler: Callable[[Message, dict[str, Any]], Awaitable[Any]], event: Message,
+                       data: dict[str, Any]) -> Any:
+        if event.text and event.text.startswith('/'):
+            self.prefetcher.cancel(event.chat.id)
+        return await handler(event, data)
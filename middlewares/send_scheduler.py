@@ -0,0 +1,248 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Optional, Union
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (TelegramMethod, Response, SendMessage, SendMediaGroup, SendPhoto, EditMessageText,
+                             EditMessageReplyMarkup)
+from aiogram.methods.base import TelegramType
+
+from config_data.config import (SEND_GLOBAL_RATE, SEND_CHAT_MEDIA_INTERVAL, SEND_CHAT_MESSAGE_INTERVAL,
+                                SEND_MAX_RETRIES)
+
+SCHEDULED_METHODS = (SendMessage, SendMediaGroup, SendPhoto, EditMessageText, EditMessageReplyMarkup)
+
+
+@dataclass
+class ChatQueue:
+    """
+    Send requests of one chat waiting for their turn
+    """
+    waiters: deque = field(default_factory=deque)
+    next_allowed: float = 0.0
+    busy: bool = False
+
+
+class SendScheduler:
+    """
+    Scheduler of outgoing telegram requests with a global rate limit, a minimal interval between
+    requests to one chat and round-robin between chats
+    """
+
+    def __init__(self, global_rate: float, media_interval: float, message_interval: float) -> None:
+        self.global_rate = global_rate
+        self.media_interval = media_interval
+        self.message_interval = message_interval
+        self.tokens = global_rate
+        self.updated = time.monotonic()
+        self._chats: dict[Union[int, str], ChatQueue] = {}
+        self._ready: deque = deque()
+        self._wakeup = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.retry_after = 0
+        self.wait_time = 0.0
+        self.send_time = 0.0
+        self.max_wait_time = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        Number of requests waiting to be sent
+        :return: Queue depth
+        """
+        return sum(len(chat.waiters) for chat in self._chats.values())
+
+    def _refill(self) -> None:
+        """
+        Add global tokens for the time passed since the last refill
+        :return: None
+        """
+        now = time.monotonic()
+        self.tokens = min(self.global_rate, self.tokens + (now - self.updated) * self.global_rate)
+        self.updated = now
+
+    def _next_grant(self) -> Optional[float]:
+        """
+        Grant the turn to the first ready chat in round-robin order
+        :return: None if a turn was granted, otherwise seconds to wait before the next try
+        """
+        self._refill()
+        now = time.monotonic()
+        delay = None
+        for _ in range(len(self._ready)):
+            chat_id = self._ready[0]
+            self._ready.rotate(-1)
+            chat = self._chats[chat_id]
+            if chat.busy:
+                continue
+            while chat.waiters and chat.waiters[0][1].done():
+                chat.waiters.popleft()
+            if not chat.waiters:
+                self._ready.remove(chat_id)
+                continue
+            if chat.next_allowed > now:
+                wait = chat.next_allowed - now
+                delay = wait if delay is None else min(delay, wait)
+                continue
+            cost, future = chat.waiters[0]
+            cost = min(cost, self.global_rate)
+            if self.tokens < cost:
+                wait = (cost - self.tokens) / self.global_rate
+                delay = wait if delay is None else min(delay, wait)
+                continue
+            chat.waiters.popleft()
+            chat.busy = True
+            self.tokens -= cost
+            future.set_result(None)
+            return None
+        return delay
+
+    def _prune(self) -> None:
+        """
+        Forget idle chats whose interval has passed
+        :return: None
+        """
+        now = time.monotonic()
+        for chat_id in [chat_id for chat_id, chat in self._chats.items()
+                        if not chat.waiters and not chat.busy and chat.next_allowed <= now]:
+            del self._chats[chat_id]
+
+    async def _dispatch(self) -> None:
+        """
+        Hand out turns to waiting requests until the queue is empty
+        :return: None
+        """
+        self._prune()
+        while self._ready:
+            self._wakeup.clear()
+            delay = self._next_grant()
+            if delay is None and self._ready and any(not self._chats[chat_id].busy for chat_id in self._ready):
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    @asynccontextmanager
+    async def slot(self, chat_id: Union[int, str], cost: int = 1, media: bool = False) -> AsyncIterator[None]:
+        """
+        Wait for the turn to send a request to the chat, requests of one chat are sent one by one in order
+        :param chat_id: Chat id
+        :param cost: Number of messages sent by the request
+        :param media: Whether the request sends a media group
+        :return: Context manager
+        """
+        chat = self._chats.setdefault(chat_id, ChatQueue())
+        future = asyncio.get_running_loop().create_future()
+        chat.waiters.append((cost, future))
+        if chat_id not in self._ready:
+            self._ready.append(chat_id)
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        self._wakeup.set()
+
+        queued = time.monotonic()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                chat.busy = False
+                self._wakeup.set()
+            future.cancel()
+            raise
+        started = time.monotonic()
+        self.wait_time += started - queued
+        self.max_wait_time = max(self.max_wait_time, started - queued)
+        try:
+            yield
+        finally:
+            finished = time.monotonic()
+            self.send_time += finished - started
+            self.sent += 1
+            chat.busy = False
+            chat.next_allowed = max(chat.next_allowed,
+                                    finished + (self.media_interval if media else self.message_interval))
+            self._wakeup.set()
+
+    def pause_chat(self, chat_id: Union[int, str], seconds: float) -> None:
+        """
+        Stop sending to the chat after telegram flood control
+        :param chat_id: Chat id
+        :param seconds: Pause duration
+        :return: None
+        """
+        self.retry_after += 1
+        chat = self._chats.setdefault(chat_id, ChatQueue())
+        chat.next_allowed = max(chat.next_allowed, time.monotonic() + seconds)
+
+    async def close(self) -> None:
+        """
+        Stop the dispatcher task and fail the requests still waiting for their turn,
+        called on dispatcher shutdown
+        :return: None
+        """
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+        for chat in self._chats.values():
+            while chat.waiters:
+                _, future = chat.waiters.popleft()
+                if not future.done():
+                    future.set_exception(RuntimeError('Send scheduler is closed'))
+        self._ready.clear()
+
+    @property
+    def stats(self) -> dict:
+        """
+        Scheduler statistics
+        :return: Dictionary with counters
+        """
+        return {
+            'queue_depth': self.queue_depth,
+            'chats_waiting': len(self._ready),
+            'sent': self.sent,
+            'retry_after': self.retry_after,
+            'avg_wait_time': self.wait_time / self.sent if self.sent else 0.0,
+            'max_wait_time': self.max_wait_time,
+            'avg_send_time': self.send_time / self.sent if self.sent else 0.0,
+        }
+
+
+class SendSchedulerMiddleware(BaseRequestMiddleware):
+    """
+    Bot session middleware sending messages through the scheduler and repeating requests after flood control
+    """
+
+    def __init__(self, scheduler: SendScheduler, max_retries: int) -> None:
+        self.scheduler = scheduler
+        self.max_retries = max_retries
+
+    async def __call__(self, make_request: NextRequestMiddlewareType[TelegramType], bot: Bot,
+                       method: TelegramMethod[TelegramType]) -> Response[TelegramType]:
+        chat_id = getattr(method, 'chat_id', None)
+        if not isinstance(method, SCHEDULED_METHODS) or chat_id is None:
+            return await make_request(bot, method)
+
+        media = isinstance(method, SendMediaGroup)
+        cost = len(method.media) if media else 1
+        retries = 0
+        while True:
+            try:
+                async with self.scheduler.slot(chat_id, cost, media):
+                    return await make_request(bot, method)
+            except TelegramRetryAfter as exc:
+                retries += 1
+                if retries > self.max_retries:
+                    raise
+                self.scheduler.pause_chat(chat_id, exc.retry_after)
+
+
+send_scheduler = SendScheduler(global_rate=SEND_GLOBAL_RATE, media_interval=SEND_CHAT_MEDIA_INTERVAL,
+                               message_interval=SEND_CHAT_MESSAGE_INTERVAL)
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Optional
+
+from config_data.config import SHUTDOWN_DRAIN_TIMEOUT, WARM_STARTUP_TIMEOUT
+from database.base import engine, init_db
+from site_api.warmer import cache_warmer
+
+logger = logging.getLogger(__name__)
+
+
+class Lifecycle:
+    """
+    Startup and shutdown of the application in one event loop. On shutdown updates are no longer received,
+    updates in progress are given time to finish, handlers still running after the deadline are cancelled
+    and updates not started yet are rejected, then the dispatcher shutdown hooks flush and close
+    the components and the database engine is disposed last
+    """
+    cancel_timeout = 1.0
+
+    def __init__(self, drain_timeout: float, warm_timeout: float) -> None:
+        self.drain_timeout = drain_timeout
+        self.warm_timeout = warm_timeout
+        self.in_flight = 0
+        self.draining = False
+        self.closing = False
+        self._sources: list[Callable[[], int]] = []
+        self._tasks: set[asyncio.Task] = set()
+        self.handled = 0
+        self.rejected = 0
+        self.abandoned = 0
+        self.drain_time: Optional[float] = None
+
+    def watch(self, source: Callable[[], int]) -> None:
+        """
+        Wait for updates accepted but not finished yet on shutdown, e.g. webhook updates handled in background
+        :param source: Function returning the number of such updates, including updates in progress
+        :return: None
+        """
+        self._sources.append(source)
+
+    @property
+    def pending(self) -> int:
+        """
+        Number of updates in progress
+        :return: Number of updates
+        """
+        return max([self.in_flight, *(source() for source in self._sources)])
+
+    def enter(self, task: asyncio.Task) -> None:
+        """
+        Register the task handling an update, called when the update is started
+        :param task: Task handling the update
+        :return: None
+        """
+        self.in_flight += 1
+        self._tasks.add(task)
+
+    def exit(self, task: asyncio.Task) -> None:
+        """
+        Unregister the task handling an update, called when the update is finished
+        :param task: Task handling the update
+        :return: None
+        """
+        self.in_flight -= 1
+        self.handled += 1
+        self._tasks.discard(task)
+
+    async def startup(self) -> None:
+        """
+        Create database tables, called before the dispatcher is started
+        :return: None
+        """
+        await init_db()
+
+    async def warm_up(self) -> None:
+        """
+        Aggregate popular searches for the cache warmer before updates are received, called on dispatcher startup.
+        Airbnb requests are left to the warmer schedule so restarts do not spend the daily budget
+        :return: None
+        """
+        if cache_warmer.daily_budget <= 0:
+            return
+        try:
+            await asyncio.wait_for(cache_warmer.refresh_summary(), self.warm_timeout)
+        except Exception as exc:
+            logger.warning('Cache warm-up failed: %r', exc)
+
+    async def drain(self) -> None:
+        """
+        Wait for updates in progress, called first on dispatcher shutdown after updates are no longer received.
+        After the deadline handlers still running are cancelled and updates not started yet are rejected,
+        so nothing uses the components closed by the next shutdown hooks. The webhook server drains before
+        it stops, the shutdown hook then returns at once
+        :return: None
+        """
+        if self.draining:
+            return
+        self.draining = True
+        started = time.monotonic()
+        deadline = started + self.drain_timeout
+        while self.pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        self.drain_time = time.monotonic() - started
+        self.abandoned = self.pending
+        if self.abandoned:
+            logger.warning('Shutdown deadline passed with %s updates in progress, cancelling them', self.abandoned)
+            self.closing = True
+            tasks = [task for task in self._tasks if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.wait(tasks, timeout=self.cancel_timeout)
+        else:
+            logger.info('Updates in progress finished in %.2f seconds', self.drain_time)
+
+    async def close(self) -> None:
+        """
+        Close database connections, called last on dispatcher shutdown
+        :return: None
+        """
+        await engine.dispose()
+
+    @property
+    def stats(self) -> dict:
+        """
+        Lifecycle statistics
+        :return: Dictionary with counters
+        """
+        return {
+            'in_flight': self.in_flight,
+            'pending': self.pending,
+            'handled': self.handled,
+            'rejected': self.rejected,
+            'draining': self.draining,
+            'drain_time': self.drain_time,
+            'abandoned': self.abandoned,
+        }
+
+
+lifecycle = Lifecycle(drain_timeout=SHUTDOWN_DRAIN_TIMEOUT, warm_timeout=WARM_STARTUP_TIMEOUT)
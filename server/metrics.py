@@ -0,0 +1,330 @@
+import math
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import wraps
+from typing import Any, Awaitable, Callable, Optional
+
+from aiohttp import web
+
+from config_data.config import METRICS_ENABLED, METRICS_HOST, METRICS_PORT, METRICS_PATH, METRICS_BUCKETS
+
+HANDLER_LABELS = ('handler', 'command', 'state')
+SPAN_LABELS = ('kind', 'name', 'handler')
+
+
+@dataclass
+class HandlerContext:
+    """
+    Labels of the update being handled, spans inside the handler are attributed to it
+    """
+    handler: str = 'unhandled'
+    command: str = ''
+    state: str = ''
+
+
+current_handler: ContextVar[Optional[HandlerContext]] = ContextVar('current_handler', default=None)
+
+
+class Histogram:
+    """
+    Latency histogram with fixed buckets, counts are kept per bucket and made cumulative on export
+    """
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """
+        Add observation
+        :param value: Observed value in seconds
+        :return: None
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Registry of handler and span latencies and error counters, exported in Prometheus text format
+    together with statistics of the registered components
+    """
+
+    def __init__(self, enabled: bool, buckets: tuple[float, ...]) -> None:
+        self.enabled = enabled
+        self.buckets = buckets
+        self.handler_latency: dict[tuple, Histogram] = {}
+        self.handler_errors: dict[tuple, int] = {}
+        self.span_latency: dict[tuple, Histogram] = {}
+        self.span_errors: dict[tuple, int] = {}
+        self.stats_sources: dict[str, Callable[[], dict]] = {}
+
+    def _histogram(self, series: dict[tuple, Histogram], labels: tuple) -> Histogram:
+        histogram = series.get(labels)
+        if histogram is None:
+            histogram = series[labels] = Histogram(self.buckets)
+        return histogram
+
+    def observe_handler(self, context: HandlerContext, duration: float, error: Optional[BaseException]) -> None:
+        """
+        Record handled update
+        :param context: Labels of the update
+        :param duration: Handling time in seconds
+        :param error: Exception raised by the handler, None on success or cancellation
+        :return: None
+        """
+        labels = (context.handler, context.command, context.state)
+        self._histogram(self.handler_latency, labels).observe(duration)
+        if error is not None:
+            labels += (type(error).__name__,)
+            self.handler_errors[labels] = self.handler_errors.get(labels, 0) + 1
+
+    def observe_span(self, kind: str, name: str, duration: float, error: Optional[BaseException]) -> None:
+        """
+        Record call to the database, the search API or telegram
+        :param kind: Kind of the call: db, api, compute or send
+        :param name: Name of the call
+        :param duration: Call time in seconds
+        :param error: Exception raised by the call, None on success or cancellation
+        :return: None
+        """
+        context = current_handler.get()
+        labels = (kind, name, context.handler if context is not None else '')
+        self._histogram(self.span_latency, labels).observe(duration)
+        if error is not None:
+            labels += (type(error).__name__,)
+            self.span_errors[labels] = self.span_errors.get(labels, 0) + 1
+
+    def span(self, kind: str, name: str) -> 'Span':
+        """
+        Context manager timing a block of code, does nothing when metrics are disabled
+        :param kind: Kind of the call
+        :param name: Name of the call
+        :return: Span
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, kind, name)
+
+    def timed(self, kind: str, name: Optional[str] = None) -> Callable:
+        """
+        Decorator timing every call of a coroutine function, the function is left as is
+        when metrics are disabled
+        :param kind: Kind of the call
+        :param name: Name of the call, the function name by default
+        :return: Decorator
+        """
+        def decorator(func: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+            if not self.enabled:
+                return func
+            span_name = name or func.__name__
+
+            @wraps(func)
+            async def wrapper(*args: Any, **kwargs: Any) -> Any:
+                with Span(self, kind, span_name):
+                    return await func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def register_stats(self, component: str, source: Callable[[], dict]) -> None:
+        """
+        Export statistics of a component on every scrape as gauges named bot_<component>_<key>.
+        Numbers are exported as they are, text values such as a circuit breaker state as a gauge of 1
+        labelled with the value, other values are skipped
+        :param component: Name of the component
+        :param source: Function returning the statistics
+        :return: None
+        """
+        self.stats_sources[component] = source
+
+    def render(self) -> str:
+        """
+        Export metrics in Prometheus text format
+        :return: Metrics text
+        """
+        lines: list[str] = []
+        self._render_histograms(lines, 'bot_handler_duration_seconds', 'Time of handling an update',
+                                HANDLER_LABELS, self.handler_latency)
+        self._render_counters(lines, 'bot_handler_errors_total', 'Updates failed with an exception',
+                              HANDLER_LABELS + ('error',), self.handler_errors)
+        self._render_histograms(lines, 'bot_span_duration_seconds',
+                                'Time of database, search API, ranking and telegram calls',
+                                SPAN_LABELS, self.span_latency)
+        self._render_counters(lines, 'bot_span_errors_total', 'Calls failed with an exception',
+                              SPAN_LABELS + ('error',), self.span_errors)
+        for component, source in self.stats_sources.items():
+            self._render_stats(lines, component, source())
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _render_stats(lines: list[str], component: str, stats: dict) -> None:
+        for key, value in stats.items():
+            metric = f'bot_{component}_{key}'
+            if isinstance(value, (bool, int, float)):
+                lines.append(f'# TYPE {metric} gauge')
+                lines.append(f'{metric} {format_number(value)}')
+            elif isinstance(value, str):
+                lines.append(f'# TYPE {metric} gauge')
+                lines.append(f'{metric}{{{format_labels(("value",), (value,))}}} 1')
+
+    def _render_histograms(self, lines: list[str], metric: str, description: str, names: tuple,
+                           series: dict[tuple, Histogram]) -> None:
+        lines.append(f'# HELP {metric} {description}')
+        lines.append(f'# TYPE {metric} histogram')
+        for labels, histogram in series.items():
+            label_text = format_labels(names, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), histogram.counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{metric}_bucket{{{label_text},le="{le}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{{label_text}}} {histogram.sum}')
+            lines.append(f'{metric}_count{{{label_text}}} {histogram.count}')
+
+    @staticmethod
+    def _render_counters(lines: list[str], metric: str, description: str, names: tuple,
+                         series: dict[tuple, int]) -> None:
+        lines.append(f'# HELP {metric} {description}')
+        lines.append(f'# TYPE {metric} counter')
+        for labels, value in series.items():
+            lines.append(f'{metric}{{{format_labels(names, labels)}}} {value}')
+
+    @property
+    def stats(self) -> dict:
+        """
+        Number of series in the registry
+        :return: Dictionary with counters
+        """
+        return {
+            'enabled': self.enabled,
+            'handler_series': len(self.handler_latency),
+            'span_series': len(self.span_latency),
+            'handler_errors': sum(self.handler_errors.values()),
+            'span_errors': sum(self.span_errors.values()),
+        }
+
+
+def format_labels(names: tuple, values: tuple) -> str:
+    """
+    Format labels of a series, backslashes, quotes and newlines in values are escaped
+    :param names: Label names
+    :param values: Label values
+    :return: Labels text
+    """
+    return ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in zip(names, values)
+    )
+
+
+def format_number(value: float) -> str:
+    """
+    Format sample value, infinities and NaN are written the way Prometheus reads them
+    :param value: Value
+    :return: Value text
+    """
+    value = float(value)
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
+
+
+class Span:
+    """
+    Timer of one call, exceptions are counted and raised again. Cancellation is timed but not counted
+    as an error, the same as in the update middleware
+    """
+    __slots__ = ('registry', 'kind', 'name', 'started')
+
+    def __init__(self, registry: MetricsRegistry, kind: str, name: str) -> None:
+        self.registry = registry
+        self.kind = kind
+        self.name = name
+        self.started = 0.0
+
+    def __enter__(self) -> 'Span':
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Optional[BaseException], traceback: Any) -> None:
+        error = exc if isinstance(exc, Exception) else None
+        self.registry.observe_span(self.kind, self.name, time.perf_counter() - self.started, error)
+
+
+class NullSpan:
+    """
+    Span used when metrics are disabled
+    """
+    __slots__ = ()
+
+    def __enter__(self) -> 'NullSpan':
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Optional[BaseException], traceback: Any) -> None:
+        return None
+
+
+NULL_SPAN = NullSpan()
+
+
+class MetricsServer:
+    """
+    Local HTTP server exporting the registry for Prometheus
+    """
+
+    def __init__(self, registry: MetricsRegistry, host: str, port: int, path: str) -> None:
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.path = path
+        self._runner: Optional[web.AppRunner] = None
+        self.scrapes = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.scrapes += 1
+        return web.Response(text=self.registry.render(), content_type='text/plain',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+
+    async def start(self) -> None:
+        """
+        Start the server, called on dispatcher startup
+        :return: None
+        """
+        if not self.registry.enabled or self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get(self.path, self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def close(self) -> None:
+        """
+        Stop the server, called on dispatcher shutdown
+        :return: None
+        """
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def parse_buckets(value: str) -> tuple[float, ...]:
+    """
+    Parse comma separated histogram bucket bounds
+    :param value: Bounds in seconds, e.g. "0.01,0.1,1"
+    :return: Sorted bounds
+    """
+    return tuple(sorted(float(bound) for bound in value.split(',') if bound.strip()))
+
+
+metrics = MetricsRegistry(enabled=METRICS_ENABLED, buckets=parse_buckets(METRICS_BUCKETS))
+metrics_server = MetricsServer(metrics, host=METRICS_HOST, port=METRICS_PORT, path=METRICS_PATH)
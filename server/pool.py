@@ -0,0 +1,435 @@
+import asyncio
+import logging
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+from typing import Any, Optional
+
+import aiohttp
+from aiogram import Bot
+from aiohttp import web
+
+from config_data.config import (POOL_WORKERS, POOL_QUEUE_SIZE, POOL_START_TIMEOUT, POOL_STOP_TIMEOUT,
+                                POOL_FORWARD_TIMEOUT, BOT_MODE, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH,
+                                WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_HEALTH_PATH, SEND_GLOBAL_RATE,
+                                API_RATE_LIMIT, API_RATE_BURST, API_MONTHLY_QUOTA, WARM_DAILY_BUDGET, METRICS_PORT)
+from server.webhook import update_chat_id
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class Worker:
+    """
+    Worker process handling updates of one shard of chats, updates are posted to its unix socket
+    """
+
+    def __init__(self, index: int, socket_path: str, env: dict) -> None:
+        self.index = index
+        self.socket_path = socket_path
+        self.env = env
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.queue: asyncio.Queue = asyncio.Queue(POOL_QUEUE_SIZE)
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.ready = asyncio.Event()
+        self.stopping = False
+        self.started_at = 0.0
+        self.restarts = 0
+        self.forwarded = 0
+        self.dropped = 0
+        self.retries = 0
+
+    async def spawn(self) -> None:
+        """
+        Start the worker process and wait until it accepts updates, the process is killed if it does not start
+        :return: None
+        """
+        self.ready.clear()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.process = await asyncio.create_subprocess_exec(sys.executable, '-m', 'main', cwd=PROJECT_DIR,
+                                                            env=self.env)
+        self.started_at = time.monotonic()
+        if self.session is None:
+            self.session = aiohttp.ClientSession(base_url='http://worker',
+                                                 connector=aiohttp.UnixConnector(path=self.socket_path))
+        deadline = time.monotonic() + POOL_START_TIMEOUT
+        while time.monotonic() < deadline and self.process.returncode is None:
+            if await self.health() is not None:
+                self.ready.set()
+                logger.info('Worker %s started, pid %s', self.index, self.process.pid)
+                return
+            await asyncio.sleep(0.2)
+        if self.process.returncode is None:
+            self.process.kill()
+            await self.process.wait()
+        raise RuntimeError(f'Worker {self.index} did not start')
+
+    async def stop(self) -> None:
+        """
+        Ask the worker to finish its updates and exit, the process is killed after the timeout
+        :return: None
+        """
+        self.ready.clear()
+        if self.process is None or self.process.returncode is not None:
+            return
+        self.process.terminate()
+        try:
+            await asyncio.wait_for(self.process.wait(), POOL_STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning('Worker %s did not stop in time, killing it', self.index)
+            self.process.kill()
+            await self.process.wait()
+
+    async def health(self) -> Optional[dict]:
+        """
+        Get metrics of the worker
+        :return: Worker metrics or None if the worker does not answer
+        """
+        try:
+            async with self.session.get(WEBHOOK_HEALTH_PATH, timeout=aiohttp.ClientTimeout(total=2)) as response:
+                return await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+
+    async def forward(self) -> None:
+        """
+        Post queued updates to the worker in order, updates wait while the worker restarts.
+        Failed posts are repeated with growing pauses, an update not delivered in POOL_FORWARD_TIMEOUT is dropped
+        :return: None
+        """
+        headers = {SECRET_HEADER: WEBHOOK_SECRET} if WEBHOOK_SECRET else {}
+        while True:
+            update = await self.queue.get()
+            deadline = time.monotonic() + POOL_FORWARD_TIMEOUT
+            pause = 0.1
+            status = None
+            while True:
+                try:
+                    await asyncio.wait_for(self.ready.wait(), max(deadline - time.monotonic(), 0))
+                    async with self.session.post(WEBHOOK_PATH, json=update, headers=headers) as response:
+                        status = response.status
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    status = None
+                if status == 200:
+                    self.forwarded += 1
+                    break
+                if status is not None and status != 503:
+                    logger.warning('Worker %s rejected update %s with status %s', self.index,
+                                   update.get('update_id'), status)
+                    self.dropped += 1
+                    break
+                if time.monotonic() + pause > deadline:
+                    logger.error('Worker %s did not accept update %s in %s seconds (last status %s), dropping it',
+                                 self.index, update.get('update_id'), POOL_FORWARD_TIMEOUT, status)
+                    self.dropped += 1
+                    break
+                self.retries += 1
+                await asyncio.sleep(pause)
+                pause = min(pause * 2, 5)
+            self.queue.task_done()
+
+    @property
+    def stats(self) -> dict:
+        """
+        Front side statistics of the worker
+        :return: Dictionary with counters
+        """
+        return {
+            'worker': self.index,
+            'pid': self.process.pid if self.process is not None else None,
+            'alive': self.process is not None and self.process.returncode is None,
+            'ready': self.ready.is_set(),
+            'uptime': time.monotonic() - self.started_at if self.started_at else 0.0,
+            'queue_depth': self.queue.qsize(),
+            'forwarded': self.forwarded,
+            'dropped': self.dropped,
+            'retries': self.retries,
+            'restarts': self.restarts,
+        }
+
+
+class WorkerPool:
+    """
+    Pool of worker processes on one host, updates are sharded by chat id so the FSM state
+    of every chat stays in one worker
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.socket_dir = tempfile.mkdtemp(prefix='tg-bot-')
+        self.workers = [Worker(index, os.path.join(self.socket_dir, f'worker-{index}.sock'), self._worker_env(index))
+                        for index in range(size)]
+        self._tasks: list[asyncio.Task] = []
+        self._restart_lock = asyncio.Lock()
+        self._restart_task: Optional[asyncio.Task] = None
+        self.received = 0
+        self.rejected = 0
+
+    def _worker_env(self, index: int) -> dict:
+        """
+        Environment of the worker process, limits shared by the bot are split between workers.
+        Every worker warms its own search cache, as any worker may get a popular search, with its share
+        of the warming budget. Retention runs only in the first worker, every worker exports metrics
+        on its own port
+        :param index: Worker index
+        :return: Environment variables
+        """
+        env = {
+            **os.environ,
+            'BOT_MODE': 'worker',
+            'POOL_WORKERS': '0',
+            'WORKER_INDEX': str(index),
+            'WORKER_SOCKET': os.path.join(self.socket_dir, f'worker-{index}.sock'),
+            'SEND_GLOBAL_RATE': str(SEND_GLOBAL_RATE / self.size),
+            'API_RATE_LIMIT': str(API_RATE_LIMIT / self.size),
+            'API_RATE_BURST': str(max(API_RATE_BURST // self.size, 1)),
+            'API_MONTHLY_QUOTA': str(API_MONTHLY_QUOTA // self.size),
+            'WARM_DAILY_BUDGET': str(WARM_DAILY_BUDGET // self.size + (index < WARM_DAILY_BUDGET % self.size)),
+            'METRICS_PORT': str(METRICS_PORT + index),
+        }
+        if index > 0:
+            env.update(RETENTION_INTERVAL='0')
+        return env
+
+    def shard(self, update: dict) -> Worker:
+        """
+        Get worker of the update's chat
+        :param update: Raw telegram update
+        :return: Worker
+        """
+        return self.workers[update_chat_id(update) % self.size]
+
+    def dispatch(self, update: dict) -> bool:
+        """
+        Queue update for its worker
+        :param update: Raw telegram update
+        :return: False if the worker queue is full
+        """
+        try:
+            self.shard(update).queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.received += 1
+        return True
+
+    async def start(self) -> None:
+        """
+        Start worker processes, their forwarding tasks and the process monitor.
+        If a worker does not start, the started workers are stopped and the sockets directory is removed
+        :return: None
+        """
+        results = await asyncio.gather(*(worker.spawn() for worker in self.workers), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            await self._release()
+            raise errors[0]
+        for worker in self.workers:
+            self._tasks.append(asyncio.create_task(worker.forward()))
+            self._tasks.append(asyncio.create_task(self._monitor(worker)))
+
+    async def _monitor(self, worker: Worker) -> None:
+        """
+        Start the worker again if its process exits unexpectedly
+        :param worker: Worker
+        :return: None
+        """
+        while True:
+            process = worker.process
+            await process.wait()
+            if worker.stopping or worker.process is not process:
+                await asyncio.sleep(0.5)
+                continue
+            logger.error('Worker %s exited with code %s, restarting', worker.index, process.returncode)
+            worker.restarts += 1
+            try:
+                await worker.spawn()
+            except Exception:
+                logger.exception('Worker %s restart failed', worker.index)
+                await asyncio.sleep(POOL_START_TIMEOUT)
+
+    async def restart(self) -> None:
+        """
+        Restart workers one by one, updates of the restarting worker wait in its queue
+        and its FSM sessions are written to the database before the new process starts.
+        A worker that does not start is left to the process monitor and the next workers are restarted
+        :return: None
+        """
+        async with self._restart_lock:
+            failed = []
+            for worker in self.workers:
+                worker.stopping = True
+                try:
+                    await worker.stop()
+                    worker.restarts += 1
+                    await worker.spawn()
+                except Exception:
+                    logger.exception('Worker %s restart failed, the monitor will start it again', worker.index)
+                    failed.append(worker.index)
+                finally:
+                    worker.stopping = False
+            if failed:
+                logger.error('Workers %s did not restart', failed)
+            else:
+                logger.info('Workers restarted')
+
+    def schedule_restart(self) -> None:
+        """
+        Start a rolling restart in background, called on SIGHUP. A restart in progress is not started again
+        :return: None
+        """
+        if self._restart_task is not None and not self._restart_task.done():
+            logger.info('Restart of workers is already in progress')
+            return
+        self._restart_task = asyncio.create_task(self.restart())
+        self._restart_task.add_done_callback(self._restart_done)
+
+    @staticmethod
+    def _restart_done(task: asyncio.Task) -> None:
+        """
+        Log the error of a background restart
+        :param task: Restart task
+        :return: None
+        """
+        if not task.cancelled() and task.exception() is not None:
+            logger.error('Restart of workers failed', exc_info=task.exception())
+
+    async def close(self) -> None:
+        """
+        Deliver queued updates and stop the workers
+        :return: None
+        """
+        for worker in self.workers:
+            if worker.ready.is_set():
+                try:
+                    await asyncio.wait_for(worker.queue.join(), POOL_STOP_TIMEOUT)
+                except asyncio.TimeoutError:
+                    logger.warning('Worker %s queue was not delivered in time', worker.index)
+        if self._restart_task is not None:
+            self._restart_task.cancel()
+        for task in self._tasks:
+            task.cancel()
+        await self._release()
+
+    async def _release(self) -> None:
+        """
+        Stop worker processes, close their sessions and remove the sockets directory
+        :return: None
+        """
+        for worker in self.workers:
+            worker.stopping = True
+        await asyncio.gather(*(worker.stop() for worker in self.workers))
+        for worker in self.workers:
+            if worker.session is not None:
+                await worker.session.close()
+                worker.session = None
+        shutil.rmtree(self.socket_dir, ignore_errors=True)
+
+    async def metrics(self) -> dict:
+        """
+        Metrics of the front process and every worker
+        :return: Dictionary with metrics
+        """
+        workers = []
+        for worker, health in zip(self.workers, await asyncio.gather(*(worker.health() for worker in self.workers))):
+            workers.append({**worker.stats, 'process': health})
+        return {'received': self.received, 'rejected': self.rejected, 'workers': workers}
+
+
+def build_front_app(pool: WorkerPool) -> web.Application:
+    """
+    Build aiohttp application of the front process: pool metrics and, in webhook mode, the webhook
+    :param pool: Worker pool
+    :return: Application
+    """
+    app = web.Application()
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response({'status': 'ok', **await pool.metrics()})
+
+    async def webhook(request: web.Request) -> web.Response:
+        if WEBHOOK_SECRET and request.headers.get(SECRET_HEADER, '') != WEBHOOK_SECRET:
+            return web.Response(body='Unauthorized', status=401)
+        if not pool.dispatch(await request.json()):
+            return web.Response(body='Busy', status=503)
+        return web.json_response({})
+
+    app.router.add_get(WEBHOOK_HEALTH_PATH, health)
+    if BOT_MODE == 'webhook':
+        app.router.add_post(WEBHOOK_PATH, webhook)
+    return app
+
+
+async def poll(bot: Bot, pool: WorkerPool, allowed_updates: list[str]) -> None:
+    """
+    Receive updates with long polling and queue them for the workers
+    :param bot: Bot
+    :param pool: Worker pool
+    :param allowed_updates: Update types used by the handlers
+    :return: None
+    """
+    offset: Optional[int] = None
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=allowed_updates)
+        except Exception as exc:
+            logger.warning('Getting updates failed: %r', exc)
+            await asyncio.sleep(1)
+            continue
+        for update in updates:
+            raw: dict[str, Any] = update.model_dump(mode='json', by_alias=True, exclude_none=True)
+            while not pool.dispatch(raw):
+                await asyncio.sleep(0.1)
+            offset = update.update_id + 1
+
+
+async def run_pool(bot: Bot, allowed_updates: list[str], size: int = POOL_WORKERS) -> None:
+    """
+    Run the front process: start workers, receive updates and shard them between workers.
+    SIGHUP restarts workers one by one, SIGTERM and SIGINT stop the pool
+    :param bot: Bot used to receive updates
+    :param allowed_updates: Update types used by the handlers
+    :param size: Number of workers
+    :return: None
+    """
+    pool = WorkerPool(size)
+    try:
+        await pool.start()
+    except BaseException:
+        await bot.session.close()
+        raise
+    runner = web.AppRunner(build_front_app(pool))
+    receiver: Optional[asyncio.Task] = None
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    try:
+        await runner.setup()
+        await web.TCPSite(runner, host=WEBHOOK_HOST, port=WEBHOOK_PORT).start()
+        if BOT_MODE == 'webhook':
+            if WEBHOOK_URL:
+                await bot.set_webhook(url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+                                      secret_token=WEBHOOK_SECRET or None, allowed_updates=allowed_updates)
+        else:
+            await bot.delete_webhook()
+            receiver = asyncio.create_task(poll(bot, pool, allowed_updates))
+
+        loop.add_signal_handler(signal.SIGTERM, stop.set)
+        loop.add_signal_handler(signal.SIGINT, stop.set)
+        loop.add_signal_handler(signal.SIGHUP, pool.schedule_restart)
+        logger.info('Worker pool of %s processes started', size)
+        await stop.wait()
+    finally:
+        for signal_number in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            loop.remove_signal_handler(signal_number)
+        if receiver is not None:
+            receiver.cancel()
+        await runner.cleanup()
+        await pool.close()
+        await bot.session.close()
@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import os
+import signal
+from typing import Any, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from config_data.config import (WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET,
+                                WEBHOOK_MAX_CONCURRENCY, WEBHOOK_MAX_PENDING, WEBHOOK_HEALTH_PATH)
+from server.lifecycle import lifecycle
+
+logger = logging.getLogger(__name__)
+
+
+def update_chat_id(update: dict) -> int:
+    """
+    Find chat of the update, updates without a chat are keyed by the user
+    :param update: Raw telegram update
+    :return: Chat id or 0
+    """
+    for name, event in update.items():
+        if name == 'update_id' or not isinstance(event, dict):
+            continue
+        chat = event.get('chat') or (event.get('message') or {}).get('chat')
+        if chat:
+            return chat['id']
+        user = event.get('from') or event.get('user')
+        if user:
+            return user['id']
+    return 0
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """
+    Webhook request handler processing at most max_concurrency updates at once.
+    Updates of one chat are handled one by one in the order they were received, so handlers of a chat
+    never race on its FSM state. When max_pending updates are waiting or the application is shutting down,
+    telegram gets 503 and delivers the update again later
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret_token: Optional[str], max_concurrency: int,
+                 max_pending: int, **data: Any) -> None:
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, secret_token=secret_token,
+                         **data)
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._chat_locks: dict[int, asyncio.Lock] = {}
+        self._chat_updates: dict[int, int] = {}
+        self.in_flight = 0
+        self.received = 0
+        self.rejected = 0
+        self.unauthorized = 0
+
+    @property
+    def accepted(self) -> int:
+        """
+        Number of accepted updates not finished yet, including updates in progress
+        :return: Number of updates
+        """
+        return len(self._background_feed_update_tasks)
+
+    @property
+    def pending(self) -> int:
+        """
+        Number of accepted updates waiting for their chat or a concurrency slot
+        :return: Number of updates
+        """
+        return self.accepted - self.in_flight
+
+    async def _background_feed_update(self, bot: Bot, update: dict[str, Any]) -> None:
+        chat_id = update_chat_id(update)
+        if not chat_id:
+            await self._feed_update(bot, update)
+            return
+        lock = self._chat_locks.get(chat_id)
+        if lock is None:
+            lock = self._chat_locks[chat_id] = asyncio.Lock()
+        self._chat_updates[chat_id] = self._chat_updates.get(chat_id, 0) + 1
+        try:
+            async with lock:
+                await self._feed_update(bot, update)
+        finally:
+            self._chat_updates[chat_id] -= 1
+            if not self._chat_updates[chat_id]:
+                del self._chat_updates[chat_id]
+                del self._chat_locks[chat_id]
+
+    async def _feed_update(self, bot: Bot, update: dict[str, Any]) -> None:
+        """
+        Handle the update when a concurrency slot is free
+        :param bot: Bot
+        :param update: Raw telegram update
+        :return: None
+        """
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                await super()._background_feed_update(bot, update)
+            finally:
+                self.in_flight -= 1
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if not self.verify_secret(request.headers.get('X-Telegram-Bot-Api-Secret-Token', ''), self.bot):
+            self.unauthorized += 1
+            return web.Response(body='Unauthorized', status=401)
+        if lifecycle.draining or self.pending >= self.max_pending:
+            self.rejected += 1
+            return web.Response(body='Busy', status=503)
+        self.received += 1
+        return await self._handle_request_background(bot=self.bot, request=request)
+
+    __call__ = handle
+
+    @property
+    def stats(self) -> dict:
+        """
+        Webhook statistics
+        :return: Dictionary with counters
+        """
+        return {
+            'in_flight': self.in_flight,
+            'pending': self.pending,
+            'accepted': self.accepted,
+            'chats': len(self._chat_locks),
+            'received': self.received,
+            'rejected': self.rejected,
+            'unauthorized': self.unauthorized,
+        }
+
+
+def build_webhook_app(dp: Dispatcher, bot: Bot, register: bool = True) -> web.Application:
+    """
+    Build aiohttp application receiving telegram updates
+    :param dp: Dispatcher
+    :param bot: Bot
+    :param register: Whether to set the webhook in telegram on startup
+    :return: Application
+    """
+    app = web.Application()
+    handler = BoundedRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET or None,
+                                    max_concurrency=WEBHOOK_MAX_CONCURRENCY, max_pending=WEBHOOK_MAX_PENDING)
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response({'status': 'draining' if lifecycle.draining else 'ok', 'pid': os.getpid(),
+                                  **handler.stats, 'lifecycle': lifecycle.stats},
+                                 status=503 if lifecycle.draining else 200)
+
+    async def set_webhook(app: web.Application) -> None:
+        await bot.set_webhook(url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET or None,
+                              allowed_updates=dp.resolve_used_update_types(),
+                              max_connections=min(WEBHOOK_MAX_CONCURRENCY, 100))
+
+    app.router.add_get(WEBHOOK_HEALTH_PATH, health)
+    if register and WEBHOOK_URL:
+        app.on_startup.append(set_webhook)
+    # Dispatcher shutdown hooks wait for updates in progress, the handler closes the bot session after them
+    setup_application(app, dp, bot=bot)
+    handler.register(app, path=WEBHOOK_PATH)
+    app['webhook_handler'] = handler
+    lifecycle.watch(lambda: handler.accepted)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, unix_path: Optional[str] = None) -> None:
+    """
+    Serve the webhook until SIGTERM or SIGINT, updates in progress are drained before the server stops
+    :param dp: Dispatcher
+    :param bot: Bot
+    :param unix_path: Path of the unix socket to listen on instead of the TCP port, used by pool workers
+    :return: None
+    """
+    app = build_webhook_app(dp, bot, register=unix_path is None)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    if unix_path is not None:
+        if os.path.exists(unix_path):
+            os.unlink(unix_path)
+        site = web.UnixSite(runner, unix_path)
+    else:
+        site = web.TCPSite(runner, host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+    await site.start()
+    logger.info('Webhook is served on %s', site.name)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signal_number, stop.set)
+    try:
+        await stop.wait()
+        # The site keeps answering during the drain: new updates and health checks get 503
+        await lifecycle.drain()
+    finally:
+        for signal_number in (signal.SIGTERM, signal.SIGINT):
+            loop.remove_signal_handler(signal_number)
+        await runner.cleanup()
@@ -0,0 +1,161 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Hashable, Optional
+
+
+def make_search_key(params: dict) -> tuple:
+    """
+    Build normalized cache key for search parameters
+    :param params: Dictionary of user parameters
+    :return: Tuple key
+    """
+    return (
+        str(params['city']).strip().casefold(),
+        str(params['enter_date']),
+        str(params['exit_date']),
+        int(params['adults']),
+        int(params.get('children') or 0),
+        int(params.get('infants') or 0),
+        int(params.get('pets') or 0),
+        str(params.get('currency') or 'USD').upper(),
+    )
+
+
+class _LoadCancelled(Exception):
+    """
+    Set on the shared load when the caller making it is cancelled, waiting callers load the key again
+    """
+
+
+class SearchCache:
+    """
+    TTL cache with LRU eviction and single-flight loading of missing keys
+    """
+
+    def __init__(self, ttl: float, max_size: int) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data: OrderedDict[Hashable, tuple[float, dict]] = OrderedDict()
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.stale_hits = 0
+
+    def get(self, key: Hashable) -> Optional[dict]:
+        """
+        Get fresh value from cache
+        :param key: Cache key
+        :return: Cached value or None
+        """
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires < time.monotonic():
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def get_stale(self, key: Hashable) -> Optional[dict]:
+        """
+        Get value from cache even if its TTL has passed, expired values are kept until evicted
+        :param key: Cache key
+        :return: Cached value or None
+        """
+        item = self._data.get(key)
+        if item is None:
+            return None
+        self.stale_hits += 1
+        return item[1]
+
+    def set(self, key: Hashable, value: dict, ttl: Optional[float] = None) -> None:
+        """
+        Put value into cache, evicting least recently used entries
+        :param key: Cache key
+        :param value: Value to cache
+        :param ttl: TTL of the value, the cache TTL by default
+        :return: None
+        """
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        """
+        Remove value from cache
+        :param key: Cache key
+        :return: None
+        """
+        self._data.pop(key, None)
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[dict]],
+                          cacheable: Callable[[dict], bool] = lambda value: True, ttl: Optional[float] = None) -> dict:
+        """
+        Get value from cache or load it, concurrent calls for one key share a single load.
+        If the caller making the load is cancelled, one of the waiting callers makes the load instead
+        :param key: Cache key
+        :param loader: Coroutine function loading the value
+        :param cacheable: Predicate deciding whether loaded value may be cached
+        :param ttl: TTL of the loaded value, the cache TTL by default
+        :return: Value
+        """
+        while True:
+            value = self.get(key)
+            if value is not None:
+                self.hits += 1
+                return value
+
+            future = self._inflight.get(key)
+            if future is None:
+                break
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except _LoadCancelled:
+                self.coalesced -= 1
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.set_exception(_LoadCancelled())
+            future.exception()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            # mark exception as retrieved, the loader caller gets it re-raised
+            future.exception()
+            raise
+        else:
+            if cacheable(value):
+                self.set(key, value, ttl)
+            future.set_result(value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    @property
+    def stats(self) -> dict:
+        """
+        Cache statistics
+        :return: Dictionary with counters
+        """
+        requests = self.hits + self.misses + self.coalesced
+        return {
+            'size': len(self._data),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'inflight': len(self._inflight),
+            'evictions': self.evictions,
+            'stale_hits': self.stale_hits,
+            'hit_rate': (self.hits + self.coalesced) / requests if requests else 0.0,
+        }
@@ -0,0 +1,153 @@
+from types import SimpleNamespace
+from typing import Optional
+
+import aiohttp
+
+from config_data.config import (RAPID_API_KEY, API_BASE_URL, API_CONNECTION_LIMIT, API_CONNECTION_LIMIT_PER_HOST,
+                                API_DNS_CACHE_TTL, API_KEEPALIVE_TIMEOUT, API_TOTAL_TIMEOUT, API_CONNECT_TIMEOUT)
+
+
+class ApiError(Exception):
+    """
+    Raised when the API answers with an error status or a body that is not json
+    """
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(f'{status}: {message}')
+        self.status = status
+        self.message = message
+
+
+class ApiClient:
+    """
+    Long-lived HTTP client for the airbnb API with a shared connection pool
+    """
+
+    def __init__(self, base_url: str, headers: dict, limit: int = 100, limit_per_host: int = 20,
+                 dns_cache_ttl: int = 300, keepalive_timeout: float = 30,
+                 total_timeout: float = 30, connect_timeout: float = 5) -> None:
+        self.base_url = base_url.rstrip('/')
+        self.headers = headers
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, sock_connect=connect_timeout)
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.closed = False
+        self.requests = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.dns_cache_hits = 0
+        self.dns_cache_misses = 0
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        """
+        Build trace hooks that count pool usage
+        :return: Trace config
+        """
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, context: SimpleNamespace, params) -> None:
+            self.requests += 1
+
+        async def on_connection_create_end(session, context: SimpleNamespace, params) -> None:
+            self.connections_created += 1
+
+        async def on_connection_reuseconn(session, context: SimpleNamespace, params) -> None:
+            self.connections_reused += 1
+
+        async def on_dns_cache_hit(session, context: SimpleNamespace, params) -> None:
+            self.dns_cache_hits += 1
+
+        async def on_dns_cache_miss(session, context: SimpleNamespace, params) -> None:
+            self.dns_cache_misses += 1
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace_config.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace_config.on_dns_cache_miss.append(on_dns_cache_miss)
+        return trace_config
+
+    async def start(self) -> None:
+        """
+        Open the client session, called on dispatcher startup
+        :return: None
+        """
+        self.closed = False
+        if self.session is not None and not self.session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.dns_cache_ttl,
+            use_dns_cache=True,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            headers=self.headers,
+            timeout=self.timeout,
+            trace_configs=[self._trace_config()],
+        )
+
+    async def close(self) -> None:
+        """
+        Close the client session, called on dispatcher shutdown. Requests made later fail
+        instead of opening a new session
+        :return: None
+        """
+        self.closed = True
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def get_json(self, path: str, params: dict) -> dict:
+        """
+        Send GET request and decode the json body
+        :param path: Path relative to the base url
+        :param params: Query string parameters
+        :return: Decoded response
+        """
+        if self.closed:
+            raise RuntimeError('API client is closed')
+        if self.session is None or self.session.closed:
+            await self.start()
+        async with self.session.get(f'{self.base_url}{path}', params=params) as response:
+            if response.status >= 400:
+                raise ApiError(response.status, response.reason or '')
+            try:
+                return await response.json(content_type=None)
+            except ValueError:
+                raise ApiError(0, 'Response body is not json')
+
+    @property
+    def stats(self) -> dict:
+        """
+        Connection pool statistics
+        :return: Dictionary with counters
+        """
+        total = self.connections_created + self.connections_reused
+        return {
+            'requests': self.requests,
+            'connections_created': self.connections_created,
+            'connections_reused': self.connections_reused,
+            'reuse_rate': self.connections_reused / total if total else 0.0,
+            'dns_cache_hits': self.dns_cache_hits,
+            'dns_cache_misses': self.dns_cache_misses,
+            'pool_limit': self.limit,
+            'pool_limit_per_host': self.limit_per_host,
+        }
+
+
+api_client = ApiClient(
+    base_url=API_BASE_URL,
+    headers={"X-RapidAPI-Key": RAPID_API_KEY},
+    limit=API_CONNECTION_LIMIT,
+    limit_per_host=API_CONNECTION_LIMIT_PER_HOST,
+    dns_cache_ttl=API_DNS_CACHE_TTL,
+    keepalive_timeout=API_KEEPALIVE_TIMEOUT,
+    total_timeout=API_TOTAL_TIMEOUT,
+    connect_timeout=API_CONNECT_TIMEOUT,
+)
@@ -0,0 +1,52 @@
+from dataclasses import dataclass
+from typing import Optional, Union
+
+
+@dataclass(slots=True, frozen=True)
+class Listing:
+    """
+    Compact airbnb listing with the fields the bot shows to users
+    """
+    id: str
+    name: str
+    beds: int
+    address: str
+    price: Union[int, float]
+    currency: str
+    rating: Union[int, float]
+    deeplink: str
+    images: tuple[str, ...]
+
+    @classmethod
+    def from_api(cls, data: dict) -> Optional['Listing']:
+        """
+        Build listing from one result of the airbnb response, unused fields are dropped
+        :param data: Result dictionary from airbnb
+        :return: Listing or None if the result is malformed
+        """
+        try:
+            return cls(
+                id=str(data.get('id') or data['deeplink']),
+                name=data['name'],
+                beds=data.get('beds') or 0,
+                address=data.get('address', ''),
+                price=data['price']['total'],
+                currency=data['price']['currency'],
+                rating=data.get('rating') or 0,
+                deeplink=data['deeplink'],
+                images=tuple(data.get('images') or ())[:3],
+            )
+        except (KeyError, TypeError):
+            return None
+
+
+def parse_response(response: dict) -> dict:
+    """
+    Convert decoded airbnb response to the compact form kept by the bot
+    :param response: Decoded response from airbnb
+    :return: Dictionary with error flag and list of listings or error message
+    """
+    if response.get('error') is not False:
+        return {'error': True, 'message': response.get('message', 'Неизвестная ошибка')}
+    listings = (Listing.from_api(result) for result in response.get('results') or [])
+    return {'error': False, 'results': [listing for listing in listings if listing is not None]}
@@ -0,0 +1,159 @@
+import asyncio
+import heapq
+import itertools
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+
+class QueueFullError(Exception):
+    """
+    Raised when the wait queue of the rate limiter is full
+    """
+
+
+class QuotaExceededError(Exception):
+    """
+    Raised when the monthly request quota is used up
+    """
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiter with a bounded priority wait queue and monthly quota
+    """
+
+    def __init__(self, rate: float, burst: int, max_queue: int, monthly_quota: int = 0) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.max_queue = max_queue
+        self.monthly_quota = monthly_quota
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.month = datetime.now().strftime('%Y-%m')
+        self.month_used = 0
+        self._queue: list[list] = []
+        self._counter = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.granted = 0
+        self.throttled = 0
+        self.rejected = 0
+        self.quota_rejected = 0
+        self.wait_time = 0.0
+
+    def _refill(self) -> None:
+        """
+        Add tokens for the time passed since the last refill
+        :return: None
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _check_quota(self) -> None:
+        """
+        Reset the quota counter on a new month and check the quota
+        :return: None
+        """
+        month = datetime.now().strftime('%Y-%m')
+        if month != self.month:
+            self.month = month
+            self.month_used = 0
+        if self.monthly_quota and self.month_used >= self.monthly_quota:
+            self.quota_rejected += 1
+            raise QuotaExceededError
+
+    def _grant(self) -> None:
+        """
+        Spend a token
+        :return: None
+        """
+        self.tokens -= 1
+        self.month_used += 1
+        self.granted += 1
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        Number of requests waiting for a token
+        :return: Queue depth
+        """
+        return sum(1 for entry in self._queue if not entry[2].done())
+
+    def position(self, entry: list) -> int:
+        """
+        Position of the queue entry, starting from 1
+        :param entry: Queue entry
+        :return: Position
+        """
+        return 1 + sum(1 for other in self._queue if other[:2] < entry[:2] and not other[2].done())
+
+    async def _dispatch(self) -> None:
+        """
+        Hand out tokens to the waiting requests in priority order
+        :return: None
+        """
+        while self._queue:
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+            _, _, future = heapq.heappop(self._queue)
+            if future.done():
+                continue
+            self._grant()
+            future.set_result(None)
+
+    async def acquire(self, priority: int = INTERACTIVE,
+                      on_queued: Optional[Callable[[int], Awaitable]] = None) -> None:
+        """
+        Wait for permission to send one request
+        :param priority: Request priority, lower value is served first
+        :param on_queued: Coroutine function called with the queue position when the request has to wait
+        :return: None
+        """
+        self._check_quota()
+        self._refill()
+        if not self.queue_depth and self.tokens >= 1:
+            self._grant()
+            return
+        if self.queue_depth >= self.max_queue:
+            self.rejected += 1
+            raise QueueFullError
+
+        future = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self._counter), future]
+        heapq.heappush(self._queue, entry)
+        self.throttled += 1
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        started = time.monotonic()
+        try:
+            if on_queued is not None:
+                await on_queued(self.position(entry))
+            await future
+        finally:
+            future.cancel()
+            self.wait_time += time.monotonic() - started
+
+    @property
+    def stats(self) -> dict:
+        """
+        Rate limiter statistics
+        :return: Dictionary with counters
+        """
+        return {
+            'queue_depth': self.queue_depth,
+            'max_queue': self.max_queue,
+            'tokens': self.tokens,
+            'granted': self.granted,
+            'throttled': self.throttled,
+            'rejected': self.rejected,
+            'quota_rejected': self.quota_rejected,
+            'month_used': self.month_used,
+            'monthly_quota': self.monthly_quota,
+            'wait_time': self.wait_time,
+        }
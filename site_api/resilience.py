@@ -0,0 +1,167 @@
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import aiohttp
+
+from site_api.client import ApiError
+
+T = TypeVar('T')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised when the circuit breaker does not let a call through
+    """
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    Check if the failed call may succeed when repeated
+    :param exc: Exception raised by the call
+    :return: boolean value
+    """
+    if isinstance(exc, ApiError):
+        return exc.status == 429 or exc.status >= 500 or exc.status == 0
+    return isinstance(exc, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker failing fast after several consecutive upstream failures
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.rejected = 0
+        self.opened = 0
+
+    @property
+    def retry_after(self) -> float:
+        """
+        Seconds left until the open circuit lets a probe call through
+        :return: Seconds
+        """
+        if self.state != OPEN:
+            return 0.0
+        return max(self.opened_at + self.reset_timeout - time.monotonic(), 0.0)
+
+    def allow(self) -> bool:
+        """
+        Check if a call may be sent upstream
+        :return: boolean value
+        """
+        if self.state == OPEN and self.retry_after == 0:
+            self.state = HALF_OPEN
+            self.probe_in_flight = False
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self) -> None:
+        """
+        Close the circuit after a successful call
+        :return: None
+        """
+        self.state = CLOSED
+        self.failures = 0
+        self.probe_in_flight = False
+
+    def release(self) -> None:
+        """
+        Finish a call that says nothing about the upstream health, e.g. a rejected request:
+        the half-open circuit lets the next probe through and the failure count is kept
+        :return: None
+        """
+        self.probe_in_flight = False
+
+    def record_failure(self) -> None:
+        """
+        Count a failed call, open the circuit when the threshold is reached
+        :return: None
+        """
+        self.failures += 1
+        self.probe_in_flight = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.opened += 1
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    @property
+    def stats(self) -> dict:
+        """
+        Circuit breaker statistics
+        :return: Dictionary with counters
+        """
+        return {
+            'state': self.state,
+            'retry_after': self.retry_after,
+            'failures': self.failures,
+            'opened': self.opened,
+            'rejected': self.rejected,
+        }
+
+
+async def call_with_retry(func: Callable[[], Awaitable[T]], breaker: CircuitBreaker, retries: int,
+                          backoff: float, attempt_timeout: float, deadline: float,
+                          before_attempt: Optional[Callable[[], Awaitable]] = None) -> T:
+    """
+    Call upstream with per-attempt timeout, bounded retries with full jitter and a circuit breaker
+    :param func: Coroutine function making one attempt
+    :param breaker: Circuit breaker guarding the upstream
+    :param retries: Number of retries after the first attempt
+    :param backoff: Base backoff delay in seconds
+    :param attempt_timeout: Timeout of one attempt in seconds
+    :param deadline: Total time budget for all attempts in seconds
+    :param before_attempt: Coroutine function awaited before every attempt the breaker lets through,
+                           e.g. rate limiter, so calls rejected by the breaker take no tokens
+    :return: Result of the call
+    """
+    expires = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            raise CircuitOpenError
+        if before_attempt is not None:
+            try:
+                await before_attempt()
+            except BaseException:
+                breaker.release()
+                raise
+        left = expires - time.monotonic()
+        if left <= 0:
+            breaker.release()
+            raise asyncio.TimeoutError
+        try:
+            result = await asyncio.wait_for(func(), timeout=min(attempt_timeout, left))
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception as exc:
+            if not is_retryable(exc):
+                breaker.release()
+                raise
+            breaker.record_failure()
+            delay = random.uniform(0, backoff * 2 ** attempt)
+            attempt += 1
+            if attempt > retries or time.monotonic() + delay >= expires:
+                raise
+            await asyncio.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
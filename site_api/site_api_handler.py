@@ -1,15 +1,37 @@
-import aiohttp
+import asyncio
+import logging
+from typing import Awaitable, Callable, Hashable, Optional
 
-from config_data.config import RAPID_API_KEY
+from config_data.config import (SEARCH_CACHE_TTL, SEARCH_CACHE_SIZE, API_RATE_LIMIT, API_RATE_BURST, API_QUEUE_SIZE,
+                                API_MONTHLY_QUOTA, API_ATTEMPT_TIMEOUT, API_DEADLINE, API_RETRIES, API_RETRY_BACKOFF,
+                                API_BREAKER_THRESHOLD, API_BREAKER_RESET)
+from server.metrics import metrics
+from site_api.cache import SearchCache, make_search_key
+from site_api.client import api_client
+from site_api.models import parse_response
+from site_api.rate_limiter import RateLimiter, QueueFullError, QuotaExceededError, INTERACTIVE, BACKGROUND
+from site_api.resilience import CircuitBreaker, CircuitOpenError, call_with_retry
 
+logger = logging.getLogger(__name__)
 
-async def user_request(params: dict) -> dict:
+search_cache = SearchCache(ttl=SEARCH_CACHE_TTL, max_size=SEARCH_CACHE_SIZE)
+api_limiter = RateLimiter(rate=API_RATE_LIMIT, burst=API_RATE_BURST, max_queue=API_QUEUE_SIZE,
+                          monthly_quota=API_MONTHLY_QUOTA)
+api_breaker = CircuitBreaker(failure_threshold=API_BREAKER_THRESHOLD, reset_timeout=API_BREAKER_RESET)
+_refreshing: dict[Hashable, asyncio.Task] = {}
+
+
+@metrics.timed('api')
+async def user_request(params: dict, page: str = "1-8", priority: int = INTERACTIVE,
+                       on_queued: Optional[Callable[[int], Awaitable]] = None) -> dict:
     """
     Function to send request to airbnb
     :param params: Dictionary of user parameters to send to airbnb
-    :return: Dictionary of response from airbnb
+    :param page: Page number or range of pages, e.g. "1" or "1-8"
+    :param priority: Rate limiter priority of the request
+    :param on_queued: Coroutine function called with the queue position if the request has to wait
+    :return: Dictionary with error flag and list of listings or error message
     """
-    url = "https://airbnb13.p.rapidapi.com/search-location"
     querystring = {
         "location": params['city'],
         "checkin": params['enter_date'],
@@ -18,14 +40,91 @@ async def user_request(params: dict) -> dict:
         "children": params.get('children', '0'),
         "infants": params.get('infants', '0'),
         "pets": params.get('pets', '0'),
-        "page": "1-8",
+        "page": page,
         "currency": params.get('currency', 'USD')
     }
-    headers = {
-        "X-RapidAPI-Key": RAPID_API_KEY,
-    }
 
-    async with aiohttp.ClientSession() as session:
-        response = await session.get(url, params=querystring, headers=headers)
-        data = await response.json()
-        return data
+    try:
+        response = await call_with_retry(
+            lambda: api_client.get_json('/search-location', querystring),
+            breaker=api_breaker,
+            retries=API_RETRIES,
+            backoff=API_RETRY_BACKOFF,
+            attempt_timeout=API_ATTEMPT_TIMEOUT,
+            deadline=API_DEADLINE,
+            before_attempt=lambda: api_limiter.acquire(priority, on_queued),
+        )
+    except QueueFullError:
+        return {'error': True, 'message': 'Сервис перегружен, попробуйте позже'}
+    except QuotaExceededError:
+        return {'error': True, 'message': 'Исчерпан лимит запросов к сервису, попробуйте позже'}
+    except CircuitOpenError:
+        return {'error': True, 'message': 'Сервис временно недоступен, попробуйте позже'}
+    except Exception as exc:
+        logger.warning('Search request to airbnb failed: %r', exc)
+        return {'error': True, 'message': 'Сервис не отвечает, попробуйте позже'}
+
+    return parse_response(response)
+
+
+async def cached_request(params: dict, page: str = "1-8", priority: int = INTERACTIVE,
+                         on_queued: Optional[Callable[[int], Awaitable]] = None, ttl: Optional[float] = None) -> dict:
+    """
+    Send request to airbnb through the search cache, identical concurrent searches share one request
+    :param params: Dictionary of user parameters to send to airbnb
+    :param page: Page number or range of pages
+    :param priority: Rate limiter priority of the request
+    :param on_queued: Coroutine function called with the queue position if the request has to wait
+    :param ttl: Cache TTL of the response, the cache TTL by default
+    :return: Dictionary of response from airbnb
+    """
+    key = (make_search_key(params), page)
+    response = await search_cache.get_or_load(
+        key,
+        lambda: user_request(params, page, priority, on_queued),
+        cacheable=lambda response: response.get('error') is False,
+        ttl=ttl,
+    )
+    if response.get('error') is not False:
+        stale = search_cache.get_stale(key)
+        if stale is not None:
+            _schedule_refresh(key, params, page)
+            return {**stale, 'stale': True}
+    return response
+
+
+def _schedule_refresh(key: Hashable, params: dict, page: str) -> None:
+    """
+    Refresh stale search result in the background once upstream accepts calls again
+    :param key: Cache key
+    :param params: Dictionary of user parameters to send to airbnb
+    :param page: Page number or range of pages
+    :return: None
+    """
+    if key in _refreshing:
+        return
+
+    async def refresh() -> None:
+        try:
+            await asyncio.sleep(api_breaker.retry_after)
+            await search_cache.get_or_load(
+                key,
+                lambda: user_request(params, page, BACKGROUND),
+                cacheable=lambda response: response.get('error') is False,
+            )
+        finally:
+            _refreshing.pop(key, None)
+
+    _refreshing[key] = asyncio.create_task(refresh())
+
+
+async def cancel_refreshes() -> None:
+    """
+    Cancel background refreshes of stale search results, called on dispatcher shutdown before the API client
+    is closed
+    :return: None
+    """
+    tasks = list(_refreshing.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
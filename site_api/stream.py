@@ -0,0 +1,86 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+from config_data.config import SEARCH_PAGES
+from site_api.models import Listing
+from site_api.rate_limiter import INTERACTIVE
+from site_api.site_api_handler import cached_request
+
+logger = logging.getLogger(__name__)
+
+
+class SearchStream:
+    """
+    Search that loads airbnb result pages one by one on demand. The stream may be shared by users
+    of one result set, so the queue callback of the user is passed to every call
+    """
+
+    def __init__(self, params: dict, pages: int = SEARCH_PAGES, priority: int = INTERACTIVE) -> None:
+        self.params = params
+        self.pages = pages
+        self.priority = priority
+        self.next_page = 1
+        self.results: list[Listing] = []
+        self.exhausted = False
+        self.stale = False
+        self._lock = asyncio.Lock()
+
+    async def _load_page(self, page: int, on_queued: Optional[Callable[[int], Awaitable]]) -> dict:
+        """
+        Load one page of results
+        :param page: Page number
+        :param on_queued: Coroutine function called with the queue position if the request has to wait
+        :return: Response from airbnb
+        """
+        return await cached_request(self.params, str(page), self.priority, on_queued)
+
+    def _accept(self, page: int, response: dict) -> list[Listing]:
+        """
+        Store loaded page, stop the stream on error or empty page
+        :param page: Page number
+        :param response: Response from airbnb
+        :return: Results of the page
+        """
+        if response.get('error') is not False:
+            logger.warning('Page %s of search %s failed: %s', page, self.params['city'], response.get('message'))
+            self.exhausted = True
+            return []
+        if response.get('stale'):
+            self.stale = True
+        page_results = response.get('results') or []
+        self.results.extend(page_results)
+        if not page_results:
+            self.exhausted = True
+        return page_results
+
+    async def start(self, on_queued: Optional[Callable[[int], Awaitable]] = None) -> dict:
+        """
+        Load the first page of results
+        :param on_queued: Coroutine function called with the queue position if the request has to wait
+        :return: Response for the first page, handlers check it for errors
+        """
+        async with self._lock:
+            response = await self._load_page(1, on_queued)
+            self.next_page = 2
+            self._accept(1, response)
+            if self.next_page > self.pages:
+                self.exhausted = True
+            return response
+
+    async def fetch_next(self, on_queued: Optional[Callable[[int], Awaitable]] = None) -> list[Listing]:
+        """
+        Load the next page of results
+        :param on_queued: Coroutine function called with the queue position if the request has to wait
+        :return: Results of the loaded page
+        """
+        async with self._lock:
+            if self.exhausted:
+                return []
+            page = self.next_page
+            response = await self._load_page(page, on_queued)
+            self.next_page = page + 1
+            page_results = self._accept(page, response)
+            if self.next_page > self.pages:
+                self.exhausted = True
+            return page_results
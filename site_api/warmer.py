@@ -0,0 +1,158 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional
+
+from config_data.config import (WARM_INTERVAL, WARM_HOURS, WARM_DAILY_BUDGET, WARM_TOP, WARM_TTL,
+                                ANALYTICS_WINDOW_DAYS, SEARCH_PAGES)
+from database.analytics import PopularQuery, popular_queries
+from site_api.cache import make_search_key
+from site_api.rate_limiter import BACKGROUND
+from site_api.site_api_handler import cached_request, search_cache
+
+logger = logging.getLogger(__name__)
+
+
+def parse_hours(value: str) -> tuple[int, int]:
+    """
+    Parse range of hours like "2-6", the end hour is not included and the range may pass midnight
+    :param value: Range of hours
+    :return: Start and end hour
+    """
+    start, end = value.split('-')
+    return int(start) % 24, int(end) % 24
+
+
+class CacheWarmer:
+    """
+    Scheduler loading popular searches into the search cache during off-peak hours,
+    the number of airbnb requests is limited by a daily budget
+    """
+
+    def __init__(self, interval: float, hours: tuple[int, int], daily_budget: int, top: int, ttl: float,
+                 window_days: int, pages: int) -> None:
+        self.interval = interval
+        self.hours = hours
+        self.daily_budget = daily_budget
+        self.top = top
+        self.ttl = ttl
+        self.window_days = window_days
+        self.pages = pages
+        self.summary: list[PopularQuery] = []
+        self.summary_updated: Optional[datetime] = None
+        self.day = datetime.now().strftime('%Y-%m-%d')
+        self.day_used = 0
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.requests = 0
+        self.skipped = 0
+        self.failed = 0
+
+    async def start(self) -> None:
+        """
+        Start the scheduler, called on dispatcher startup
+        :return: None
+        """
+        if self.daily_budget > 0 and self._task is None:
+            self._task = asyncio.create_task(self._maintain())
+
+    async def _maintain(self) -> None:
+        """
+        Periodically warm the cache
+        :return: None
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run()
+            except Exception:
+                logger.exception('Cache warming failed')
+
+    def off_peak(self, now: datetime) -> bool:
+        """
+        Whether the time is in the off-peak hours
+        :param now: Time to check
+        :return: boolean value
+        """
+        start, end = self.hours
+        if start <= end:
+            return start <= now.hour < end
+        return now.hour >= start or now.hour < end
+
+    @property
+    def budget_left(self) -> int:
+        """
+        Number of requests left for today, the budget is reset on a new day
+        :return: Number of requests
+        """
+        day = datetime.now().strftime('%Y-%m-%d')
+        if day != self.day:
+            self.day = day
+            self.day_used = 0
+        return max(self.daily_budget - self.day_used, 0)
+
+    async def refresh_summary(self) -> list[PopularQuery]:
+        """
+        Aggregate popular searches from the search history
+        :return: List of popular searches
+        """
+        self.summary = await popular_queries(self.window_days, self.top)
+        self.summary_updated = datetime.now()
+        return self.summary
+
+    async def run(self) -> None:
+        """
+        Load pages of popular searches missing in the cache while the budget lasts, off-peak only
+        :return: None
+        """
+        if not self.off_peak(datetime.now()) or not self.budget_left:
+            return
+        self.runs += 1
+        for query in await self.refresh_summary():
+            search_key = make_search_key(query.params)
+            for page in range(1, self.pages + 1):
+                if search_cache.get((search_key, str(page))) is not None:
+                    self.skipped += 1
+                    continue
+                if not self.budget_left:
+                    return
+                self.day_used += 1
+                self.requests += 1
+                response = await cached_request(query.params, str(page), BACKGROUND, ttl=self.ttl)
+                if response.get('error') is not False:
+                    self.failed += 1
+                    return
+                if not response.get('results'):
+                    break
+
+    async def close(self) -> None:
+        """
+        Stop the scheduler and wait for the warming in progress to stop, called on dispatcher shutdown
+        before the API client is closed
+        :return: None
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    @property
+    def stats(self) -> dict:
+        """
+        Cache warming statistics
+        :return: Dictionary with counters
+        """
+        return {
+            'summary_size': len(self.summary),
+            'summary_updated': self.summary_updated,
+            'runs': self.runs,
+            'requests': self.requests,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'budget_left': self.budget_left,
+            'daily_budget': self.daily_budget,
+        }
+
+
+cache_warmer = CacheWarmer(interval=WARM_INTERVAL, hours=parse_hours(WARM_HOURS), daily_budget=WARM_DAILY_BUDGET,
+                           top=WARM_TOP, ttl=WARM_TTL, window_days=ANALYTICS_WINDOW_DAYS, pages=SEARCH_PAGES)
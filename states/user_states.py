@@ -16,5 +16,8 @@ class UserStates(StatesGroup):
     infants = State()
     pets = State()
     currency = State()
+    min_price = State()
     max_price = State()
+    min_rating = State()
+    min_beds = State()
     history = State()
@@ -0,0 +1,4 @@
+import os
+import tempfile
+
+os.environ.setdefault('DATABASE_URL', 'sqlite+aiosqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db'))
@@ -0,0 +1,111 @@
+import asyncio
+from unittest import mock
+
+import pytest
+
+from site_api import cache
+from site_api.cache import SearchCache, make_search_key
+
+
+def test_search_key_is_normalized():
+    assert make_search_key({'city': ' Paris ', 'enter_date': '2026-11-01', 'exit_date': '2026-11-03',
+                            'adults': '2'}) == \
+        make_search_key({'city': 'paris', 'enter_date': '2026-11-01', 'exit_date': '2026-11-03', 'adults': 2,
+                         'children': 0, 'currency': 'usd'})
+
+
+def test_values_expire_after_ttl():
+    search_cache = SearchCache(ttl=10, max_size=10)
+    with mock.patch.object(cache.time, 'monotonic', return_value=100.0):
+        search_cache.set('a', {'value': 1})
+        search_cache.set('b', {'value': 2}, ttl=30)
+    with mock.patch.object(cache.time, 'monotonic', return_value=111.0):
+        assert search_cache.get('a') is None
+        assert search_cache.get_stale('a') == {'value': 1}
+        assert search_cache.get('b') == {'value': 2}
+
+
+def test_least_recently_used_value_is_evicted():
+    search_cache = SearchCache(ttl=10, max_size=2)
+    search_cache.set('a', {'value': 1})
+    search_cache.set('b', {'value': 2})
+    search_cache.get('a')
+    search_cache.set('c', {'value': 3})
+    assert search_cache.get('b') is None
+    assert search_cache.get('a') == {'value': 1}
+    assert search_cache.evictions == 1
+
+
+def test_concurrent_loads_share_one_call():
+    search_cache = SearchCache(ttl=10, max_size=10)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {'value': len(calls)}
+
+    async def scenario():
+        loads = asyncio.gather(*(search_cache.get_or_load('key', loader) for _ in range(5)))
+        await asyncio.sleep(0)
+        assert search_cache.stats['inflight'] == 1
+        return await loads
+
+    assert asyncio.run(scenario()) == [{'value': 1}] * 5
+    assert search_cache.stats['inflight'] == 0
+    assert len(calls) == 1
+    assert search_cache.stats['coalesced'] == 4
+    assert search_cache.get('key') == {'value': 1}
+
+
+def test_failed_load_is_not_cached_and_raised_to_every_caller():
+    search_cache = SearchCache(ttl=10, max_size=10)
+
+    async def loader():
+        await asyncio.sleep(0.01)
+        raise ValueError
+
+    async def scenario():
+        return await asyncio.gather(*(search_cache.get_or_load('key', loader) for _ in range(3)),
+                                    return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in asyncio.run(scenario()))
+    assert search_cache.get('key') is None
+
+
+def test_uncacheable_value_is_returned_but_not_cached():
+    search_cache = SearchCache(ttl=10, max_size=10)
+
+    async def loader():
+        return {'error': True}
+
+    value = asyncio.run(search_cache.get_or_load('key', loader, cacheable=lambda value: not value['error']))
+    assert value == {'error': True}
+    assert search_cache.get('key') is None
+
+
+def test_waiting_callers_survive_cancelled_leader():
+    search_cache = SearchCache(ttl=10, max_size=10)
+    calls = []
+
+    def make_loader(name):
+        async def loader():
+            calls.append(name)
+            await asyncio.sleep(0.05)
+            return {'loaded_by': name}
+        return loader
+
+    async def scenario():
+        leader = asyncio.create_task(search_cache.get_or_load('key', make_loader('leader')))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(search_cache.get_or_load('key', make_loader(f'follower{number}')))
+                     for number in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*followers)
+
+    results = asyncio.run(scenario())
+    assert results == [{'loaded_by': 'follower0'}] * 3
+    assert calls == ['leader', 'follower0']
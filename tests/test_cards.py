@@ -0,0 +1,64 @@
+from dataclasses import replace
+from unittest import mock
+
+from handlers.utils import utils
+from handlers.utils.cards import CardRenderer
+from site_api.models import Listing
+
+LISTING = Listing(id='1', name='Flat', beds=2, address='Paris', price=100, currency='USD', rating=4.5,
+                  deeplink='https://airbnb.com/rooms/1', images=('https://img/1.jpg', 'https://img/2.jpg'))
+
+
+def test_equal_listing_is_a_hit():
+    renderer = CardRenderer(max_size=10)
+    text = renderer.render(LISTING)
+    assert renderer.render(replace(LISTING)) is text
+    assert 'Цена: 100 USD' in text
+    assert renderer.stats['hits'] == 1 and renderer.stats['misses'] == 1
+
+
+def test_changed_listing_gets_its_own_card():
+    renderer = CardRenderer(max_size=10)
+    renderer.render(LISTING)
+    other_dates = replace(LISTING, price=250)
+    assert 'Цена: 250 USD' in renderer.render(other_dates)
+    assert 'Цена: 100 USD' in renderer.render(LISTING)
+    assert renderer.stats['misses'] == 2 and renderer.stats['hits'] == 1
+
+
+def test_least_recently_used_card_is_evicted():
+    renderer = CardRenderer(max_size=2)
+    renderer.render(LISTING)
+    renderer.render(replace(LISTING, id='2'))
+    renderer.render(LISTING)
+    renderer.render(replace(LISTING, id='3'))
+    assert renderer.stats['evictions'] == 1
+    renderer.render(LISTING)
+    assert renderer.stats['misses'] == 3
+
+
+def test_media_group_is_built_once_for_the_same_sources():
+    renderer = CardRenderer(max_size=10)
+    first = renderer.media_group(LISTING, LISTING.images)
+    first.clear()
+    second = renderer.media_group(replace(LISTING), LISTING.images)
+    assert [item.media for item in second] == list(LISTING.images)
+    assert second[0].caption == renderer.render(LISTING) and second[1].caption is None
+    assert renderer.stats['media_builds'] == 1
+
+
+def test_media_group_is_rebuilt_when_a_photo_gets_a_file_id():
+    renderer = CardRenderer(max_size=10)
+    renderer.media_group(LISTING, LISTING.images)
+    media = renderer.media_group(LISTING, ('file-1', LISTING.images[1]))
+    assert [item.media for item in media] == ['file-1', LISTING.images[1]]
+    assert renderer.stats['media_builds'] == 2
+
+
+def test_media_message_uses_cached_file_ids():
+    file_ids = {LISTING.images[0]: 'file-1'}
+    with mock.patch.object(utils.photo_cache, 'get', side_effect=file_ids.get), \
+            mock.patch.object(utils, 'card_renderer', CardRenderer(max_size=10)):
+        assert [item.media for item in utils.build_media_message(LISTING)] == ['file-1', LISTING.images[1]]
+        assert [item.media for item in utils.build_media_message(LISTING, use_file_ids=False)] == \
+            list(LISTING.images)
@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from database.base import SQLITE_PROFILES, make_engine
+
+
+async def pragmas(url: str, profile: str) -> dict:
+    engine = make_engine(url, profile=profile, echo=False, pool_size=2, max_overflow=0)
+    try:
+        async with engine.connect() as conn:
+            return {name: (await conn.execute(text(f'PRAGMA {name}'))).scalar()
+                    for name in ('journal_mode', 'synchronous', 'busy_timeout', 'temp_store')}
+    finally:
+        await engine.dispose()
+
+
+def test_production_profile_sets_pragmas(tmp_path):
+    url = f'sqlite+aiosqlite:///{tmp_path / "bot.db"}'
+    result = asyncio.run(pragmas(url, 'production'))
+    assert result == {'journal_mode': 'wal', 'synchronous': 1,
+                      'busy_timeout': SQLITE_PROFILES['production']['busy_timeout'], 'temp_store': 2}
+
+
+def test_default_profile_keeps_sqlite_defaults(tmp_path):
+    url = f'sqlite+aiosqlite:///{tmp_path / "bot.db"}'
+    result = asyncio.run(pragmas(url, 'default'))
+    assert result['journal_mode'] == 'delete' and result['synchronous'] == 2
+
+
+def test_unknown_profile_is_rejected():
+    with pytest.raises(ValueError, match='Unknown database profile'):
+        make_engine('sqlite+aiosqlite://', profile='fast')
+
+
+def test_file_database_gets_a_connection_pool(tmp_path):
+    engine = make_engine(f'sqlite+aiosqlite:///{tmp_path / "bot.db"}', profile='default', echo=False,
+                         pool_size=3, max_overflow=1)
+    assert isinstance(engine.pool, AsyncAdaptedQueuePool)
+    assert engine.pool.size() == 3
+    memory_engine = make_engine('sqlite+aiosqlite://', profile='default', echo=False, pool_size=3, max_overflow=1)
+    assert not isinstance(memory_engine.pool, AsyncAdaptedQueuePool)
+
+
+def test_server_database_gets_pre_ping_and_pool_settings():
+    pytest.importorskip('asyncpg')
+    engine = make_engine('postgresql+asyncpg://bot@localhost/bot', profile='production', echo=False, pool_size=4,
+                         max_overflow=2)
+    assert engine.pool.size() == 4 and engine.pool._pre_ping
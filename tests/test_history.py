@@ -0,0 +1,98 @@
+import asyncio
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import delete, insert
+
+from database.base import async_session, init_db
+from database.common import get_history
+from database.history_cache import bump_history_versions
+from database.models import History
+
+USER = 16
+START = datetime(2026, 10, 1, 12, 0)
+
+
+def make_row(user_tg_id: int, date_search: datetime) -> dict:
+    return {'user_tg_id': user_tg_id, 'date_search': date_search, 'enter_date': date(2026, 11, 1),
+            'exit_date': date(2026, 11, 3), 'city': 'Paris', 'adults': 1, 'command': '/lowprice'}
+
+
+async def prepare(dates: list[datetime]) -> None:
+    await init_db()
+    async with async_session() as session:
+        await session.execute(delete(History).where(History.user_tg_id.in_([USER, USER + 1])))
+        await session.execute(insert(History), [make_row(USER, date_search) for date_search in dates] +
+                              [make_row(USER + 1, START)])
+        await bump_history_versions(session, [USER, USER + 1])
+        await session.commit()
+
+
+def key(history: History) -> tuple[datetime, int]:
+    return history.date_search, history.id
+
+
+async def walk_older(limit: int) -> list[tuple[list[History], bool]]:
+    pages = [await get_history(USER, limit=limit)]
+    while pages[-1][1]:
+        pages.append(await get_history(USER, before=key(pages[-1][0][-1]), limit=limit))
+    return pages
+
+
+async def walk_newer(last_page: list[History], limit: int) -> list[tuple[list[History], bool]]:
+    pages = [await get_history(USER, after=key(last_page[0]), limit=limit)]
+    while pages[-1][1]:
+        pages.append(await get_history(USER, after=key(pages[-1][0][0]), limit=limit))
+    return pages
+
+
+def test_older_pages_cover_every_search_once():
+    # Three searches share one timestamp and are ordered by id
+    dates = [START + timedelta(minutes=minutes) for minutes in (0, 1, 2, 2, 2, 3, 4)]
+
+    async def scenario():
+        await prepare(dates)
+        return await walk_older(limit=3)
+
+    pages = asyncio.run(scenario())
+    assert [len(page) for page, _ in pages] == [3, 3, 1]
+    assert [has_more for _, has_more in pages] == [True, True, False]
+    keys = [key(history) for page, _ in pages for history in page]
+    assert keys == sorted(keys, reverse=True)
+    assert len(set(keys)) == len(dates)
+    assert all(history.user_tg_id == USER for page, _ in pages for history in page)
+
+
+def test_last_full_page_has_no_more():
+    dates = [START + timedelta(minutes=minutes) for minutes in range(6)]
+
+    async def scenario():
+        await prepare(dates)
+        return await walk_older(limit=3)
+
+    pages = asyncio.run(scenario())
+    assert [(len(page), has_more) for page, has_more in pages] == [(3, True), (3, False)]
+
+
+def test_newer_pages_go_back_to_the_first_page():
+    dates = [START] * 4 + [START + timedelta(minutes=1)] * 3
+
+    async def scenario():
+        await prepare(dates)
+        older = await walk_older(limit=2)
+        newer = await walk_newer(older[-1][0], limit=2)
+        return older, newer
+
+    older, newer = asyncio.run(scenario())
+    older_keys = [[key(history) for history in page] for page, _ in older]
+    newer_keys = [[key(history) for history in page] for page, _ in newer]
+    # Pages of newer searches are shown newest first, as the pages they lead back to
+    assert newer_keys == older_keys[-2::-1]
+    assert [has_more for _, has_more in newer] == [True, True, False]
+
+
+def test_no_history():
+    async def scenario():
+        await prepare([])
+        return await get_history(USER)
+
+    assert asyncio.run(scenario()) == ([], False)
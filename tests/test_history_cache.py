@@ -0,0 +1,93 @@
+import asyncio
+from datetime import date, datetime, timedelta
+from unittest import mock
+
+from sqlalchemy import delete, insert
+
+from database import common
+from database.base import async_session, init_db
+from database.common import get_history
+from database.history_cache import HistoryCache, bump_history_versions, get_history_version, history_cache
+from database.history_writer import HistoryWriter
+from database.models import History, HistoryVersion
+
+USER = 21
+START = datetime(2026, 10, 1, 12, 0)
+
+
+def make_row(user_tg_id: int, minutes: int) -> dict:
+    return {'user_tg_id': user_tg_id, 'date_search': START + timedelta(minutes=minutes),
+            'enter_date': date(2026, 11, 1), 'exit_date': date(2026, 11, 3), 'city': 'Paris', 'adults': 1,
+            'command': '/lowprice'}
+
+
+async def prepare() -> None:
+    await init_db()
+    async with async_session() as session:
+        for model in (History, HistoryVersion):
+            await session.execute(delete(model).where(model.user_tg_id.in_([USER, USER + 1])))
+        await session.execute(insert(History), [make_row(USER, 0)])
+        await bump_history_versions(session, [USER])
+        await session.commit()
+
+
+async def versions() -> tuple[int, int]:
+    async with async_session() as session:
+        return await get_history_version(session, USER), await get_history_version(session, USER + 1)
+
+
+def test_write_bumps_only_the_version_of_its_users():
+    async def scenario():
+        await prepare()
+        before = await versions()
+        async with async_session() as session:
+            await bump_history_versions(session, [USER, USER])
+            await session.commit()
+        return before, await versions()
+
+    assert asyncio.run(scenario()) == ((1, 0), (2, 0))
+
+
+def test_page_read_with_an_old_version_is_not_used():
+    cache = HistoryCache(max_users=10)
+    cache.put(USER, 1, 'page', (['search'], False))
+    assert cache.get(USER, 1, 'page') == (['search'], False)
+    assert cache.get(USER, 2, 'page') is None
+    assert cache.stats['outdated'] == 1 and cache.stats['users'] == 0
+
+
+def test_write_of_another_process_invalidates_cached_history():
+    async def scenario():
+        await prepare()
+        first, _ = await get_history(USER)
+        hits = history_cache.hits
+        await get_history(USER)
+        cached = history_cache.hits - hits
+        # Another process writes the search, the local cache is not told about it
+        async with async_session() as session:
+            await session.execute(insert(History), [make_row(USER, 1)])
+            await bump_history_versions(session, [USER])
+            await session.commit()
+        outdated = history_cache.outdated
+        second, _ = await get_history(USER)
+        return len(first), cached, history_cache.outdated - outdated, len(second)
+
+    assert asyncio.run(scenario()) == (1, 1, 1, 2)
+
+
+def test_queued_search_is_flushed_before_the_history_is_read():
+    writer = HistoryWriter(flush_interval=60, batch_size=10, max_queue=10, queue_timeout=1)
+
+    async def scenario():
+        await prepare()
+        # Only the version stamp written with the flushed search can invalidate the cached page
+        with mock.patch.object(common, 'history_writer', writer), mock.patch.object(history_cache, 'invalidate'):
+            await writer.start()
+            first, _ = await get_history(USER)
+            await writer.add(make_row(USER, 1))
+            queued = writer.stats['queue_depth']
+            second, _ = await get_history(USER)
+            await writer.close()
+        return len(first), queued, len(second), writer.stats['written'], await versions()
+
+    assert asyncio.run(scenario()) == (1, 1, 2, 1, (2, 0))
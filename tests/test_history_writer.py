@@ -0,0 +1,98 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from unittest import mock
+
+from sqlalchemy import delete, func, select
+
+from database import history_writer as history_writer_module
+from database.base import async_session, init_db
+from database.history_writer import HistoryWriter
+from database.models import History
+
+USER = 22
+
+
+def make_params(user_tg_id: int) -> dict:
+    return {'user_tg_id': user_tg_id, 'date_search': datetime.now(), 'enter_date': date(2026, 11, 1),
+            'exit_date': date(2026, 11, 3), 'city': 'Paris', 'adults': 1, 'command': '/lowprice'}
+
+
+async def prepare() -> None:
+    await init_db()
+    async with async_session() as session:
+        await session.execute(delete(History).where(History.user_tg_id.in_([USER, USER + 1])))
+        await session.commit()
+
+
+async def written(user_tg_id: int) -> int:
+    async with async_session() as session:
+        return await session.scalar(select(func.count()).select_from(History)
+                                    .filter(History.user_tg_id == user_tg_id))
+
+
+def test_record_is_dropped_when_queue_stays_full():
+    writer = HistoryWriter(flush_interval=60, batch_size=10, max_queue=1, queue_timeout=0.05)
+
+    async def scenario():
+        await prepare()
+        await writer.start()
+        # The database is down, the queued record can not be written
+        with mock.patch.object(history_writer_module, 'async_session', side_effect=ConnectionError):
+            await writer.add(make_params(USER))
+            await asyncio.wait_for(writer.add(make_params(USER + 1)), timeout=1)
+            stats = writer.stats
+        await writer.close()
+        return stats, await written(USER), await written(USER + 1)
+
+    stats, first, second = asyncio.run(scenario())
+    assert stats['queue_depth'] == 1 and stats['blocked'] == 1 and stats['dropped'] == 1
+    assert stats['failed'] >= 1
+    assert (first, second) == (1, 0)
+
+
+def test_record_waits_for_space_in_queue():
+    writer = HistoryWriter(flush_interval=60, batch_size=10, max_queue=1, queue_timeout=1)
+
+    async def scenario():
+        await prepare()
+        await writer.start()
+        await writer.add(make_params(USER))
+        await writer.add(make_params(USER + 1))
+        stats = writer.stats
+        pending = writer.has_pending(USER + 1)
+        await writer.close()
+        return stats, pending, await written(USER), await written(USER + 1)
+
+    stats, pending, first, second = asyncio.run(scenario())
+    assert stats['blocked'] == 1 and stats['dropped'] == 0 and stats['written'] == 1
+    assert pending
+    assert (first, second) == (1, 1)
+
+
+def test_close_waits_for_the_flush_in_progress():
+    writer = HistoryWriter(flush_interval=0.01, batch_size=10, max_queue=10, queue_timeout=1)
+    started = asyncio.Event()
+
+    @asynccontextmanager
+    async def slow_session():
+        started.set()
+        await asyncio.sleep(0.05)
+        async with async_session() as session:
+            yield session
+
+    async def scenario():
+        await prepare()
+        with mock.patch.object(history_writer_module, 'async_session', slow_session):
+            await writer.start()
+            await writer.add(make_params(USER))
+            await writer.add(make_params(USER))
+            await asyncio.wait_for(started.wait(), timeout=1)
+            await writer.close()
+        running = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        return writer.stats, await written(USER), running
+
+    stats, count, running = asyncio.run(scenario())
+    assert running == []
+    assert count == 2
+    assert stats['queue_depth'] == 0 and stats['written'] == 2 and stats['failed'] == 0
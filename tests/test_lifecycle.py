@@ -0,0 +1,48 @@
+import asyncio
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message, Update
+
+from middlewares.drain import InFlightMiddleware
+from server.lifecycle import Lifecycle
+
+
+def make_update(update_id: int, text: str) -> Update:
+    return Update.model_validate({'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'text': text, 'chat': {'id': 1, 'type': 'private'},
+        'from': {'id': 1, 'is_bot': False, 'first_name': 'a'}}})
+
+
+def test_drain_cancels_handlers_after_deadline_and_rejects_new_updates():
+    handled = []
+
+    async def scenario():
+        lifecycle = Lifecycle(drain_timeout=0.05, warm_timeout=1)
+        dp = Dispatcher()
+        dp.update.outer_middleware(InFlightMiddleware(lifecycle))
+        router = Router()
+
+        @router.message()
+        async def record(message: Message) -> None:
+            handled.append(('start', message.text))
+            await asyncio.sleep(0.01 if message.text == 'fast' else 10)
+            handled.append(('end', message.text))
+
+        dp.include_router(router)
+        bot = Bot('123456:TEST')
+        fast = asyncio.create_task(dp.feed_update(bot, make_update(1, 'fast')))
+        slow = asyncio.create_task(dp.feed_update(bot, make_update(2, 'slow')))
+        await asyncio.sleep(0)
+        await lifecycle.drain()
+        assert fast.done() and not fast.cancelled()
+        assert slow.cancelled()
+        await dp.feed_update(bot, make_update(3, 'late'))
+        await bot.session.close()
+        return lifecycle.stats
+
+    stats = asyncio.run(scenario())
+    assert handled == [('start', 'fast'), ('start', 'slow'), ('end', 'fast')]
+    assert stats['in_flight'] == 0
+    assert stats['abandoned'] == 1
+    assert stats['rejected'] == 1
+    assert stats['draining'] is True
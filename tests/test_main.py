@@ -0,0 +1,25 @@
+import pytest
+
+import main
+from database.snapshots import snapshot_store
+from handlers.utils.prefetch import prefetcher
+from site_api.client import api_client
+from site_api.site_api_handler import cancel_refreshes
+from site_api.warmer import cache_warmer
+
+
+@pytest.fixture(scope='module')
+def hooks() -> list:
+    dp = main.create_dispatcher()
+    return [handler.callback for handler in dp.shutdown.handlers]
+
+
+def test_api_users_stop_before_the_api_client_is_closed(hooks):
+    client_closed = hooks.index(api_client.close)
+    for hook in (prefetcher.close, cancel_refreshes, cache_warmer.close, snapshot_store.close):
+        assert hooks.index(hook) < client_closed
+
+
+def test_updates_drain_first_and_storage_closes_once(hooks):
+    assert hooks[0] == main.lifecycle.drain
+    assert sum(getattr(hook, '__qualname__', '') == 'SpillStorage.close' for hook in hooks) == 1
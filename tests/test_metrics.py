@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from server.metrics import Histogram, MetricsRegistry, HandlerContext, current_handler, format_labels, NULL_SPAN
+
+
+def test_histogram_buckets_are_upper_bounds():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.count == 4
+    assert histogram.sum == pytest.approx(2.65)
+
+
+def test_format_labels_escapes_values():
+    assert format_labels(('a', 'b'), ('x"y', 'line\\\nbreak')) == 'a="x\\"y",b="line\\\\\\nbreak"'
+
+
+def test_render_histogram_is_cumulative():
+    registry = MetricsRegistry(enabled=True, buckets=(0.1, 1.0))
+    context = HandlerContext(handler='lowprice', command='/lowprice', state='')
+    registry.observe_handler(context, 0.05, None)
+    registry.observe_handler(context, 0.5, ValueError())
+    registry.observe_handler(context, 5.0, None)
+    lines = registry.render().splitlines()
+    labels = 'handler="lowprice",command="/lowprice",state=""'
+    assert '# TYPE bot_handler_duration_seconds histogram' in lines
+    assert f'bot_handler_duration_seconds_bucket{{{labels},le="0.1"}} 1' in lines
+    assert f'bot_handler_duration_seconds_bucket{{{labels},le="1.0"}} 2' in lines
+    assert f'bot_handler_duration_seconds_bucket{{{labels},le="+Inf"}} 3' in lines
+    assert f'bot_handler_duration_seconds_count{{{labels}}} 3' in lines
+    assert f'bot_handler_errors_total{{{labels},error="ValueError"}} 1' in lines
+
+
+def test_span_is_attributed_to_the_handler_and_counts_errors():
+    registry = MetricsRegistry(enabled=True, buckets=(1.0,))
+    token = current_handler.set(HandlerContext(handler='history'))
+    try:
+        with registry.span('db', 'get_history'):
+            pass
+        with pytest.raises(KeyError):
+            with registry.span('db', 'get_history'):
+                raise KeyError
+    finally:
+        current_handler.reset(token)
+    assert registry.span_latency[('db', 'get_history', 'history')].count == 2
+    assert registry.span_errors == {('db', 'get_history', 'history', 'KeyError'): 1}
+
+
+def test_cancelled_span_is_timed_but_not_an_error():
+    registry = MetricsRegistry(enabled=True, buckets=(1.0,))
+
+    @registry.timed('api')
+    async def request():
+        await asyncio.sleep(10)
+
+    async def scenario():
+        task = asyncio.create_task(request())
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert registry.span_latency[('api', 'request', '')].count == 1
+    assert registry.span_errors == {}
+
+
+def test_disabled_registry_does_nothing():
+    registry = MetricsRegistry(enabled=False, buckets=(1.0,))
+
+    async def request():
+        return 1
+
+    assert registry.timed('api')(request) is request
+    assert registry.span('db', 'query') is NULL_SPAN
+
+
+def test_registered_stats_are_rendered_as_gauges():
+    registry = MetricsRegistry(enabled=True, buckets=(1.0,))
+    registry.register_stats('api_limiter', lambda: {'queue_depth': 3, 'tokens': 1.5, 'monthly_quota': float('inf'),
+                                                    'last_report': None, 'state': 'open', 'draining': True})
+    lines = registry.render().splitlines()
+    assert '# TYPE bot_api_limiter_queue_depth gauge' in lines
+    assert 'bot_api_limiter_queue_depth 3.0' in lines
+    assert 'bot_api_limiter_tokens 1.5' in lines
+    assert 'bot_api_limiter_monthly_quota +Inf' in lines
+    assert 'bot_api_limiter_state{value="open"} 1' in lines
+    assert 'bot_api_limiter_draining 1.0' in lines
+    assert not any('last_report' in line for line in lines)
@@ -0,0 +1,31 @@
+from aiogram.types import Update
+
+from middlewares.metrics import update_command
+
+
+def message_update(text: str) -> Update:
+    return Update.model_validate({'update_id': 1, 'message': {
+        'message_id': 1, 'date': 0, 'text': text, 'chat': {'id': 1, 'type': 'private'},
+        'from': {'id': 1, 'is_bot': False, 'first_name': 'a'}}})
+
+
+def callback_update(data: str) -> Update:
+    return Update.model_validate({'update_id': 1, 'callback_query': {
+        'id': '1', 'chat_instance': '1', 'data': data, 'from': {'id': 1, 'is_bot': False, 'first_name': 'a'}}})
+
+
+def test_known_commands_are_labels():
+    assert update_command(message_update('/lowprice')) == '/lowprice'
+    assert update_command(message_update('/history@hotel_bot')) == '/history'
+    assert update_command(message_update('/start')) == '/start'
+
+
+def test_unknown_commands_share_one_label():
+    assert update_command(message_update('/anything')) == 'other'
+    assert update_command(message_update('/drop table')) == 'other'
+
+
+def test_text_and_callbacks():
+    assert update_command(message_update('Paris')) == 'text'
+    assert update_command(callback_update('more_results')) == 'more_results'
+    assert update_command(callback_update('1234')) == 'callback'
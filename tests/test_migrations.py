@@ -0,0 +1,17 @@
+from sqlalchemy import create_engine, inspect, text
+
+from database.base import migrate_history_filters
+
+
+def test_history_filter_columns_are_added_once():
+    engine = create_engine('sqlite://')
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE history (id INTEGER PRIMARY KEY, city VARCHAR, max_price INTEGER)'))
+        conn.execute(text("INSERT INTO history (city, max_price) VALUES ('Paris', 100)"))
+        migrate_history_filters(conn)
+        migrate_history_filters(conn)
+        columns = {column['name']: column for column in inspect(conn).get_columns('history')}
+        row = conn.execute(text('SELECT min_price, min_rating, min_beds FROM history')).one()
+    assert {'min_price', 'min_rating', 'min_beds'} <= set(columns)
+    assert all(columns[name]['nullable'] for name in ('min_price', 'min_rating', 'min_beds'))
+    assert tuple(row) == (None, None, None)
@@ -0,0 +1,57 @@
+import asyncio
+from dataclasses import FrozenInstanceError
+from unittest import mock
+
+import pytest
+
+from site_api import site_api_handler
+from site_api.models import Listing, parse_response
+
+RESULT = {
+    'id': 123, 'name': 'Flat', 'beds': 2, 'address': 'Paris', 'rating': 4.8, 'deeplink': 'https://airbnb.com/rooms/123',
+    'price': {'total': 250, 'currency': 'EUR', 'priceItems': [{'title': 'Cleaning fee', 'amount': 30}]},
+    'images': ['https://img/1.jpg', 'https://img/2.jpg', 'https://img/3.jpg', 'https://img/4.jpg'],
+    'hostThumbnail': 'https://img/host.jpg', 'previewAmenities': ['Wifi'], 'cancelPolicy': 'FLEXIBLE',
+}
+
+
+def test_only_shown_fields_are_kept():
+    listing = Listing.from_api(RESULT)
+    assert listing == Listing(id='123', name='Flat', beds=2, address='Paris', price=250, currency='EUR', rating=4.8,
+                              deeplink='https://airbnb.com/rooms/123',
+                              images=('https://img/1.jpg', 'https://img/2.jpg', 'https://img/3.jpg'))
+    assert not hasattr(listing, '__dict__')
+    with pytest.raises(FrozenInstanceError):
+        listing.price = 1
+
+
+def test_missing_optional_fields_have_defaults():
+    result = {key: value for key, value in RESULT.items() if key not in ('id', 'beds', 'address', 'rating', 'images')}
+    listing = Listing.from_api(result)
+    assert (listing.id, listing.beds, listing.address, listing.rating, listing.images) == \
+        ('https://airbnb.com/rooms/123', 0, '', 0, ())
+
+
+def test_malformed_results_are_skipped():
+    response = {'error': False, 'results': [RESULT, {'name': 'No price', 'deeplink': 'x'},
+                                            dict(RESULT, price=None), dict(RESULT, id=7)]}
+    parsed = parse_response(response)
+    assert parsed['error'] is False
+    assert [listing.id for listing in parsed['results']] == ['123', '7']
+
+
+def test_error_response():
+    assert parse_response({'error': True, 'message': 'Bad location'}) == {'error': True, 'message': 'Bad location'}
+    assert parse_response({})['error'] is True
+    assert parse_response({'error': False, 'results': None}) == {'error': False, 'results': []}
+
+
+def test_user_request_returns_listings():
+    params = {'city': 'Paris', 'enter_date': '2026-11-01', 'exit_date': '2026-11-03', 'adults': 2}
+
+    async def get_json(path, querystring):
+        return {'error': False, 'results': [RESULT]}
+
+    with mock.patch.object(site_api_handler.api_client, 'get_json', side_effect=get_json):
+        response = asyncio.run(site_api_handler.user_request(params))
+    assert response['results'] == [Listing.from_api(RESULT)]
@@ -0,0 +1,130 @@
+import asyncio
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import SendMediaGroup
+from sqlalchemy import delete, select
+
+from database import photo_cache as photo_cache_module
+from database.base import async_session, init_db
+from database.models import PhotoFileId
+from database.photo_cache import PhotoCache
+from handlers.utils import utils
+from handlers.utils.cards import CardRenderer
+from site_api.models import Listing
+
+LISTING = Listing(id='1', name='Flat', beds=2, address='Paris', price=100, currency='USD', rating=4.5,
+                  deeplink='https://airbnb.com/rooms/1', images=('https://img/1.jpg', 'https://img/2.jpg'))
+
+
+async def prepare() -> None:
+    await init_db()
+    async with async_session() as session:
+        await session.execute(delete(PhotoFileId))
+        await session.commit()
+
+
+async def saved() -> dict[str, str]:
+    async with async_session() as session:
+        return dict((await session.execute(select(PhotoFileId.url, PhotoFileId.file_id))).all())
+
+
+def test_file_ids_are_kept_in_memory_with_lru_eviction():
+    cache = PhotoCache(max_size=2, flush_interval=60)
+    cache.remember('a', 'file-a')
+    cache.remember('b', 'file-b')
+    assert cache.get('a') == 'file-a'
+    cache.remember('c', 'file-c')
+    assert cache.get('b') is None
+    assert cache.get('c') == 'file-c'
+    assert cache.stats['hits'] == 2 and cache.stats['misses'] == 1 and cache.stats['size'] == 2
+
+
+def test_file_ids_are_loaded_after_a_restart():
+    async def scenario():
+        await prepare()
+        cache = PhotoCache(max_size=2, flush_interval=60)
+        for url in ('a', 'b', 'c'):
+            cache.remember(url, f'file-{url}')
+        await cache.flush()
+        restarted = PhotoCache(max_size=2, flush_interval=60)
+        await restarted.start()
+        await restarted.close()
+        return await saved(), restarted.get('b'), restarted.get('c')
+
+    rows, file_b, file_c = asyncio.run(scenario())
+    assert rows == {'b': 'file-b', 'c': 'file-c'}
+    assert (file_b, file_c) == ('file-b', 'file-c')
+
+
+def test_rejected_file_id_is_deleted():
+    async def scenario():
+        await prepare()
+        cache = PhotoCache(max_size=10, flush_interval=60)
+        cache.remember('a', 'file-a')
+        cache.remember('b', 'file-b')
+        await cache.flush()
+        cache.invalidate('a')
+        await cache.flush()
+        return await saved(), cache.stats['invalidated']
+
+    assert asyncio.run(scenario()) == ({'b': 'file-b'}, 1)
+
+
+def test_failed_flush_keeps_the_writes():
+    cache = PhotoCache(max_size=10, flush_interval=60)
+
+    async def scenario():
+        await prepare()
+        cache.remember('a', 'file-a')
+        cache.invalidate('b')
+        with mock.patch.object(photo_cache_module, 'async_session', side_effect=ConnectionError):
+            with pytest.raises(ConnectionError):
+                await cache.flush()
+        pending = cache.stats['pending_writes']
+        await cache.flush()
+        return pending, await saved()
+
+    assert asyncio.run(scenario()) == (1, {'a': 'file-a'})
+
+
+def sent_photo(file_id: str) -> SimpleNamespace:
+    return SimpleNamespace(photo=[SimpleNamespace(file_id=f'{file_id}-small'), SimpleNamespace(file_id=file_id)])
+
+
+def test_uploaded_photos_are_sent_by_file_id_next_time():
+    cache = PhotoCache(max_size=10, flush_interval=60)
+    message = SimpleNamespace(answer_media_group=mock.AsyncMock(return_value=[sent_photo('file-1'),
+                                                                             sent_photo('file-2')]))
+
+    async def scenario():
+        with mock.patch.object(utils, 'photo_cache', cache), \
+                mock.patch.object(utils, 'card_renderer', CardRenderer(max_size=10)):
+            await utils.send_listing(message, LISTING)
+            await utils.send_listing(message, LISTING)
+
+    asyncio.run(scenario())
+    first, second = (call.kwargs['media'] for call in message.answer_media_group.await_args_list)
+    assert [item.media for item in first] == list(LISTING.images)
+    assert [item.media for item in second] == ['file-1', 'file-2']
+
+
+def test_rejected_file_ids_are_replaced_by_urls():
+    cache = PhotoCache(max_size=10, flush_interval=60)
+    cache.remember(LISTING.images[0], 'expired')
+    rejected = TelegramBadRequest(method=SendMediaGroup(chat_id=1, media=[]), message='wrong file identifier')
+    message = SimpleNamespace(answer_media_group=mock.AsyncMock(
+        side_effect=[rejected, [sent_photo('file-1'), sent_photo('file-2')]]))
+
+    async def scenario():
+        with mock.patch.object(utils, 'photo_cache', cache), \
+                mock.patch.object(utils, 'card_renderer', CardRenderer(max_size=10)):
+            await utils.send_listing(message, LISTING)
+
+    asyncio.run(scenario())
+    retry = message.answer_media_group.await_args_list[1].kwargs['media']
+    assert [item.media for item in retry] == list(LISTING.images)
+    assert cache.get(LISTING.images[0]) == 'file-1'
+    assert cache.stats['invalidated'] == 1
@@ -0,0 +1,28 @@
+import shutil
+
+from server import pool
+from server.pool import WorkerPool
+
+
+def make_pool(size: int) -> WorkerPool:
+    worker_pool = WorkerPool(size)
+    shutil.rmtree(worker_pool.socket_dir)
+    return worker_pool
+
+
+def test_warming_budget_is_split_between_every_worker(monkeypatch):
+    monkeypatch.setattr(pool, 'WARM_DAILY_BUDGET', 100)
+    budgets = [int(worker.env['WARM_DAILY_BUDGET']) for worker in make_pool(3).workers]
+    assert budgets == [34, 33, 33]
+
+
+def test_retention_runs_only_in_the_first_worker():
+    workers = make_pool(2).workers
+    assert workers[0].env.get('RETENTION_INTERVAL') != '0'
+    assert workers[1].env['RETENTION_INTERVAL'] == '0'
+
+
+def test_updates_of_one_chat_go_to_one_worker():
+    worker_pool = make_pool(4)
+    update = {'update_id': 1, 'message': {'chat': {'id': 42}}}
+    assert worker_pool.shard(update) is worker_pool.shard({**update, 'update_id': 2})
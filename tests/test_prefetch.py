@@ -0,0 +1,111 @@
+import asyncio
+from types import SimpleNamespace
+
+from handlers.utils.prefetch import Prefetcher
+from middlewares.prefetch import CancelPrefetchMiddleware
+
+
+def page(value, delay: float = 0.0, started: list = None):
+    async def prepare():
+        if started is not None:
+            started.append(value)
+        await asyncio.sleep(delay)
+        return value
+    return prepare
+
+
+def test_prepared_page_is_taken_once():
+    prefetcher = Prefetcher(max_chats=10)
+
+    async def scenario():
+        prefetcher.schedule(1, ('search', 3), page('page 2', delay=0.01))
+        return await prefetcher.take(1, ('search', 3)), await prefetcher.take(1, ('search', 3))
+
+    assert asyncio.run(scenario()) == ('page 2', None)
+    assert prefetcher.stats['hits'] == 1 and prefetcher.stats['misses'] == 1
+
+
+def test_other_page_cancels_the_prefetch():
+    prefetcher = Prefetcher(max_chats=10)
+
+    async def scenario():
+        prefetcher.schedule(1, ('search', 3), page('page 2', delay=1))
+        await asyncio.sleep(0)
+        return await prefetcher.take(1, ('other', 3))
+
+    assert asyncio.run(scenario()) is None
+    assert prefetcher.stats['cancelled'] == 1 and prefetcher.stats['misses'] == 1
+
+
+def test_new_prefetch_replaces_the_previous_one_of_the_chat():
+    prefetcher = Prefetcher(max_chats=10)
+
+    async def scenario():
+        prefetcher.schedule(1, ('search', 3), page('page 2', delay=1))
+        prefetcher.schedule(1, ('search', 6), page('page 3'))
+        return await prefetcher.take(1, ('search', 6))
+
+    assert asyncio.run(scenario()) == 'page 3'
+    assert prefetcher.stats['cancelled'] == 1
+
+
+def test_oldest_chat_is_dropped_above_the_limit():
+    prefetcher = Prefetcher(max_chats=2)
+
+    async def scenario():
+        for chat_id in (1, 2, 3):
+            prefetcher.schedule(chat_id, 'page', page(chat_id, delay=0.01))
+        return [await prefetcher.take(chat_id, 'page') for chat_id in (1, 2, 3)]
+
+    assert asyncio.run(scenario()) == [None, 2, 3]
+
+
+def test_failed_prefetch_is_a_miss():
+    prefetcher = Prefetcher(max_chats=10)
+
+    async def fail():
+        raise ConnectionError
+
+    async def scenario():
+        prefetcher.schedule(1, 'page', fail)
+        return await prefetcher.take(1, 'page')
+
+    assert asyncio.run(scenario()) is None
+    assert prefetcher.stats['failed'] == 1
+
+
+def test_close_stops_every_prefetch():
+    prefetcher = Prefetcher(max_chats=10)
+
+    async def scenario():
+        started = []
+        for chat_id in (1, 2):
+            prefetcher.schedule(chat_id, 'page', page(chat_id, delay=10, started=started))
+        await asyncio.sleep(0)
+        await asyncio.wait_for(prefetcher.close(), timeout=1)
+        return started, prefetcher.stats
+
+    started, stats = asyncio.run(scenario())
+    assert started == [1, 2]
+    assert stats['running'] == 0 and stats['cancelled'] == 2
+
+
+def test_command_cancels_the_prefetch_of_the_chat():
+    prefetcher = Prefetcher(max_chats=10)
+    middleware = CancelPrefetchMiddleware(prefetcher)
+
+    async def handler(event, data):
+        return 'handled'
+
+    def message(text: str) -> SimpleNamespace:
+        return SimpleNamespace(text=text, chat=SimpleNamespace(id=1))
+
+    async def scenario():
+        prefetcher.schedule(1, 'page', page('page 2', delay=1))
+        await middleware(handler, message('Paris'), {})
+        running = prefetcher.stats['running']
+        result = await middleware(handler, message('/lowprice'), {})
+        return running, result, await prefetcher.take(1, 'page')
+
+    assert asyncio.run(scenario()) == (1, 'handled', None)
+    assert prefetcher.stats['cancelled'] == 1
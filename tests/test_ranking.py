@@ -0,0 +1,80 @@
+import pytest
+
+from handlers.utils.ranking import Ranking, RANKING_KEYS
+from site_api.models import Listing
+
+
+def make_listing(number: int, price: float, rating: float = 4.5) -> Listing:
+    return Listing(id=str(number), name=f'Flat {number}', beds=1, address='', price=price, currency='USD',
+                   rating=rating, deeplink='', images=())
+
+
+def make_ranking(key, sort_below: int) -> Ranking:
+    ranking = Ranking(key)
+    ranking.sort_below = sort_below
+    return ranking
+
+
+# The default sorted list and a heap from the first item
+MODES = pytest.mark.parametrize('sort_below', [Ranking.sort_below, 0])
+
+
+@MODES
+def test_take_zero_takes_nothing(sort_below):
+    ranking = make_ranking(RANKING_KEYS['/lowprice'], sort_below)
+    ranking.extend([make_listing(1, 100), make_listing(2, 50)])
+    assert ranking.take(0) == []
+    assert len(ranking) == 2
+
+
+@MODES
+def test_take_more_than_available(sort_below):
+    ranking = make_ranking(RANKING_KEYS['/lowprice'], sort_below)
+    ranking.extend([make_listing(1, 100), make_listing(2, 50)])
+    assert [listing.id for listing in ranking.take(5)] == ['2', '1']
+    assert ranking.take(1) == []
+    with pytest.raises(IndexError):
+        ranking.pop()
+
+
+@MODES
+def test_ties_keep_insertion_order(sort_below):
+    ranking = make_ranking(RANKING_KEYS['/lowprice'], sort_below)
+    ranking.extend([make_listing(1, 100), make_listing(2, 100), make_listing(3, 50)])
+    ranking.extend([make_listing(4, 100), make_listing(5, 50)])
+    assert [listing.id for listing in ranking.take(5)] == ['3', '5', '1', '2', '4']
+
+
+@MODES
+def test_second_key_breaks_ties(sort_below):
+    ranking = make_ranking(RANKING_KEYS['/highprice'], sort_below)
+    ranking.extend([make_listing(1, 100, rating=4.0), make_listing(2, 200, rating=3.0),
+                    make_listing(3, 100, rating=4.8)])
+    assert [listing.id for listing in ranking.take(3)] == ['2', '3', '1']
+
+
+@MODES
+def test_without_key_keeps_insertion_order(sort_below):
+    ranking = make_ranking(None, sort_below)
+    ranking.extend(['b', 'a'])
+    ranking.extend(['c'])
+    assert ranking.take(3) == ['b', 'a', 'c']
+
+
+@MODES
+def test_keys_computed_in_advance(sort_below):
+    ranking = make_ranking(None, sort_below)
+    ranking.extend(['low', 'high', 'tie'], keys=[(-0.2,), (-0.9,), (-0.2,)])
+    assert ranking.take(3) == ['high', 'low', 'tie']
+
+
+@pytest.mark.parametrize('keys', [None, [(number % 3,) for number in range(8)]])
+def test_order_is_kept_when_the_ranking_grows_into_a_heap(keys):
+    key = None if keys else RANKING_KEYS['/lowprice']
+    listings = [make_listing(number, number % 3 * 10) for number in range(8)]
+    expected = sorted(listings, key=lambda listing: int(listing.price))
+    ranking = make_ranking(key, 6)
+    ranking.extend(listings[:4], keys=keys and keys[:4])
+    assert ranking.pop() == expected[0]
+    ranking.extend(listings[4:], keys=keys and keys[4:])
+    assert ranking.take(8) == expected[1:]
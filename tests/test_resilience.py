@@ -0,0 +1,144 @@
+import asyncio
+from unittest import mock
+
+import pytest
+
+from site_api import resilience
+from site_api.client import ApiError
+from site_api.resilience import CircuitBreaker, CircuitOpenError, call_with_retry, CLOSED, OPEN, HALF_OPEN
+
+
+def failing(*errors):
+    calls = []
+
+    async def func():
+        calls.append(1)
+        error = errors[min(len(calls), len(errors)) - 1]
+        if error is not None:
+            raise error
+        return 'ok'
+
+    return func, calls
+
+
+def call(func, breaker, retries=0):
+    return asyncio.run(call_with_retry(func, breaker, retries=retries, backoff=0.001, attempt_timeout=1,
+                                       deadline=5))
+
+
+def open_breaker() -> CircuitBreaker:
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    breaker.record_failure()
+    breaker.record_failure()
+    return breaker
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.rejected == 1
+
+
+def test_open_breaker_lets_one_probe_through_after_timeout():
+    breaker = open_breaker()
+    with mock.patch.object(resilience.time, 'monotonic', return_value=breaker.opened_at + 11):
+        assert breaker.allow()
+        assert breaker.state == HALF_OPEN
+        assert not breaker.allow()
+
+
+def test_successful_probe_closes_breaker():
+    breaker = open_breaker()
+    with mock.patch.object(resilience.time, 'monotonic', return_value=breaker.opened_at + 11):
+        breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.failures == 0
+
+
+def test_failed_probe_opens_breaker_again():
+    breaker = open_breaker()
+    with mock.patch.object(resilience.time, 'monotonic', return_value=breaker.opened_at + 11):
+        breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == OPEN
+
+
+def test_retryable_errors_are_retried():
+    func, calls = failing(ApiError(503, 'busy'), ApiError(500, 'error'), None)
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=10)
+    assert call(func, breaker, retries=2) == 'ok'
+    assert len(calls) == 3
+    assert breaker.failures == 0
+
+
+def test_retries_are_bounded():
+    func, calls = failing(ApiError(503, 'busy'))
+    breaker = CircuitBreaker(failure_threshold=10, reset_timeout=10)
+    with pytest.raises(ApiError):
+        call(func, breaker, retries=2)
+    assert len(calls) == 3
+    assert breaker.failures == 3
+
+
+def test_non_retryable_error_is_not_retried_and_keeps_failures():
+    func, calls = failing(ApiError(404, 'not found'))
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=10)
+    breaker.record_failure()
+    with pytest.raises(ApiError):
+        call(func, breaker, retries=2)
+    assert len(calls) == 1
+    assert breaker.failures == 1
+
+
+def test_non_retryable_error_does_not_close_half_open_breaker():
+    breaker = open_breaker()
+    func, _ = failing(ApiError(400, 'bad request'))
+    with mock.patch.object(resilience.time, 'monotonic', return_value=breaker.opened_at + 11):
+        with pytest.raises(ApiError):
+            call(func, breaker)
+        assert breaker.state == HALF_OPEN
+        assert breaker.allow()
+
+
+def test_open_breaker_fails_fast():
+    breaker = open_breaker()
+    func, calls = failing(None)
+    with pytest.raises(CircuitOpenError):
+        call(func, breaker)
+    assert not calls
+
+
+def test_open_breaker_takes_no_limiter_token():
+    breaker = open_breaker()
+    func, calls = failing(None)
+    tokens = []
+
+    async def acquire():
+        tokens.append(1)
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(call_with_retry(func, breaker, retries=0, backoff=0.001, attempt_timeout=1, deadline=5,
+                                    before_attempt=acquire))
+    assert not tokens and not calls
+    assert breaker.rejected == 1
+
+
+def test_probe_is_released_when_the_limiter_rejects_the_call():
+    breaker = open_breaker()
+    func, calls = failing(None)
+
+    async def acquire():
+        raise RuntimeError('queue is full')
+
+    with mock.patch.object(resilience.time, 'monotonic', return_value=breaker.opened_at + 11):
+        with pytest.raises(RuntimeError):
+            asyncio.run(call_with_retry(func, breaker, retries=0, backoff=0.001, attempt_timeout=1, deadline=5,
+                                        before_attempt=acquire))
+        assert breaker.state == HALF_OPEN
+        assert breaker.allow()
+    assert not calls
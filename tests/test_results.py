@@ -0,0 +1,147 @@
+import asyncio
+from unittest import mock
+
+from handlers.utils import results
+from handlers.utils.results import ResultStore, ResultSet, make_result_key
+from site_api import stream as stream_module
+from site_api.models import Listing
+from site_api.stream import SearchStream
+
+PARAMS = {'city': 'Paris', 'enter_date': '2026-11-01', 'exit_date': '2026-11-03', 'adults': 2}
+
+
+def make_listing(number: int, price: int) -> Listing:
+    return Listing(id=str(number), name=f'Flat {number}', beds=1, address='', price=price, currency='USD',
+                   rating=4.5, deeplink=f'https://airbnb.com/rooms/{number}', images=())
+
+
+def make_stream(stale: bool = False) -> SearchStream:
+    stream = SearchStream(PARAMS, pages=1)
+    stream.results = [make_listing(1, 300), make_listing(2, 100)]
+    stream.exhausted = True
+    stream.stale = stale
+    return stream
+
+
+def test_result_set_expires_after_ttl_from_creation():
+    store = ResultStore(ttl=10, max_size=10)
+    with mock.patch.object(results.time, 'monotonic', return_value=100.0):
+        cursor = store.open(make_stream(), '/lowprice')
+    with mock.patch.object(results.time, 'monotonic', return_value=105.0):
+        assert store.get(cursor.key) is not None
+    with mock.patch.object(results.time, 'monotonic', return_value=111.0):
+        assert store.get(cursor.key) is None
+
+
+def test_fresh_result_set_is_shared():
+    store = ResultStore(ttl=60, max_size=10)
+    first = store.open(make_stream(), '/lowprice')
+    second = store.open(make_stream(), '/lowprice')
+    assert first.key == second.key
+    assert store.hits == 1
+
+
+def test_stale_result_set_is_not_shared():
+    store = ResultStore(ttl=60, max_size=10)
+    stale = store.open(make_stream(stale=True), '/lowprice')
+    fresh = store.open(make_stream(), '/lowprice')
+    assert stale.key != fresh.key
+    assert fresh.key == make_result_key(PARAMS, '/lowprice', None)
+    assert store.get(stale.key).stale
+    assert not store.get(fresh.key).stale
+
+
+def test_stale_result_set_is_not_replaced_by_fresh_stale_search():
+    store = ResultStore(ttl=60, max_size=10)
+    first = store.open(make_stream(stale=True), '/lowprice')
+    second = store.open(make_stream(stale=True), '/lowprice')
+    assert first.key != second.key
+    assert store.hits == 0
+
+
+def test_snapshot_result_set_is_not_given_to_fresh_searches():
+    store = ResultStore(ttl=60, max_size=10)
+    key = make_result_key(PARAMS, '/lowprice', None)
+    snapshot_set = ResultSet(make_stream(), '/lowprice')
+    snapshot_set.from_snapshot = True
+    store.put(key, snapshot_set)
+    cursor = store.open(make_stream(), '/lowprice')
+    assert store.get(cursor.key) is not snapshot_set
+    assert store.hits == 0
+
+
+def test_queue_callback_is_not_shared_between_users():
+    calls = []
+
+    async def fake_request(params, page, priority, on_queued):
+        await on_queued(1)
+        return {'error': False, 'results': [make_listing(int(page), int(page) * 10)]}
+
+    def notifier(user):
+        async def notify(position):
+            calls.append(user)
+        return notify
+
+    async def scenario():
+        store = ResultStore(ttl=60, max_size=10)
+        stream = SearchStream(PARAMS, pages=3)
+        await stream.start(notifier('first'))
+        cursor = store.open(stream, '/lowprice')
+        shared = store.open(SearchStream(PARAMS, pages=3), '/lowprice')
+        assert shared.key == cursor.key
+        await store.resolve(shared).get(0, 3, notifier('second'))
+
+    with mock.patch.object(stream_module, 'cached_request', fake_request):
+        asyncio.run(scenario())
+    assert calls == ['first', 'second', 'second']
+
+
+def test_pages_are_loaded_only_when_needed():
+    requested = []
+
+    async def fake_request(params, page, priority, on_queued):
+        requested.append(int(page))
+        return {'error': False, 'results': [make_listing(int(page) * 10 + number, 100 - int(page) * 10 - number)
+                                            for number in range(3)]}
+
+    async def scenario():
+        result_set = ResultSet(SearchStream(PARAMS, pages=3), '/lowprice')
+        first = await result_set.get(0, 3)
+        assert requested == [1] and not result_set.exhausted
+        second = await result_set.get(3, 3)
+        assert requested == [1, 2]
+        third = await result_set.get(6, 3)
+        assert await result_set.get(9, 3) == []
+        return first, second, third
+
+    with mock.patch.object(stream_module, 'cached_request', fake_request):
+        pages = asyncio.run(scenario())
+    assert requested == [1, 2, 3]
+    assert [[listing.price for listing in page] for page in pages] == [[88, 89, 90], [78, 79, 80], [68, 69, 70]]
+
+
+def test_failed_page_is_loaded_again_by_next_call():
+    failures = {2}
+
+    async def fake_request(params, page, priority, on_queued):
+        if int(page) in failures:
+            failures.discard(int(page))
+            raise RuntimeError('connection reset')
+        return {'error': False, 'results': [make_listing(int(page), 100)]}
+
+    async def scenario():
+        stream = SearchStream(PARAMS, pages=3)
+        await stream.start()
+        try:
+            await stream.fetch_next()
+        except RuntimeError:
+            pass
+        assert stream.next_page == 2 and not stream.exhausted
+        await stream.fetch_next()
+        await stream.fetch_next()
+        return stream
+
+    with mock.patch.object(stream_module, 'cached_request', fake_request):
+        stream = asyncio.run(scenario())
+    assert [listing.id for listing in stream.results] == ['1', '2', '3']
+    assert stream.exhausted
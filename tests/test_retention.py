@@ -0,0 +1,153 @@
+import asyncio
+import gzip
+import json
+from datetime import datetime, timedelta
+from unittest import mock
+
+import pytest
+from sqlalchemy import delete, insert, select
+
+from database import retention
+from database.base import async_session, init_db
+from database.models import History
+from database.retention import RetentionJob
+
+
+def make_rows(user_tg_id: int, count: int, days_ago: int) -> list[dict]:
+    date_search = datetime.now() - timedelta(days=days_ago)
+    return [{'user_tg_id': user_tg_id, 'date_search': date_search + timedelta(minutes=number),
+             'enter_date': date_search.date(), 'exit_date': date_search.date(), 'city': 'Paris', 'adults': 1,
+             'command': '/lowprice'} for number in range(count)]
+
+
+async def prepare() -> None:
+    await init_db()
+    async with async_session() as session:
+        await session.execute(delete(History))
+        await session.execute(insert(History), make_rows(1, 5, 30) + make_rows(2, 2, 30) + make_rows(3, 4, 0))
+        await session.commit()
+
+
+async def remaining() -> dict[int, int]:
+    async with async_session() as session:
+        rows = await session.execute(select(History.user_tg_id))
+        counts: dict[int, int] = {}
+        for user_tg_id in rows.scalars():
+            counts[user_tg_id] = counts.get(user_tg_id, 0) + 1
+        return counts
+
+
+def read_archive_lines(path) -> list[dict]:
+    with gzip.open(path, 'rt', encoding='utf-8') as archive:
+        return [json.loads(line) for line in archive]
+
+
+def make_job(path) -> RetentionJob:
+    return RetentionJob(keep_last=2, keep_days=7, batch_size=2, batch_pause=0, interval=0,
+                        vacuum_interval=10 ** 9, archive_path=str(path))
+
+
+def test_old_searches_beyond_the_last_are_archived(tmp_path):
+    job = make_job(tmp_path / 'archive.jsonl.gz')
+
+    async def scenario():
+        await prepare()
+        report = await job.run()
+        return report, await remaining()
+
+    report, counts = asyncio.run(scenario())
+    assert report['rows_pruned'] == 3
+    assert counts == {1: 2, 2: 2, 3: 4}
+    archived = read_archive_lines(tmp_path / 'archive.jsonl.gz')
+    assert len(archived) == 3
+    assert {row['user_tg_id'] for row in archived} == {1}
+
+
+def test_expired_ids_are_selected_once_per_run(tmp_path):
+    job = make_job(tmp_path / 'archive.jsonl.gz')
+
+    async def scenario():
+        await prepare()
+        with mock.patch.object(job, '_expired_ids', wraps=job._expired_ids) as expired_ids:
+            await job.run()
+        return expired_ids.call_count
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_rows_are_not_deleted_when_the_archive_fails(tmp_path):
+    path = tmp_path / 'archive.jsonl.gz'
+    job = make_job(path)
+
+    def broken(*args):
+        raise OSError('disk full')
+
+    async def scenario():
+        await prepare()
+        with mock.patch.object(retention, 'append_archive', broken):
+            with pytest.raises(OSError):
+                await job.run()
+        counts = await remaining()
+        await job.run()
+        return counts, await remaining()
+
+    failed, counts = asyncio.run(scenario())
+    assert failed == {1: 5, 2: 2, 3: 4}
+    assert counts == {1: 2, 2: 2, 3: 4}
+    assert len(read_archive_lines(path)) == 3
+
+
+def test_rows_archived_before_a_failed_delete_are_kept_once(tmp_path):
+    path = tmp_path / 'archive.jsonl.gz'
+    job = make_job(path)
+
+    async def broken(session, user_ids):
+        raise OSError('database is locked')
+
+    async def scenario():
+        await prepare()
+        with mock.patch.object(retention, 'bump_history_versions', broken):
+            with pytest.raises(OSError):
+                await job.run()
+        counts = await remaining()
+        await job.run()
+        return counts, await remaining()
+
+    failed, counts = asyncio.run(scenario())
+    assert failed == {1: 5, 2: 2, 3: 4}
+    assert counts == {1: 2, 2: 2, 3: 4}
+    assert len(read_archive_lines(path)) == 3
+
+
+def test_batch_stopped_before_its_delete_is_archived_again_after_restart(tmp_path):
+    path = tmp_path / 'archive.jsonl.gz'
+
+    async def broken(session, user_ids):
+        raise asyncio.CancelledError
+
+    async def scenario():
+        await prepare()
+        with mock.patch.object(retention, 'bump_history_versions', broken):
+            with pytest.raises(asyncio.CancelledError):
+                await make_job(path).run()
+        await make_job(path).run()
+        return await remaining()
+
+    assert asyncio.run(scenario()) == {1: 2, 2: 2, 3: 4}
+    assert len(read_archive_lines(path)) == 5
+    archived = retention.read_archive(str(path))
+    assert len(archived) == 3
+    assert {row['user_tg_id'] for row in archived} == {1}
+
+
+def test_close_stops_the_periodic_run():
+    job = RetentionJob(keep_last=2, keep_days=7, batch_size=2, batch_pause=0, interval=60,
+                       vacuum_interval=10 ** 9, archive_path='unused')
+
+    async def scenario():
+        await job.start()
+        task = job._task
+        await job.close()
+        return task
+
+    assert asyncio.run(scenario()).cancelled()
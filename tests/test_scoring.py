@@ -0,0 +1,60 @@
+import asyncio
+from unittest import mock
+
+from handlers.utils.results import ResultSet
+from handlers.utils.scoring import CustomCriteria, rank_custom, score_custom
+from site_api import stream as stream_module
+from site_api.models import Listing
+from site_api.stream import SearchStream
+
+PARAMS = {'city': 'Paris', 'enter_date': '2026-11-01', 'exit_date': '2026-11-03', 'adults': 2}
+
+
+def make_listing(number: int, price: float, rating: float = 4.5, beds: int = 1) -> Listing:
+    return Listing(id=str(number), name=f'Flat {number}', beds=beds, address='', price=price, currency='USD',
+                   rating=rating, deeplink=f'https://airbnb.com/rooms/{number}', images=())
+
+
+def test_listings_are_filtered_by_every_criterion():
+    listings = [make_listing(1, 50), make_listing(2, 150), make_listing(3, 100, rating=3.0),
+                make_listing(4, 100, beds=0), make_listing(5, 250), make_listing(6, 100)]
+    criteria = CustomCriteria(max_price=200, min_price=80, min_rating=4, min_beds=1)
+    matching, _ = score_custom(listings, criteria, nights=2)
+    assert matching.tolist() == [1, 5]
+
+
+def test_best_deal_first():
+    listings = [make_listing(1, 180, rating=4.9), make_listing(2, 100, rating=4.9), make_listing(3, 100, rating=4.0)]
+    criteria = CustomCriteria(max_price=200)
+    assert rank_custom(listings, criteria, nights=2).tolist() == [1, 2, 0]
+
+
+def test_no_matching_listings():
+    matching, scores = score_custom([make_listing(1, 500)], CustomCriteria(max_price=100), nights=1)
+    assert matching.size == 0 and scores.size == 0
+
+
+def test_score_does_not_depend_on_other_listings():
+    criteria = CustomCriteria(max_price=300)
+    alone = score_custom([make_listing(1, 100)], criteria, nights=2)[1]
+    together = score_custom([make_listing(1, 100), make_listing(2, 290)], criteria, nights=2)[1]
+    assert alone[0] == together[0]
+
+
+def test_later_pages_are_ranked_together_with_loaded_ones():
+    pages = {1: [make_listing(1, 200, rating=4.0), make_listing(2, 150, rating=4.5)],
+             2: [make_listing(3, 50, rating=5.0), make_listing(4, 400)]}
+
+    async def fake_request(params, page, priority, on_queued):
+        return {'error': False, 'results': pages[int(page)]}
+
+    async def scenario():
+        result_set = ResultSet(SearchStream(PARAMS, pages=2), '/custom', CustomCriteria(max_price=300))
+        first = await result_set.get(0, 1)
+        rest = await result_set.get(1, 3)
+        return first, rest
+
+    with mock.patch.object(stream_module, 'cached_request', fake_request):
+        first, rest = asyncio.run(scenario())
+    assert [listing.id for listing in first] == ['2']
+    assert [listing.id for listing in rest] == ['3', '1']
@@ -0,0 +1,127 @@
+import asyncio
+import time
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import GetMe, SendMessage
+
+from middlewares.send_scheduler import SendScheduler, SendSchedulerMiddleware
+
+
+async def send(scheduler: SendScheduler, chat_id: int, log: list, media: bool = False) -> None:
+    async with scheduler.slot(chat_id, media=media):
+        log.append((chat_id, time.monotonic()))
+
+
+def test_requests_to_one_chat_are_spaced():
+    async def scenario():
+        scheduler = SendScheduler(global_rate=100, media_interval=0.2, message_interval=0.05)
+        log = []
+        await asyncio.gather(send(scheduler, 1, log), send(scheduler, 1, log), send(scheduler, 1, log, media=True),
+                             send(scheduler, 1, log))
+        await scheduler.close()
+        return [sent for _, sent in log]
+
+    times = asyncio.run(scenario())
+    gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+    assert gaps[0] >= 0.045 and gaps[1] >= 0.045
+    assert gaps[2] >= 0.19
+
+
+def test_chats_take_turns():
+    async def scenario():
+        scheduler = SendScheduler(global_rate=100, media_interval=0.05, message_interval=0.05)
+        log = []
+        busy = [asyncio.create_task(send(scheduler, 1, log)) for _ in range(3)]
+        await asyncio.sleep(0)
+        await send(scheduler, 2, log)
+        await asyncio.gather(*busy)
+        await scheduler.close()
+        return [chat_id for chat_id, _ in log]
+
+    # The second chat does not wait behind the whole queue of the first one
+    assert asyncio.run(scenario()).index(2) <= 1
+
+
+def test_global_rate_limits_all_chats():
+    async def scenario():
+        scheduler = SendScheduler(global_rate=20, media_interval=0, message_interval=0)
+        scheduler.tokens = 0
+        started = time.monotonic()
+        log = []
+        await asyncio.gather(*(send(scheduler, chat_id, log) for chat_id in range(3)))
+        await scheduler.close()
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) >= 0.14
+
+
+def test_retry_after_pauses_the_chat_and_repeats_the_request():
+    async def scenario():
+        scheduler = SendScheduler(global_rate=100, media_interval=0, message_interval=0)
+        middleware = SendSchedulerMiddleware(scheduler, max_retries=1)
+        method = SendMessage(chat_id=1, text='hi')
+        calls = []
+
+        async def make_request(bot, request):
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                raise TelegramRetryAfter(method=request, message='Flood control', retry_after=0.1)
+            return 'sent'
+
+        result = await middleware(make_request, None, method)
+        await scheduler.close()
+        return result, calls, scheduler.stats
+
+    result, calls, stats = asyncio.run(scenario())
+    assert result == 'sent'
+    assert calls[1] - calls[0] >= 0.095
+    assert stats['retry_after'] == 1 and stats['sent'] == 2
+
+
+def test_retry_after_is_raised_after_max_retries():
+    async def scenario():
+        scheduler = SendScheduler(global_rate=100, media_interval=0, message_interval=0)
+        middleware = SendSchedulerMiddleware(scheduler, max_retries=1)
+
+        async def make_request(bot, request):
+            raise TelegramRetryAfter(method=request, message='Flood control', retry_after=0)
+
+        try:
+            await middleware(make_request, None, SendMessage(chat_id=1, text='hi'))
+        finally:
+            await scheduler.close()
+
+    with pytest.raises(TelegramRetryAfter):
+        asyncio.run(scenario())
+
+
+def test_other_methods_are_not_scheduled():
+    async def scenario():
+        scheduler = SendScheduler(global_rate=100, media_interval=0, message_interval=0)
+        middleware = SendSchedulerMiddleware(scheduler, max_retries=1)
+
+        async def make_request(bot, request):
+            return 'me'
+
+        return await middleware(make_request, None, GetMe()), scheduler.stats['sent']
+
+    assert asyncio.run(scenario()) == ('me', 0)
+
+
+def test_close_fails_queued_requests():
+    async def scenario():
+        scheduler = SendScheduler(global_rate=100, media_interval=10, message_interval=10)
+        log = []
+        await send(scheduler, 1, log)
+        queued = [asyncio.create_task(send(scheduler, 1, log)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        assert scheduler.stats['queue_depth'] == 2
+        await scheduler.close()
+        results = await asyncio.wait_for(asyncio.gather(*queued, return_exceptions=True), timeout=1)
+        return results, len(log), scheduler.stats
+
+    results, sent, stats = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert sent == 1
+    assert stats['queue_depth'] == 0 and stats['chats_waiting'] == 0
@@ -0,0 +1,147 @@
+import asyncio
+from datetime import datetime, timedelta
+from unittest import mock
+
+from sqlalchemy import delete, select, update
+
+from database.base import async_session, init_db
+from database.models import ResultSnapshot
+from database.snapshots import SnapshotStore, decode_listings, encode_listings
+from handlers.utils import results
+from handlers.utils.results import ResultStore
+from site_api.models import Listing
+from site_api.stream import SearchStream
+
+PARAMS = {'city': 'Paris', 'enter_date': '2026-11-01', 'exit_date': '2026-11-03', 'adults': 2}
+
+
+def make_listing(number: int) -> Listing:
+    return Listing(id=str(number), name=f'Квартира {number}', beds=2, address='Paris', price=100 + number,
+                   currency='USD', rating=4.5, deeplink=f'https://airbnb.com/rooms/{number}',
+                   images=(f'https://img/{number}.jpg',))
+
+
+LISTINGS = [make_listing(number) for number in range(5)]
+
+
+def make_store(**kwargs) -> SnapshotStore:
+    settings = {'max_results': 10, 'max_bytes': 10 ** 6, 'ttl': 60, 'max_age': 3600}
+    settings.update(kwargs)
+    return SnapshotStore(**settings)
+
+
+async def prepare() -> None:
+    await init_db()
+    async with async_session() as session:
+        await session.execute(delete(ResultSnapshot))
+        await session.commit()
+
+
+async def age(key: str, seconds: float) -> None:
+    async with async_session() as session:
+        await session.execute(update(ResultSnapshot).where(ResultSnapshot.key == key)
+                              .values(created_at=datetime.now() - timedelta(seconds=seconds)))
+        await session.commit()
+
+
+def test_listings_survive_encoding():
+    assert decode_listings(encode_listings(LISTINGS)) == LISTINGS
+
+
+def test_encode_keeps_the_best_listings_that_fit():
+    store = make_store(max_results=4)
+    assert decode_listings(store.encode(LISTINGS)) == LISTINGS[:4]
+    store = make_store(max_bytes=len(encode_listings(LISTINGS[:2])))
+    assert decode_listings(store.encode(LISTINGS)) == LISTINGS[:2]
+    assert store.stats['truncated'] == 1
+
+
+def test_saved_snapshot_is_fresh():
+    store = make_store()
+
+    async def scenario():
+        await prepare()
+        await store.save('search', LISTINGS)
+        await store.save('search', LISTINGS[:2])
+        return await store.get('search')
+
+    snapshot = asyncio.run(scenario())
+    assert snapshot.listings == LISTINGS[:2]
+    assert not snapshot.stale
+    assert store.stats['hits'] == 1 and store.stats['saved'] == 2
+
+
+def test_snapshot_is_stale_after_the_ttl_and_gone_after_the_maximum_age():
+    store = make_store()
+
+    async def scenario():
+        await prepare()
+        await store.save('search', LISTINGS)
+        await age('search', 120)
+        stale = await store.get('search')
+        await age('search', 7200)
+        return stale, await store.get('search')
+
+    stale, expired = asyncio.run(scenario())
+    assert stale.stale and stale.listings == LISTINGS
+    assert expired is None
+    assert store.stats['stale_hits'] == 1 and store.stats['misses'] == 1
+
+
+def test_expired_snapshots_are_deleted_on_save():
+    store = make_store(ttl=0)
+
+    async def scenario():
+        await prepare()
+        await store.save('old', LISTINGS)
+        await age('old', 7200)
+        await store.save('new', LISTINGS)
+        async with async_session() as session:
+            return (await session.execute(select(ResultSnapshot.key))).scalars().all()
+
+    assert asyncio.run(scenario()) == ['new']
+
+
+def test_scheduled_save_finishes_on_close():
+    store = make_store()
+
+    async def scenario():
+        await prepare()
+        store.schedule_save('search', iter(LISTINGS))
+        await store.close()
+        return await store.get('search')
+
+    assert asyncio.run(scenario()).listings == LISTINGS
+
+
+def test_disabled_store_keeps_nothing():
+    store = make_store(max_results=0)
+
+    async def scenario():
+        await prepare()
+        await store.save('search', LISTINGS)
+        return await store.get('search')
+
+    assert asyncio.run(scenario()) is None
+    assert store.stats['saved'] == 0
+
+
+def test_remembered_results_are_replayed_in_ranked_order():
+    store = make_store()
+    stream = SearchStream(PARAMS, pages=1)
+    stream.results = list(reversed(LISTINGS))
+    stream.exhausted = True
+
+    async def scenario():
+        await prepare()
+        with mock.patch.object(results, 'snapshot_store', store):
+            result_store = ResultStore(ttl=60, max_size=10)
+            result_store.remember(result_store.open(stream, '/lowprice'))
+            await store.close()
+            replay_store = ResultStore(ttl=60, max_size=10)
+            replayed = await replay_store.replay(PARAMS, '/lowprice')
+            return replay_store.get(replayed.key)
+
+    result_set = asyncio.run(scenario())
+    assert result_set.from_snapshot
+    assert result_set.take(0, 10) == LISTINGS
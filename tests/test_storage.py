@@ -0,0 +1,109 @@
+import asyncio
+
+from aiogram.fsm.storage.base import StorageKey
+from sqlalchemy import delete, select
+
+from database.base import async_session, init_db
+from database.models import FsmSession
+from database.storage import SpillStorage, storage_key_to_str
+
+
+def make_key(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+
+def make_storage(max_sessions: int = 10, idle_ttl: float = 60, flush_interval: float = 60) -> SpillStorage:
+    return SpillStorage(max_sessions=max_sessions, idle_ttl=idle_ttl, flush_interval=flush_interval, flush_batch=2)
+
+
+async def prepare() -> None:
+    await init_db()
+    async with async_session() as session:
+        await session.execute(delete(FsmSession))
+        await session.commit()
+
+
+async def saved_keys() -> list[str]:
+    async with async_session() as session:
+        return sorted((await session.execute(select(FsmSession.key))).scalars())
+
+
+def test_sessions_beyond_the_limit_spill_to_the_database():
+    storage = make_storage(max_sessions=2)
+
+    async def scenario():
+        await prepare()
+        for user_id in range(1, 4):
+            await storage.set_data(make_key(user_id), {'user': user_id})
+        spilled = storage.stats
+        await storage.flush()
+        return spilled, await saved_keys()
+
+    spilled, keys = asyncio.run(scenario())
+    assert spilled['sessions'] == 2 and spilled['pending_writes'] == 1 and spilled['evicted'] == 1
+    assert keys == [storage_key_to_str(make_key(1))]
+
+
+def test_spilled_session_comes_back_before_it_is_written():
+    storage = make_storage(max_sessions=1)
+
+    async def scenario():
+        await prepare()
+        await storage.set_state(make_key(1), 'UserStates:city')
+        await storage.set_data(make_key(2), {'user': 2})
+        return await storage.get_state(make_key(1)), storage.stats
+
+    state, stats = asyncio.run(scenario())
+    assert state == 'UserStates:city'
+    assert stats['loaded'] == 0 and stats['pending_writes'] == 1
+
+
+def test_sessions_are_restored_after_a_restart():
+    async def scenario():
+        await prepare()
+        storage = make_storage()
+        await storage.start()
+        await storage.set_state(make_key(1), 'UserStates:city')
+        await storage.set_data(make_key(1), {'city': 'Paris'})
+        await storage.close()
+        restarted = make_storage()
+        state = await restarted.get_state(make_key(1))
+        data = await restarted.get_data(make_key(1))
+        return state, data, restarted.stats
+
+    state, data, stats = asyncio.run(scenario())
+    assert state == 'UserStates:city' and data == {'city': 'Paris'}
+    assert stats['loaded'] == 1 and stats['misses'] == 1 and stats['hits'] == 1
+
+
+def test_idle_sessions_are_evicted_in_background():
+    storage = make_storage(idle_ttl=0.01, flush_interval=0.02)
+
+    async def scenario():
+        await prepare()
+        await storage.start()
+        await storage.set_data(make_key(1), {'city': 'Paris'})
+        await storage.set_data(make_key(2), {})
+        await asyncio.sleep(0.1)
+        stats = storage.stats
+        await storage.close()
+        return stats, await saved_keys()
+
+    stats, keys = asyncio.run(scenario())
+    assert stats['sessions'] == 0 and stats['evicted'] == 2 and stats['pending_writes'] == 0
+    # Empty sessions are not written
+    assert keys == [storage_key_to_str(make_key(1))]
+
+
+def test_cleared_session_is_deleted_from_the_database():
+    async def scenario():
+        await prepare()
+        storage = make_storage()
+        await storage.set_data(make_key(1), {'city': 'Paris'})
+        await storage.close()
+        restarted = make_storage()
+        await restarted.set_data(make_key(1), {})
+        await restarted.close()
+        return await saved_keys()
+
+    assert asyncio.run(scenario()) == []
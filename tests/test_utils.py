@@ -0,0 +1,18 @@
+import asyncio
+from unittest import mock
+
+from handlers.utils.utils import queue_notifier
+
+
+def test_queue_notifier_sends_one_message_per_search():
+    message = mock.Mock()
+    message.answer = mock.AsyncMock()
+
+    async def scenario():
+        notify = queue_notifier(message)
+        await notify(3)
+        await notify(2)
+        await notify(1)
+
+    asyncio.run(scenario())
+    message.answer.assert_awaited_once_with('Запрос в очереди, позиция 3')
@@ -0,0 +1,107 @@
+import asyncio
+from datetime import date, datetime, timedelta
+from unittest import mock
+
+from sqlalchemy import delete, insert
+
+from database.analytics import PopularQuery, popular_queries
+from database.base import async_session, init_db
+from database.models import History
+from site_api import warmer
+from site_api.cache import make_search_key
+from site_api.warmer import CacheWarmer, parse_hours
+
+ENTER = date.today() + timedelta(days=10)
+
+
+def make_row(city: str, days_ago: int = 1, enter: date = ENTER) -> dict:
+    return {'user_tg_id': 19, 'date_search': datetime.now() - timedelta(days=days_ago), 'enter_date': enter,
+            'exit_date': enter + timedelta(days=2), 'city': city, 'adults': 2, 'command': '/lowprice'}
+
+
+def make_query(city: str) -> PopularQuery:
+    params = {'city': city, 'enter_date': ENTER.isoformat(), 'exit_date': (ENTER + timedelta(days=2)).isoformat(),
+              'adults': 2}
+    return PopularQuery(params=params, searches=1, last_search=datetime.now())
+
+
+def make_warmer(daily_budget: int = 10, pages: int = 2) -> CacheWarmer:
+    return CacheWarmer(interval=60, hours=(2, 6), daily_budget=daily_budget, top=5, ttl=3600, window_days=7,
+                       pages=pages)
+
+
+def test_off_peak_hours_may_pass_midnight():
+    night = make_warmer()
+    night.hours = parse_hours('23-5')
+    assert [hour for hour in range(24) if night.off_peak(datetime(2026, 10, 18, hour))] == [0, 1, 2, 3, 4, 23]
+    assert [hour for hour in range(24) if make_warmer().off_peak(datetime(2026, 10, 18, hour))] == [2, 3, 4, 5]
+
+
+def test_popular_searches_are_merged_and_ranked():
+    async def scenario():
+        await init_db()
+        async with async_session() as session:
+            await session.execute(delete(History))
+            await session.execute(insert(History), [
+                make_row('Paris'), make_row(' paris '), make_row('PARIS'), make_row('Rome'), make_row('Rome'),
+                make_row('Oslo'), make_row('Oslo', days_ago=30), make_row('Oslo', days_ago=30),
+                make_row('Berlin', enter=date.today() - timedelta(days=1)),
+            ])
+            await session.commit()
+        return await popular_queries(days=7, limit=2)
+
+    summary = asyncio.run(scenario())
+    assert [(make_search_key(query.params)[0], query.searches) for query in summary] == [('paris', 3), ('rome', 2)]
+    assert summary[0].nights == 2 and summary[0].lead_days == 11
+
+
+def run_warmer(cache_warmer: CacheWarmer, queries: list[PopularQuery], cached: set = frozenset(),
+               responses: dict = None, off_peak: bool = True) -> list[tuple[str, str]]:
+    requests = []
+
+    async def cached_request(params, page, priority, ttl):
+        requests.append((params['city'], page))
+        return (responses or {}).get((params['city'], page), {'error': False, 'results': ['listing']})
+
+    def cache_get(key):
+        return 'cached' if (key[0][0], key[1]) in cached else None
+
+    with mock.patch.object(warmer, 'popular_queries', mock.AsyncMock(return_value=queries)), \
+            mock.patch.object(warmer, 'cached_request', cached_request), \
+            mock.patch.object(warmer.search_cache, 'get', cache_get), \
+            mock.patch.object(cache_warmer, 'off_peak', return_value=off_peak):
+        asyncio.run(cache_warmer.run())
+    return requests
+
+
+def test_missing_pages_of_popular_searches_are_loaded():
+    cache_warmer = make_warmer()
+    requests = run_warmer(cache_warmer, [make_query('Paris'), make_query('Rome')], cached={('paris', '1')})
+    assert requests == [('Paris', '2'), ('Rome', '1'), ('Rome', '2')]
+    assert cache_warmer.stats['skipped'] == 1 and cache_warmer.stats['budget_left'] == 7
+
+
+def test_daily_budget_limits_requests():
+    cache_warmer = make_warmer(daily_budget=3)
+    requests = run_warmer(cache_warmer, [make_query('Paris'), make_query('Rome')])
+    assert requests == [('Paris', '1'), ('Paris', '2'), ('Rome', '1')]
+    assert run_warmer(cache_warmer, [make_query('Oslo')]) == []
+    # The budget is reset on a new day
+    cache_warmer.day = '2000-01-01'
+    assert run_warmer(cache_warmer, [make_query('Oslo')]) == [('Oslo', '1'), ('Oslo', '2')]
+
+
+def test_nothing_is_loaded_at_peak_hours():
+    cache_warmer = make_warmer()
+    assert run_warmer(cache_warmer, [make_query('Paris')], off_peak=False) == []
+    assert cache_warmer.stats['runs'] == 0
+
+
+def test_last_page_and_errors_stop_the_search():
+    cache_warmer = make_warmer(pages=3)
+    responses = {('Paris', '2'): {'error': False, 'results': []},
+                 ('Rome', '1'): {'error': True, 'message': 'Сервис перегружен, попробуйте позже'}}
+    requests = run_warmer(cache_warmer, [make_query('Paris'), make_query('Rome'), make_query('Oslo')],
+                          responses=responses)
+    assert requests == [('Paris', '1'), ('Paris', '2'), ('Rome', '1')]
+    assert cache_warmer.stats['failed'] == 1
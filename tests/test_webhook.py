@@ -0,0 +1,129 @@
+import asyncio
+import os
+import signal
+from unittest import mock
+
+import aiohttp
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+
+from config_data.config import WEBHOOK_PATH, WEBHOOK_HEALTH_PATH
+from server import webhook
+from server.lifecycle import Lifecycle
+from server.webhook import BoundedRequestHandler, update_chat_id
+
+
+def make_update(update_id: int, chat_id: int, text: str) -> dict:
+    return {'update_id': update_id, 'message': {'message_id': update_id, 'date': 0, 'text': text,
+                                                'chat': {'id': chat_id, 'type': 'private'},
+                                                'from': {'id': chat_id, 'is_bot': False, 'first_name': 'a'}}}
+
+
+def test_update_chat_id():
+    assert update_chat_id(make_update(1, 42, 'hi')) == 42
+    assert update_chat_id({'update_id': 1, 'callback_query': {'id': '1', 'from': {'id': 7}}}) == 7
+    assert update_chat_id({'update_id': 1}) == 0
+
+
+def test_updates_of_one_chat_are_handled_in_order():
+    handled = []
+    delays = {'first': 0.05, 'second': 0.0, 'third': 0.01, 'other': 0.0}
+
+    async def scenario():
+        dp = Dispatcher()
+        router = Router()
+
+        @router.message()
+        async def record(message: Message) -> None:
+            handled.append(('start', message.chat.id, message.text))
+            await asyncio.sleep(delays[message.text])
+            handled.append(('end', message.chat.id, message.text))
+
+        dp.include_router(router)
+        bot = Bot('123456:TEST')
+        handler = BoundedRequestHandler(dispatcher=dp, bot=bot, secret_token=None, max_concurrency=10,
+                                        max_pending=10)
+        await asyncio.gather(
+            handler._background_feed_update(bot, make_update(1, 1, 'first')),
+            handler._background_feed_update(bot, make_update(2, 1, 'second')),
+            handler._background_feed_update(bot, make_update(3, 2, 'other')),
+            handler._background_feed_update(bot, make_update(4, 1, 'third')),
+        )
+        await bot.session.close()
+        assert handler.stats['chats'] == 0
+
+    asyncio.run(scenario())
+    chat_events = [event for event in handled if event[1] == 1]
+    assert chat_events == [('start', 1, 'first'), ('end', 1, 'first'), ('start', 1, 'second'),
+                           ('end', 1, 'second'), ('start', 1, 'third'), ('end', 1, 'third')]
+    assert handled.index(('end', 2, 'other')) < handled.index(('end', 1, 'first'))
+
+
+def test_pending_counts_only_waiting_updates():
+    async def scenario():
+        dp = Dispatcher()
+        router = Router()
+        release = asyncio.Event()
+
+        @router.message()
+        async def wait(message: Message) -> None:
+            await release.wait()
+
+        dp.include_router(router)
+        bot = Bot('123456:TEST')
+        handler = BoundedRequestHandler(dispatcher=dp, bot=bot, secret_token=None, max_concurrency=1,
+                                        max_pending=10)
+        for update in (make_update(1, 1, 'first'), make_update(2, 2, 'second'), make_update(3, 3, 'third')):
+            task = asyncio.create_task(handler._background_feed_update(bot, update))
+            handler._background_feed_update_tasks.add(task)
+            task.add_done_callback(handler._background_feed_update_tasks.discard)
+        await asyncio.sleep(0.01)
+        stats = handler.stats
+        release.set()
+        await asyncio.gather(*handler._background_feed_update_tasks)
+        await bot.session.close()
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert stats['in_flight'] == 1
+    assert stats['pending'] == 2
+    assert stats['accepted'] == 3
+
+
+def test_health_answers_503_while_updates_drain(tmp_path):
+    socket_path = str(tmp_path / 'worker.sock')
+    observed = {}
+
+    async def scenario():
+        dp = Dispatcher()
+        router = Router()
+        started = asyncio.Event()
+
+        @router.message()
+        async def slow(message: Message) -> None:
+            started.set()
+            await asyncio.sleep(0.5)
+
+        dp.include_router(router)
+        bot = Bot('123456:TEST')
+        server = asyncio.create_task(webhook.run_webhook(dp, bot, unix_path=socket_path))
+        connector = aiohttp.UnixConnector(path=socket_path)
+        async with aiohttp.ClientSession(connector=connector, base_url='http://worker') as session:
+            for _ in range(50):
+                if os.path.exists(socket_path):
+                    break
+                await asyncio.sleep(0.02)
+            async with session.post(WEBHOOK_PATH, json=make_update(1, 1, 'hi')) as response:
+                observed['update'] = response.status
+            await started.wait()
+            os.kill(os.getpid(), signal.SIGTERM)
+            await asyncio.sleep(0.05)
+            async with session.get(WEBHOOK_HEALTH_PATH) as response:
+                observed['health'] = response.status, (await response.json())['status']
+            async with session.post(WEBHOOK_PATH, json=make_update(2, 2, 'late')) as response:
+                observed['late_update'] = response.status
+        await server
+
+    with mock.patch.object(webhook, 'lifecycle', Lifecycle(drain_timeout=5, warm_timeout=1)):
+        asyncio.run(scenario())
+    assert observed == {'update': 200, 'health': (503, 'draining'), 'late_update': 503}